@@ -4,19 +4,16 @@ matplotlib.use('Agg')  # Non-interactive backend for server-side rendering
 import matplotlib.pyplot as plt
 import base64
 from io import BytesIO
+from aggregation import register_analysis, run_analysis, value_counts
 
-def compute_afracture(df: pd.DataFrame):
+def summarise_afracture(aggregates: dict, total_patients: int, options=None):
     """
-    Compute counts for fracture types.
-    Focuses on:
-    1. Not a pathological or atypical fracture
-    2. Pathological fracture
-    3. Atypical fracture
+    Build fracture type counts from the afracture label counts.
     """
-    if 'afracture' not in df.columns:
+    if 'afracture' not in aggregates:
         return {}
 
-    counts = df['afracture'].value_counts()
+    counts = aggregates['afracture']
     
     # We allow for slight variation in the "Not a pathological..." string 
     # to ensure compatibility between App.jsx filters and the provided data description
@@ -32,10 +29,24 @@ def compute_afracture(df: pd.DataFrame):
 
     return stats
 
-def generate_afracture_chart(stats: dict):
+def compute_afracture(df: pd.DataFrame):
     """
-    Generate a pie chart for atypical fracture status.
-    Returns a data URI (base64 PNG) or None if insufficient data.
+    Compute counts for fracture types.
+    Focuses on:
+    1. Not a pathological or atypical fracture
+    2. Pathological fracture
+    3. Atypical fracture
+    """
+    return run_analysis('afracture', df)
+
+# Standard: Blue, Pathological: Red, Atypical: Orange (assigned in slice order)
+AFRACTURE_COLORS = ['#4a90e2', '#e24a4a', '#f5a623']
+
+
+def _afracture_slices(stats: dict):
+    """
+    Non-zero fracture type slices with their display labels.
+    Returns (display_labels, sizes) or None if there is nothing to plot.
     """
     # Filter out zero values
     labels = list(stats.keys())
@@ -56,11 +67,44 @@ def generate_afracture_chart(stats: dict):
         else:
             display_labels.append(l)
 
+    return display_labels, list(sizes)
+
+
+def generate_afracture_chart_spec(stats: dict):
+    """
+    Describe the fracture classification pie chart for client-side rendering.
+    Returns a dict, or None if insufficient data.
+    """
+    slices = _afracture_slices(stats)
+    if slices is None:
+        return None
+    display_labels, sizes = slices
+
+    return {
+        'type': 'pie',
+        'title': 'Fracture Classification',
+        'legend_title': 'Fracture Type',
+        'slices': [
+            {'label': l, 'value': s, 'color': c}
+            for l, s, c in zip(display_labels, sizes, AFRACTURE_COLORS)
+        ]
+    }
+
+
+def generate_afracture_chart(stats: dict):
+    """
+    Generate a pie chart for atypical fracture status.
+    Returns a data URI (base64 PNG) or None if insufficient data.
+    """
+    slices = _afracture_slices(stats)
+    if slices is None:
+        return None
+    display_labels, sizes = slices
+
     fig, ax = plt.subplots(figsize=(8, 6))
     
     # Define colors
-    # Standard: Blue, Pathological: Red, Atypical: Orange
-    colors = ['#4a90e2', '#e24a4a', '#f5a623']
+    colors = AFRACTURE_COLORS
     
     wedges, texts, autotexts = ax.pie(
         sizes, 
@@ -92,4 +136,17 @@ def generate_afracture_chart(stats: dict):
     img64 = base64.b64encode(buf.read()).decode('utf-8')
     plt.close(fig)
 
-    return f"data:image/png;base64,{img64}"
\ No newline at end of file
+    return f"data:image/png;base64,{img64}"
+
+
+register_analysis(
+    'afracture',
+    reducers={'afracture': value_counts('afracture')},
+    finalize=summarise_afracture,
+    chart={
+        'key': 'afracture_chart',
+        'png': generate_afracture_chart,
+        'spec': generate_afracture_chart_spec,
+        'blocked_by': ['afracture']
+    }
+)
@@ -1,51 +1,96 @@
+import numpy as np
 import pandas as pd
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import base64
 from io import BytesIO
+from distribution_summary import summarise_distribution, bxp_stats
+from aggregation import register_analysis, run_analysis, values
 
-def compute_age(df: pd.DataFrame):
+# Fixed histogram bins for the age distribution (years)
+AGE_HIST_RANGE = (0, 120)
+AGE_BIN_WIDTH = 5
+
+def summarise_age(aggregates: dict, total_patients: int, options=None):
     """
-    Extracts the raw age data for the box plot.
-    Calculates summary statistics for display.
+    Summarise the age distribution for the box plot (quartiles, whiskers,
+    outlier sample, histogram) and calculate summary statistics for display.
+    The per-patient values are only included as raw_data if options
+    has include_raw set.
     """
-    stats = {}
+    options = options or {}
+    stats = {'distribution': None}
     
-    if 'age' in df.columns:
-        # Drop NaNs
-        clean_data = df['age'].dropna()
-        stats['raw_data'] = clean_data.tolist()
+    if 'age' in aggregates:
+        # Missing values are already dropped
+        clean_data = aggregates['age']
+        if options.get('include_raw'):
+            stats['raw_data'] = clean_data.tolist()
         
         # Calculate summary stats for text display
-        if not clean_data.empty:
-            stats['mean'] = round(clean_data.mean(), 1)
-            stats['median'] = round(clean_data.median(), 1)
+        if len(clean_data) > 0:
+            stats['distribution'] = summarise_distribution(clean_data, AGE_HIST_RANGE, AGE_BIN_WIDTH)
+            stats['mean'] = round(float(clean_data.mean()), 1)
+            stats['median'] = round(float(np.median(clean_data)), 1)
             stats['min'] = int(clean_data.min())
             stats['max'] = int(clean_data.max())
             stats['count'] = len(clean_data)
-        else:
-            stats['raw_data'] = []
-    else:
-        stats['raw_data'] = []
         
     return stats
 
+def compute_age(df: pd.DataFrame, include_raw=False):
+    """
+    Box plot summary and display statistics for age (see summarise_age).
+    """
+    return run_analysis('age', df, include_raw=include_raw)
+
+def generate_age_chart_spec(stats: dict):
+    """
+    Describe the box plot (quartiles, whiskers, outlier sample) for client-side rendering.
+    """
+    summary = stats.get('distribution')
+    
+    if not summary:
+        return None
+
+    return {
+        'type': 'box',
+        'title': 'Distribution of Patient Age',
+        'y_label': 'Age (Years)',
+        'label': 'Patient Age',
+        'color': '#646cff',
+        'box': {
+            'whislo': summary['whislo'],
+            'q1': summary['q1'],
+            'med': summary['median'],
+            'q3': summary['q3'],
+            'whishi': summary['whishi']
+        },
+        'fliers': summary['outliers'],
+        'annotations': [
+            f"Mean: {stats.get('mean', 0)} years",
+            f"Median: {stats.get('median', 0)} years",
+            f"Min: {stats.get('min', 0)} years",
+            f"Max: {stats.get('max', 0)} years"
+        ],
+    }
+
 def generate_age_chart(stats: dict):
     """
     Generate a Box Plot for Patient Age.
     """
-    data = stats.get('raw_data', [])
+    summary = stats.get('distribution')
     
-    if not data:
+    if not summary:
         return None
 
     # Create figure
     fig, ax = plt.subplots(figsize=(8, 6))
     
-    # Create boxplot
+    # Draw the boxplot from the pre-computed summary
     # vert=True (vertical), patch_artist=True (fill color)
-    bp = ax.boxplot(data, vert=True, patch_artist=True, labels=['Patient Age'])
+    bp = ax.bxp([bxp_stats(summary, 'Patient Age')], vert=True, patch_artist=True)
     
     # Customize colors - using a Blue/Purple tone for demographics
     for patch in bp['boxes']:
@@ -82,4 +127,16 @@ def generate_age_chart(stats: dict):
     img64 = base64.b64encode(buf.read()).decode('utf-8')
     plt.close(fig)
 
-    return f"data:image/png;base64,{img64}"
\ No newline at end of file
+    return f"data:image/png;base64,{img64}"
+
+
+register_analysis(
+    'age',
+    reducers={'age': values('age')},
+    finalize=summarise_age,
+    chart={
+        'key': 'age_chart',
+        'png': generate_age_chart,
+        'spec': generate_age_chart_spec
+    }
+)
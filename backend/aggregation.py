@@ -0,0 +1,360 @@
+from contextlib import nullcontext
+import numpy as np
+import pandas as pd
+
+# Reducers are small hashable specs: (kind, column[, column]).
+# Analyses declare the reducers they need; the engine evaluates each one
+# once per cohort, however many analyses share it.
+
+
+def value_counts(column):
+    """Rows per label {label: count}; missing values are not counted."""
+    return ('value_counts', column)
+
+
+def count(column):
+    """Number of non-missing values."""
+    return ('count', column)
+
+
+def mean(column):
+    """Mean of the non-missing values (NaN if there are none)."""
+    return ('mean', column)
+
+
+def total(column):
+    """Sum of the non-missing values."""
+    return ('total', column)
+
+
+def count_positive(column):
+    """Number of values greater than zero."""
+    return ('count_positive', column)
+
+
+def minimum(column):
+    """Smallest non-missing value, or None."""
+    return ('minimum', column)
+
+
+def maximum(column):
+    """Largest non-missing value, or None."""
+    return ('maximum', column)
+
+
+def nunique(column):
+    """Number of distinct non-missing values."""
+    return ('nunique', column)
+
+
+def values(column):
+    """The non-missing values as a NumPy array."""
+    return ('values', column)
+
+
+def crosstab(row_column, col_column):
+    """
+    Rows per (row label, column label) pair, returned as
+    (row_labels, col_labels, counts) where counts has one extra trailing
+    row and column for missing values.
+    """
+    return ('crosstab', row_column, col_column)
+
+
+# Registered analyses, in registration order
+_analyses = []
+
+
+def register_analysis(name, reducers, finalize, chart=None):
+    """
+    Register an analysis with the engine.
+    - reducers: {alias: reducer spec}; finalize receives {alias: result},
+      with aliases whose columns are absent from the cohort left out
+    - finalize(aggregates, n_rows, options) -> stats dict; options holds the
+      keyword arguments passed to run_analyses (e.g. include_raw)
+    - chart: optional {'key', 'png', 'spec', 'blocked_by'} describing the
+      chart drawn from the stats and the filters that make it redundant
+    Re-registering a name replaces the earlier entry.
+    """
+    analysis = {
+        'name': name,
+        'reducers': dict(reducers),
+        'finalize': finalize,
+        'chart': chart
+    }
+    for i, existing in enumerate(_analyses):
+        if existing['name'] == name:
+            _analyses[i] = analysis
+            return analysis
+    _analyses.append(analysis)
+    return analysis
+
+
+def registered_analyses():
+    return list(_analyses)
+
+
+def get_analysis(name):
+    for analysis in _analyses:
+        if analysis['name'] == name:
+            return analysis
+    raise KeyError(f"Unknown analysis: {name}")
+
+
+def analysis_columns(analyses=None):
+    """
+    Every column referenced by the reducers of the given (default: all) analyses.
+    """
+    columns = []
+    for analysis in analyses if analyses is not None else _analyses:
+        for reducer in analysis['reducers'].values():
+            for column in reducer[1:]:
+                if column not in columns:
+                    columns.append(column)
+    return columns
+
+
+def _column_view(series: pd.Series):
+    """
+    Columnar view of a series shared by every reducer on that column:
+    (codes, labels) for categoricals (code -1 = missing) or (array, None).
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy(), list(series.cat.categories)
+    if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_datetime64_any_dtype(series):
+        return series.to_numpy(), None
+    codes, labels = pd.factorize(series)
+    return codes, list(labels)
+
+
+def _present(array):
+    if array.dtype.kind == 'M':
+        return array[~np.isnat(array)]
+    if array.dtype.kind == 'f':
+        return array[~np.isnan(array)]
+    return array
+
+
+def _reduce(kind, view):
+    data, labels = view
+
+    if labels is not None:
+        # Categorical: everything comes from one bincount of the codes
+        counts = np.bincount(data + 1, minlength=len(labels) + 1)[1:]
+        if kind == 'value_counts':
+            return {label: int(n) for label, n in zip(labels, counts)}
+        if kind == 'count':
+            return int(counts.sum())
+        if kind == 'nunique':
+            return int((counts > 0).sum())
+        # Numeric reducers on a labelled column work on the label values
+        data = np.asarray(labels, dtype=object)[data[data >= 0]]
+        if kind != 'values':
+            data = pd.to_numeric(pd.Series(data), errors='coerce').to_numpy(dtype=float)
+
+    present = _present(data)
+    if kind == 'values':
+        return present
+    if kind == 'count':
+        return int(len(present))
+    if kind == 'mean':
+        return float(present.mean()) if len(present) else float('nan')
+    if kind == 'total':
+        return present.sum().item() if len(present) else 0
+    if kind == 'count_positive':
+        return int((present > 0).sum())
+    if kind == 'minimum':
+        return present.min() if len(present) else None
+    if kind == 'maximum':
+        return present.max() if len(present) else None
+    if kind == 'nunique':
+        return int(len(pd.unique(present)))
+    if kind == 'value_counts':
+        uniques, counts = np.unique(present, return_counts=True)
+        return {value.item(): int(n) for value, n in zip(uniques, counts)}
+    raise ValueError(f"Unknown reducer: {kind}")
+
+
+def _labelled(view):
+    data, labels = view
+    if labels is None:
+        data, labels = pd.factorize(data)
+        labels = list(labels)
+    return data, labels
+
+
+def _crosstab(row_view, col_view):
+    row_codes, row_labels = _labelled(row_view)
+    col_codes, col_labels = _labelled(col_view)
+    n_rows, n_cols = len(row_labels) + 1, len(col_labels) + 1
+    # Missing (code -1) goes to the trailing row/column
+    rows = np.where(row_codes < 0, n_rows - 1, row_codes).astype(np.int64)
+    cols = np.where(col_codes < 0, n_cols - 1, col_codes).astype(np.int64)
+    counts = np.bincount(rows * n_cols + cols, minlength=n_rows * n_cols)
+    return row_labels, col_labels, counts.reshape(n_rows, n_cols)
+
+
+def aggregate(df: pd.DataFrame, reducers):
+    """
+    Evaluate reducer specs over a cohort in one columnar pass: every
+    referenced column is converted to its array/code view once and all the
+    reducers on it share that view. Returns {reducer: result}; reducers on
+    columns missing from df are left out.
+    """
+    reducers = list(dict.fromkeys(reducers))
+    views = {}
+
+    def view(column):
+        if column not in views:
+            views[column] = _column_view(df[column])
+        return views[column]
+
+    results = {}
+    for reducer in reducers:
+        kind, columns = reducer[0], reducer[1:]
+        if any(column not in df.columns for column in columns):
+            continue
+        if kind == 'crosstab':
+            results[reducer] = _crosstab(view(columns[0]), view(columns[1]))
+        else:
+            results[reducer] = _reduce(kind, view(columns[0]))
+    return results
+
+
+def _group_order(groups, n_groups):
+    """
+    Stable order that makes each group's rows contiguous, and the bounds of
+    group g (its rows are order[bounds[g]:bounds[g + 1]]).
+    """
+    order = np.argsort(groups, kind='stable')
+    bounds = np.searchsorted(groups[order], np.arange(n_groups + 1))
+    return order, bounds
+
+
+def _grouped_reduce(kind, view, groups, bounds):
+    data, labels = view
+    n_groups = len(bounds) - 1
+
+    if labels is not None and kind in ('value_counts', 'count', 'nunique'):
+        # One bincount over (group, code) pairs gives every group's label counts
+        n_labels = len(labels) + 1
+        keys = groups.astype(np.int64) * n_labels + (data.astype(np.int64) + 1)
+        counts = np.bincount(keys, minlength=n_groups * n_labels).reshape(n_groups, n_labels)[:, 1:]
+        if kind == 'value_counts':
+            return [{label: int(n) for label, n in zip(labels, row)} for row in counts]
+        if kind == 'count':
+            return [int(n) for n in counts.sum(axis=1)]
+        return [int(n) for n in (counts > 0).sum(axis=1)]
+
+    # Every other reducer runs on each group's contiguous slice of the shared view
+    return [_reduce(kind, (data[bounds[g]:bounds[g + 1]], labels)) for g in range(n_groups)]
+
+
+def _grouped_crosstab(row_view, col_view, groups, bounds):
+    row_codes, row_labels = _labelled(row_view)
+    col_codes, col_labels = _labelled(col_view)
+    n_groups = len(bounds) - 1
+    n_rows, n_cols = len(row_labels) + 1, len(col_labels) + 1
+    rows = np.where(row_codes < 0, n_rows - 1, row_codes).astype(np.int64)
+    cols = np.where(col_codes < 0, n_cols - 1, col_codes).astype(np.int64)
+    keys = (groups.astype(np.int64) * n_rows + rows) * n_cols + cols
+    counts = np.bincount(keys, minlength=n_groups * n_rows * n_cols).reshape(n_groups, n_rows, n_cols)
+    return [(row_labels, col_labels, counts[g]) for g in range(n_groups)]
+
+
+def aggregate_groups(df: pd.DataFrame, reducers, row_ids, groups, n_groups):
+    """
+    Evaluate reducer specs for several cohorts of the same registry in one
+    pass. row_ids are registry row positions and groups the cohort (0 ..
+    n_groups - 1) each belongs to; a row in several cohorts appears once
+    per cohort. Each column is gathered and converted to its view once for
+    all the cohorts: label counts and crosstabs are a single bincount keyed
+    by (cohort, label), other reducers work on each cohort's slice of the
+    view. Returns one {reducer: result} per cohort, as aggregate would for
+    that cohort's rows.
+    """
+    reducers = list(dict.fromkeys(reducers))
+    groups = np.asarray(groups)
+    order, bounds = _group_order(groups, n_groups)
+    row_ids = np.asarray(row_ids)[order]
+    groups = groups[order]
+    views = {}
+
+    def view(column):
+        if column not in views:
+            views[column] = _column_view(df[column].take(row_ids))
+        return views[column]
+
+    results = [{} for _ in range(n_groups)]
+    for reducer in reducers:
+        kind, columns = reducer[0], reducer[1:]
+        if any(column not in df.columns for column in columns):
+            continue
+        if kind == 'crosstab':
+            per_group = _grouped_crosstab(view(columns[0]), view(columns[1]), groups, bounds)
+        else:
+            per_group = _grouped_reduce(kind, view(columns[0]), groups, bounds)
+        for group_results, result in zip(results, per_group):
+            group_results[reducer] = result
+    return results
+
+
+def _finalize(analyses, results, n_rows, options, stage):
+    stats = {}
+    for analysis in analyses:
+        aggregates = {
+            alias: results[reducer]
+            for alias, reducer in analysis['reducers'].items()
+            if reducer in results
+        }
+        with stage(f"finalize.{analysis['name']}"):
+            stats[analysis['name']] = analysis['finalize'](aggregates, n_rows, options)
+    return stats
+
+
+def run_analyses(df: pd.DataFrame, analyses=None, timings=None, **options):
+    """
+    Run the given (default: all registered) analyses over a cohort.
+    The reducers of all analyses are evaluated together, then each
+    analysis's finalize builds its stats. Returns {name: stats}.
+    timings (an instrumentation.AnalysisTimings) records the aggregation
+    pass and each finalize as stages.
+    """
+    def stage(name):
+        return timings.stage(name) if timings is not None else nullcontext()
+
+    analyses = analyses if analyses is not None else registered_analyses()
+    with stage('aggregate'):
+        results = aggregate(df, [r for a in analyses for r in a['reducers'].values()])
+
+    return _finalize(analyses, results, len(df), options, stage)
+
+
+def run_grouped_analyses(df: pd.DataFrame, row_ids, groups, n_groups, analyses=None, timings=None, **options):
+    """
+    Run the given (default: all registered) analyses for several cohorts of
+    one registry at once (see aggregate_groups for row_ids and groups).
+    Returns one {name: stats} per cohort, the same as run_analyses over
+    that cohort's rows. timings records the shared aggregation pass and the
+    finalize stages.
+    """
+    def stage(name):
+        return timings.stage(name) if timings is not None else nullcontext()
+
+    analyses = analyses if analyses is not None else registered_analyses()
+    with stage('aggregate'):
+        grouped = aggregate_groups(df, [r for a in analyses for r in a['reducers'].values()], row_ids, groups, n_groups)
+
+    n_rows = np.bincount(np.asarray(groups, dtype=np.int64), minlength=n_groups)
+    return [
+        _finalize(analyses, results, int(n_rows[g]), options, stage)
+        for g, results in enumerate(grouped)
+    ]
+
+
+def run_analysis(name, df: pd.DataFrame, **options):
+    """
+    Run a single registered analysis (e.g. from the compute_* helpers).
+    """
+    analysis = get_analysis(name)
+    return run_analyses(df, [analysis], **options)[name]
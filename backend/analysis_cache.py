@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# On-disk tier: one JSON file per cached analysis
+CACHE_DIR = "data/analysis_cache"
+# In-memory tier: most recently used analyses kept in process
+MEMORY_CACHE_SIZE = 32
+
+_memory = OrderedDict()
+_lock = threading.Lock()
+
+
+def json_default(value):
+    # numpy scalars/arrays that slipped into the results
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def filters_hash(filters):
+    """
+    Stable hash of a cohort's filters (key order does not matter).
+    """
+    payload = json.dumps(filters or {}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def cache_key(cohort_id, filters, data_version, variant=''):
+    """
+    Key of a cached analysis: cohort ID, filters hash and dataset fingerprint.
+    variant distinguishes different response modes of the same analysis.
+    """
+    parts = [cohort_id, filters_hash(filters), data_version or 'none']
+    if variant:
+        parts.append(variant)
+    return '__'.join(parts)
+
+
+def _disk_path(key):
+    return os.path.join(CACHE_DIR, f"{key}.json")
+
+
+def _remember(key, results):
+    # Caller holds the lock
+    _memory[key] = results
+    _memory.move_to_end(key)
+    while len(_memory) > MEMORY_CACHE_SIZE:
+        _memory.popitem(last=False)
+
+
+def get_cached(key):
+    """
+    Look up an analysis in memory, then on disk (promoting disk hits to memory).
+    Returns None on a miss.
+    """
+    with _lock:
+        if key in _memory:
+            _memory.move_to_end(key)
+            return _memory[key]
+
+    path = _disk_path(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            results = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Warning: ignoring unreadable analysis cache entry {path}: {str(e)}")
+        return None
+
+    with _lock:
+        _remember(key, results)
+    return results
+
+
+def put_cached(key, results):
+    """
+    Store an analysis in both tiers. The disk write is atomic (temp file + rename).
+    """
+    with _lock:
+        _remember(key, results)
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = _disk_path(key)
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(results, f, default=json_default)
+        os.replace(tmp_path, path)
+    except (OSError, TypeError) as e:
+        print(f"Warning: could not write analysis cache entry {path}: {str(e)}")
+
+
+def _evict(predicate):
+    """
+    Drop every entry (both tiers) whose key matches predicate. Returns the count removed.
+    """
+    removed = 0
+    with _lock:
+        for key in [k for k in _memory if predicate(k)]:
+            del _memory[key]
+            removed += 1
+
+    if os.path.isdir(CACHE_DIR):
+        for name in os.listdir(CACHE_DIR):
+            if name.endswith('.json') and predicate(name[:-len('.json')]):
+                os.remove(os.path.join(CACHE_DIR, name))
+                removed += 1
+    return removed
+
+
+def invalidate_cohort(cohort_id):
+    """
+    Forget every cached analysis of a cohort (e.g. when it is deleted).
+    """
+    return _evict(lambda key: key.split('__')[0] == cohort_id)
+
+
+def prune_other_versions(data_version):
+    """
+    Forget cached analyses computed against any other version of the dataset.
+    """
+    return _evict(lambda key: key.split('__')[2:3] != [data_version or 'none'])
@@ -0,0 +1,195 @@
+import json
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from analysis_cache import json_default
+
+# Number of analyses run at once; further jobs wait in the queue
+ANALYSIS_WORKERS = int(os.environ.get('ANALYSIS_WORKERS', 2))
+# Job state is mirrored here so any server process can answer a poll
+JOBS_DIR = "data/analysis_jobs"
+# Finished jobs are forgotten after this long (results stay in the analysis cache)
+JOB_TTL_SECONDS = 15 * 60
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+_jobs = {}
+_lock = threading.Lock()
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS, thread_name_prefix='analysis-job')
+        return _executor
+
+
+def _job_path(job_id):
+    return os.path.join(JOBS_DIR, f"{job_id}.json")
+
+
+def _write_job(job):
+    """
+    Mirror a job snapshot to disk (temp file + rename).
+    """
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    path = _job_path(job['job_id'])
+    tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(job, f, default=json_default)
+        os.replace(tmp_path, path)
+    except (OSError, TypeError) as e:
+        print(f"Warning: could not write analysis job {path}: {str(e)}")
+
+
+def _read_job(job_id):
+    path = _job_path(job_id)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        # Being replaced or removed by another process
+        return None
+
+
+def _update(job_id, **changes):
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        job.update(changes, updated_at=time.time())
+        snapshot = dict(job)
+    _write_job(snapshot)
+    return snapshot
+
+
+def _owner_alive(job):
+    """
+    Whether the process running a job read from disk still exists (a job
+    left 'running' by a crashed worker must not absorb new requests).
+    """
+    try:
+        os.kill(job['pid'], 0)
+    except ProcessLookupError:
+        return False
+    except (OSError, KeyError, TypeError):
+        pass
+    return True
+
+
+def _is_stale(job):
+    return job['status'] not in ACTIVE_STATUSES and time.time() - job['updated_at'] > JOB_TTL_SECONDS
+
+
+def _prune():
+    with _lock:
+        for job_id in [k for k, job in _jobs.items() if _is_stale(job)]:
+            del _jobs[job_id]
+    if os.path.isdir(JOBS_DIR):
+        for name in os.listdir(JOBS_DIR):
+            path = os.path.join(JOBS_DIR, name)
+            try:
+                if time.time() - os.path.getmtime(path) > JOB_TTL_SECONDS:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+def _run(job_id, func):
+    _update(job_id, status='running', stage='statistics')
+
+    def progress(partial, stage):
+        _update(job_id, results=partial, stage=stage)
+
+    try:
+        results = func(progress)
+        _update(job_id, status='done', stage='done', results=results)
+    except Exception as e:
+        print(f"Error in analysis job {job_id}: {str(e)}")
+        traceback.print_exc()
+        _update(job_id, status='failed', error=str(e))
+
+
+def submit_job(job_id, func):
+    """
+    Queue func(progress) on the analysis worker pool under job_id and return
+    the job snapshot. func calls progress(partial_results, stage) whenever
+    there is more to show and returns the final results.
+    A job that is already queued or running under the same ID (in this or
+    another server process) is returned instead, so identical requests
+    coalesce onto one computation.
+    """
+    _prune()
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is not None and job['status'] in ACTIVE_STATUSES:
+            return dict(job)
+
+    job = _read_job(job_id)
+    if (job is not None and job['status'] in ACTIVE_STATUSES
+            and job.get('pid') != os.getpid() and _owner_alive(job)):
+        return job
+
+    now = time.time()
+    job = {
+        'job_id': job_id,
+        'status': 'queued',
+        'stage': 'queued',
+        'results': None,
+        'error': None,
+        'pid': os.getpid(),
+        'created_at': now,
+        'updated_at': now
+    }
+    with _lock:
+        existing = _jobs.get(job_id)
+        if existing is not None and existing['status'] in ACTIVE_STATUSES:
+            return dict(existing)
+        _jobs[job_id] = job
+        snapshot = dict(job)
+    _write_job(snapshot)
+
+    _get_executor().submit(_run, job_id, func)
+    return snapshot
+
+
+def get_job(job_id):
+    """
+    Latest snapshot of a job (from this process, else the shared job
+    directory), or None if it is unknown or has expired.
+    """
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is not None:
+            return dict(job)
+    return _read_job(job_id)
+
+
+def forget_jobs(predicate):
+    """
+    Drop every finished job whose ID matches predicate (e.g. the jobs of a
+    deleted cohort). Returns the count removed.
+    """
+    removed = 0
+    with _lock:
+        for job_id in [k for k, job in _jobs.items() if predicate(k) and job['status'] not in ACTIVE_STATUSES]:
+            del _jobs[job_id]
+            removed += 1
+    if os.path.isdir(JOBS_DIR):
+        for name in os.listdir(JOBS_DIR):
+            if name.endswith('.json') and predicate(name[:-len('.json')]):
+                job = _read_job(name[:-len('.json')])
+                if job is None or job['status'] not in ACTIVE_STATUSES:
+                    try:
+                        os.remove(os.path.join(JOBS_DIR, name))
+                        removed += 1
+                    except OSError:
+                        pass
+    return removed
@@ -0,0 +1,354 @@
+"""
+Benchmark suite: cleaning stages, cohort filtering, saving cohorts and every
+analysis, run against a synthetic extract (see synthetic_registry.py) so
+regressions can be measured without the confidential registry.
+
+Each benchmark reports its time per round (min / median / max), throughput
+(rows per second for the rows it processed) and the peak resident memory
+of the process while it ran, plus how far that peak rose above the memory
+in use when the round started.
+
+Run from the backend directory:
+    python3 benchmarks/run_benchmarks.py --rows 100000
+    python3 benchmarks/run_benchmarks.py --rows 1000000 --only cleaning --json results.json
+Everything is written to a temporary work directory (removed afterwards
+unless --workdir is given), never to data/.
+"""
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.abspath(BACKEND_DIR))
+sys.path.insert(0, os.path.abspath(os.path.join(BACKEND_DIR, 'data')))
+import cleaning
+from synthetic_registry import generate_raw_extract
+
+BENCHMARK_ROUNDS = 3
+# How often the memory sampler reads the resident set size
+RSS_SAMPLE_SECONDS = 0.005
+
+# Cohort builder filters exercised by the filtering benchmarks
+FILTER_SETS = {
+    'all': {},
+    'female': {'sex': [cleaning.sex_map[2]]},
+    'age_70_90': {'minAge': 70, 'maxAge': 90},
+    'combined': {
+        'sex': [cleaning.sex_map[2]],
+        'uresidence': [cleaning.uresidence_map[1]],
+        'asa': [cleaning.asa_map[3], cleaning.asa_map[4]],
+        'minAge': 65,
+        'maxAge': 95
+    }
+}
+
+# Modules whose compute_* / generate_*_chart / generate_*_chart_spec
+# functions are benchmarked, in cohort_analysis import order
+ANALYSIS_MODULES = [
+    'mortality_analysis', 'fwalk2_analysis', 'afracture_analysis', 'residence_analysis',
+    'residence_transition_analysis', 'timelines_analysis', 'time_to_surgery_analysis',
+    'age_analysis', 'cohort_analysis'
+]
+
+
+def current_rss_mb():
+    """
+    Resident set size of this process in MB (peak so far where /proc is missing).
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+class _RssSampler(threading.Thread):
+    """
+    Samples the resident set size in the background, keeping the peak.
+    """
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.peak = current_rss_mb()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(RSS_SAMPLE_SECONDS):
+            self.peak = max(self.peak, current_rss_mb())
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        self.peak = max(self.peak, current_rss_mb())
+        return self.peak
+
+
+def measure(func, rounds=BENCHMARK_ROUNDS, setup=None):
+    """
+    Call func(*setup()) rounds times; setup (untimed) gives each round fresh
+    arguments, e.g. a copy of a frame the function modifies in place.
+    Returns (last result, stats) with the round times in seconds, the peak
+    RSS over all rounds and its largest rise above a round's starting RSS.
+    Output printed by func is swallowed.
+    """
+    times, peak, rise, result = [], 0.0, 0.0, None
+    for _ in range(rounds):
+        args = setup() if setup else ()
+        result = None
+        gc.collect()
+        sampler = _RssSampler()
+        start_rss = sampler.peak
+        sampler.start()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = func(*args)
+        times.append(time.perf_counter() - start)
+        round_peak = sampler.stop()
+        peak = max(peak, round_peak)
+        rise = max(rise, round_peak - start_rss)
+    return result, {'times': times, 'peak_rss_mb': peak, 'rss_rise_mb': rise}
+
+
+class BenchmarkRun:
+    """
+    Collects and prints benchmark results. `only` limits the run to the
+    benchmarks whose "group/name" starts with one of its prefixes.
+    """
+
+    def __init__(self, rounds=BENCHMARK_ROUNDS, only=None):
+        self.rounds = rounds
+        self.only = only or []
+        self.results = []
+
+    def wanted(self, group, name):
+        return not self.only or any(f"{group}/{name}".startswith(o) for o in self.only)
+
+    def wants_group(self, *groups):
+        return not self.only or any(o.split('/')[0] in groups for o in self.only)
+
+    def bench(self, group, name, func, setup=None, rows=None, rounds=None, required=False):
+        """
+        Measure one benchmark and report it; rows (or rows(result)) is the
+        number of rows it processed. Returns func's result.
+        A benchmark left out by `only` is skipped (returning None) unless
+        later benchmarks need its result (required), in which case it runs
+        once unmeasured.
+        """
+        if not self.wanted(group, name):
+            if not required:
+                return None
+            with contextlib.redirect_stdout(io.StringIO()):
+                return func(*(setup() if setup else ()))
+        result, stats = measure(func, rounds or self.rounds, setup)
+        rows = rows(result) if callable(rows) else rows
+        median = float(np.median(stats['times']))
+        entry = {
+            'group': group,
+            'name': name,
+            'rounds': len(stats['times']),
+            'min_s': min(stats['times']),
+            'median_s': median,
+            'max_s': max(stats['times']),
+            'rows': rows,
+            'rows_per_s': rows / median if rows and median > 0 else None,
+            'peak_rss_mb': stats['peak_rss_mb'],
+            'rss_rise_mb': stats['rss_rise_mb']
+        }
+        self.results.append(entry)
+        self._print(entry)
+        return result
+
+    @staticmethod
+    def header():
+        print(f"{'benchmark':<52}{'rounds':>7}{'min s':>10}{'median s':>10}{'max s':>10}"
+              f"{'rows/s':>13}{'peak RSS MB':>13}{'rise MB':>10}")
+
+    @staticmethod
+    def _print(entry):
+        rate = f"{entry['rows_per_s']:,.0f}" if entry['rows_per_s'] else '-'
+        print(f"{entry['group'] + '/' + entry['name']:<52}{entry['rounds']:>7}"
+              f"{entry['min_s']:>10.4f}{entry['median_s']:>10.4f}{entry['max_s']:>10.4f}"
+              f"{rate:>13}{entry['peak_rss_mb']:>13.0f}{entry['rss_rise_mb']:>10.0f}", flush=True)
+
+
+def bench_cleaning(run, raw_path, data_dir, impute, strata):
+    """
+    Time each stage of the cleaning pipeline (cleaning.CLEANING_STAGES) on
+    its own, each round starting from a copy of the previous stage's output,
+    then write the cleaned registry the backend loads.
+    """
+    df = run.bench('cleaning', 'read_csv', lambda: cleaning.safe_read_csv(raw_path), rows=len, rounds=1, required=True)
+    n_rows = len(df)
+
+    for name, func, _, _ in cleaning.CLEANING_STAGES:
+        stage = (lambda frame: cleaning.impute_stage(frame, impute, strata)) if name == 'imputation' else func
+        df = run.bench('cleaning', name, stage, setup=lambda: (df.copy(),), rows=n_rows, required=True)
+
+    output_csv = os.path.join(data_dir, cleaning.OUTPUT_CSV)
+
+    def save(frame):
+        frame.to_csv(output_csv, index=False)
+        cleaning.save_columnar(frame, os.path.join(data_dir, cleaning.OUTPUT_FEATHER))
+
+    run.bench('cleaning', 'save', save, setup=lambda: (df,), rows=n_rows, rounds=1, required=True)
+    return n_rows
+
+
+def _post(client, url, body=None):
+    response = client.post(url, json=body)
+    if response.status_code >= 400:
+        raise RuntimeError(f"{url}: {response.status_code} {response.get_data(as_text=True)[:200]}")
+    return response.get_json()
+
+
+def bench_server(run, workdir):
+    """
+    Load the cleaned registry into the Flask app (from workdir/data) and
+    time the cohort endpoints through its test client: filtering, live
+    option counts, saving a cohort, a full analysis and a comparison of
+    two cohorts.
+    """
+    os.chdir(workdir)
+    with contextlib.redirect_stdout(io.StringIO()):
+        import main
+    n_rows = len(main.df)
+    client = main.app.test_client()
+
+    run.bench('server', 'load_data', main.load_data, rows=n_rows)
+
+    def clear_predicates():
+        # Each round evaluates the predicates afresh (not from the bitmap cache)
+        main.bitmap_index.pop('predicate_cache', None)
+        return ()
+
+    for name, filters in FILTER_SETS.items():
+        run.bench('server', f"api_cohort[{name}]", lambda f=filters: _post(client, '/api/cohort', f),
+                  setup=clear_predicates, rows=n_rows)
+        run.bench('server', f"api_cohort_cached[{name}]", lambda f=filters: _post(client, '/api/cohort', f), rows=n_rows)
+    run.bench('server', 'api_cohort_counts[combined]',
+              lambda: _post(client, '/api/cohort/counts', FILTER_SETS['combined']),
+              setup=clear_predicates, rows=n_rows)
+
+    compare_modes = ('spec', 'png')
+    combined = run.bench('server', 'save_cohort[combined]',
+                         lambda: _post(client, '/api/cohorts', {'name': 'benchmark combined', 'filters': FILTER_SETS['combined']}),
+                         rows=n_rows, required=any(run.wanted('server', f"compare[{m}]") for m in compare_modes))
+    # The whole registry as a cohort, analysed below
+    cohort = run.bench('server', 'save_cohort[all]',
+                       lambda: _post(client, '/api/cohorts', {'name': 'benchmark all', 'filters': {}}),
+                       rows=n_rows, required=True)
+
+    def uncached():
+        # Each round computes the analysis rather than serving the cached one
+        main.invalidate_cohort(cohort['id'])
+        return ()
+
+    for mode in ('spec', 'png'):
+        run.bench('server', f"analyse[{mode}]",
+                  lambda m=mode: _post(client, f"/api/cohorts/{cohort['id']}/analyse?charts={m}"),
+                  setup=uncached, rows=n_rows)
+
+    def uncached_comparison():
+        main.invalidate_cohort(main.COMPARISON_KEY)
+        return ()
+
+    if combined is not None:
+        for mode in compare_modes:
+            run.bench('server', f"compare[{mode}]",
+                      lambda m=mode: _post(client, f"/api/cohorts/compare?charts={m}",
+                                           {'cohort_ids': [cohort['id'], combined['id']]}),
+                      setup=uncached_comparison, rows=n_rows)
+    return main, cohort
+
+
+def bench_analyses(run, main, cohort):
+    """
+    Time every compute_* function on a whole-registry cohort, then the
+    chart spec and PNG functions on its statistics.
+    """
+    import importlib
+    with contextlib.redirect_stdout(io.StringIO()):
+        df = main.load_cohort_data(cohort)
+    n_rows = len(df)
+
+    for module_name in ANALYSIS_MODULES:
+        module = importlib.import_module(module_name)
+        for name in sorted(vars(module)):
+            func = getattr(module, name)
+            if not name.startswith('compute_') or getattr(func, '__module__', None) != module_name:
+                continue
+            subject = name[len('compute_'):]
+            charts = [getattr(module, f"generate_{subject}_{suffix}", None) for suffix in ('chart_spec', 'chart')]
+            charts = [chart for chart in charts if chart is not None]
+            needed = any(run.wanted('charts', chart.__name__) for chart in charts)
+            stats = run.bench('analysis', name, lambda f=func: f(df), rows=n_rows, required=needed)
+            for chart in charts:
+                run.bench('charts', chart.__name__, lambda c=chart: c(stats))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the cleaning pipeline and the backend on synthetic data.")
+    parser.add_argument('--rows', type=int, default=100000, help="synthetic rows to generate (10k to 10M)")
+    parser.add_argument('--raw', default=None, help="benchmark this raw extract instead of a synthetic one")
+    parser.add_argument('--rounds', type=int, default=BENCHMARK_ROUNDS)
+    parser.add_argument('--only', action='append', default=None,
+                        help="run only benchmarks whose group/name starts with this (repeatable), e.g. cleaning or server/api_cohort")
+    parser.add_argument('--impute', choices=cleaning.IMPUTE_METHODS, default='blocked',
+                        help="imputation method for the cleaning benchmarks (exact 'knn' is quadratic in rows)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', default=None, help="keep the generated files here instead of a temporary directory")
+    parser.add_argument('--json', default=None, help="also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    json_path = os.path.abspath(args.json) if args.json else None
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix='anzhfr-benchmark-')
+    data_dir = os.path.join(workdir, 'data')
+    os.makedirs(data_dir, exist_ok=True)
+    cwd = os.getcwd()
+    run = BenchmarkRun(args.rounds, args.only)
+
+    try:
+        if args.raw:
+            raw_path = os.path.abspath(args.raw)
+        else:
+            raw_path = os.path.join(data_dir, cleaning.INPUT_CSV)
+            print(f"Generating {args.rows} synthetic rows in {workdir}")
+            generate_raw_extract(raw_path, args.rows, args.seed)
+
+        run.header()
+        # The server benchmarks run on the cleaned output, so cleaning always
+        # runs (unmeasured if left out)
+        bench_cleaning(run, raw_path, data_dir, args.impute, cleaning.IMPUTE_STRATA)
+        if run.wants_group('server', 'analysis', 'charts'):
+            server, cohort = bench_server(run, workdir)
+            bench_analyses(run, server, cohort)
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak_mb = peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+        print(f"Peak RSS of the whole run: {peak_mb:.0f} MB")
+
+        if json_path:
+            with open(json_path, 'w') as f:
+                json.dump({'rows': args.rows if not args.raw else None, 'raw': args.raw,
+                           'impute': args.impute, 'results': run.results}, f, indent=2)
+            print(f"Wrote results to {json_path}")
+    finally:
+        os.chdir(cwd)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
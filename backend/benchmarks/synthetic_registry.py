@@ -0,0 +1,221 @@
+"""
+Synthetic ANZHFR-shaped raw extract, for benchmarks and for anyone without
+access to the (confidential) registry.
+
+Produces the raw layout data/cleaning.py reads: the labelled numeric codes
+of MAPPING_PAIRS, age, ahos_code and a <prefix>_datediff / <prefix>_hms pair
+per datetime prefix. Values are random but shaped like the registry: skewed
+code frequencies, an elderly mostly female cohort, a handful of large
+hospitals, consistent event timelines, cumulative mortality, and a few
+percent of missing, unknown and out-of-range values so every cleaning step
+has work to do. Nothing here is derived from real patient records.
+
+Run from the backend directory:
+    python3 benchmarks/synthetic_registry.py --rows 1000000 --out data/unsw_datathon_2025.csv
+"""
+import argparse
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# Import the cleaning script's code maps when running from the backend directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data'))
+from cleaning import DATETIME_PREFIXES, MAPPING_PAIRS
+
+# pyarrow is optional: its CSV writer is several times faster than pandas
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+    pa_csv = None
+
+# Rows generated and written at a time; memory use is bounded by one chunk
+GENERATOR_CHUNK_ROWS = 250000
+
+# Share of each code, in the code order of its map. Columns not listed get
+# geometrically decaying shares (first code most common, see _code_weights).
+CODE_WEIGHTS = {
+    'sex': [0.32, 0.68, 0.001],
+    'ptype': [0.78, 0.21, 0.01],
+    'uresidence': [0.72, 0.26, 0.02],
+    'asa': [0.02, 0.18, 0.55, 0.22, 0.03],
+    'frailty': [0.02, 0.05, 0.1, 0.15, 0.2, 0.22, 0.15, 0.07, 0.04],
+    'surg': [0.04, 0.93, 0.01, 0.015, 0.005],
+    'ftype': [0.55, 0.35, 0.08, 0.02],
+    'walk': [0.4, 0.25, 0.3, 0.05],
+    'gerimed': [0.15, 0.8, 0.03, 0.02]
+}
+DEFAULT_DECAY = 0.55
+# Share of recorded codes replaced by a code missing from the map
+UNKNOWN_CODE_RATE = 0.002
+# Share of missing values per column (sdatetime: patients without surgery too)
+MISSING_RATE = 0.05
+SURGERY_MISSING_RATE = 0.09
+
+# Cumulative share deceased at 30/90/120/365 days
+MORTALITY_RATES = {'mort30d': 0.07, 'mort90d': 0.13, 'mort120d': 0.15, 'mort365d': 0.25}
+
+N_HOSPITALS = 75
+# Admissions between 2014-01-01 and 2024-12-31, as days since 2010-01-01
+FIRST_DAY = 1461
+LAST_DAY = 5478
+TRANSFER_RATE = 0.15
+
+# Every "HH:MM:SS" string, indexed by second of the day
+HMS_STRINGS = np.array([f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}" for s in range(86400)], dtype=object)
+
+
+def raw_columns():
+    """
+    Column order of the raw extract.
+    """
+    columns = list(dict.fromkeys(col for col, _ in MAPPING_PAIRS))
+    columns += ['age', 'ahos_code']
+    for prefix in DATETIME_PREFIXES:
+        columns += [f"{prefix}_datediff", f"{prefix}_hms"]
+    return columns
+
+
+def _code_weights(col, n_codes):
+    weights = CODE_WEIGHTS.get(col)
+    if weights is None or len(weights) != n_codes:
+        weights = DEFAULT_DECAY ** np.arange(n_codes)
+    weights = np.asarray(weights, dtype=float)
+    return weights / weights.sum()
+
+
+def _with_missing(rng, values, rate=MISSING_RATE):
+    values = values.astype(float)
+    values[rng.random(len(values)) < rate] = np.nan
+    return values
+
+
+def _codes(rng, col, mdict, n):
+    codes = np.array(sorted(mdict))
+    values = rng.choice(codes, size=n, p=_code_weights(col, len(codes))).astype(float)
+    values[rng.random(n) < UNKNOWN_CODE_RATE] = codes.max() + 1
+    return _with_missing(rng, values)
+
+
+def _mortality(rng, n):
+    # One draw per patient keeps the flags cumulative (deceased at 30 days
+    # means deceased at 90, 120 and 365)
+    u = rng.random(n)
+    return {col: _with_missing(rng, np.where(u < rate, 2, 1)) for col, rate in MORTALITY_RATES.items()}
+
+
+def _hours(rng, median, sigma, n):
+    return rng.lognormal(np.log(median), sigma, n)
+
+
+def _timeline(rng, n):
+    """
+    Event times in seconds since 2010-01-01 per datetime prefix, in a
+    plausible order: transfer, arrival, ED departure, surgery, geriatric
+    review, ward discharge, hospital discharge.
+    """
+    arrival = rng.integers(FIRST_DAY, LAST_DAY + 1, n) * 86400.0 + rng.integers(0, 86400, n)
+    hour = 3600.0
+    transfer = arrival - rng.uniform(2, 48, n) * hour
+    transfer[rng.random(n) >= TRANSFER_RATE] = np.nan
+
+    departure = arrival + _hours(rng, 4, 0.5, n) * hour
+    surgery = arrival + _hours(rng, 26, 0.7, n) * hour
+    # A few data entry errors (surgery before arrival) for the bounds checks
+    errors = rng.random(n) < 0.003
+    surgery[errors] = arrival[errors] - _hours(rng, 12, 0.5, int(errors.sum())) * hour
+    ward_discharge = surgery + _hours(rng, 7 * 24, 0.5, n) * hour
+    # Mostly discharged from the acute ward, some with a few more days elsewhere
+    hospital_discharge = ward_discharge + np.where(rng.random(n) < 0.7, 0, _hours(rng, 3 * 24, 0.8, n)) * hour
+
+    return {
+        'tarrdatetime': transfer,
+        'arrdatetime': arrival,
+        'depdatetime': departure,
+        'admdatetimeop': departure,
+        'sdatetime': surgery,
+        'gdate': arrival + _hours(rng, 30, 0.6, n) * hour,
+        'wdisch': ward_discharge,
+        'hdisch': hospital_discharge
+    }
+
+
+def synthetic_frame(n_rows, rng):
+    """
+    One DataFrame of n_rows synthetic raw rows (columns as raw_columns()).
+    """
+    data = {}
+    mortality = _mortality(rng, n_rows)
+    for col, mdict in MAPPING_PAIRS:
+        if col in data:
+            continue
+        data[col] = mortality[col] if col in mortality else _codes(rng, col, mdict, n_rows)
+
+    age = np.clip(np.round(rng.normal(83, 8, n_rows)), 50, 105)
+    # Out-of-range ages (typos) for numeric_and_bounds to null out
+    typos = rng.random(n_rows) < 0.002
+    age[typos] = rng.choice([0, 8, 38, 120, 850], size=int(typos.sum()))
+    data['age'] = _with_missing(rng, age, 0.03)
+
+    # Hospital sizes follow a Zipf-like curve
+    sizes = 1.0 / np.arange(1, N_HOSPITALS + 1) ** 0.8
+    data['ahos_code'] = rng.choice(np.arange(1, N_HOSPITALS + 1), size=n_rows, p=sizes / sizes.sum())
+
+    for prefix, seconds in _timeline(rng, n_rows).items():
+        rate = SURGERY_MISSING_RATE if prefix == 'sdatetime' else MISSING_RATE
+        seconds = _with_missing(rng, seconds, rate)
+        recorded = ~np.isnan(seconds)
+        days = np.floor(seconds / 86400)
+        data[f"{prefix}_datediff"] = days
+        hms = np.full(n_rows, None, dtype=object)
+        seconds_of_day = (seconds[recorded] - days[recorded] * 86400).astype(np.int64)
+        hms[recorded] = HMS_STRINGS[seconds_of_day]
+        # The time is sometimes missing even when the date is recorded
+        hms[rng.random(n_rows) < MISSING_RATE] = None
+        data[f"{prefix}_hms"] = hms
+
+    return pd.DataFrame(data, columns=raw_columns())
+
+
+def _write_chunk(df, path, header):
+    if pa is not None:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        with open(path, 'ab') as f:
+            pa_csv.write_csv(table, f, pa_csv.WriteOptions(include_header=header))
+    else:
+        df.to_csv(path, mode='a', header=header, index=False, float_format='%.0f')
+
+
+def generate_raw_extract(path, n_rows, seed=0, chunk_rows=GENERATOR_CHUNK_ROWS):
+    """
+    Write n_rows synthetic raw rows to the CSV at path, one chunk at a time.
+    The same seed and chunk_rows always give the same file.
+    Returns path.
+    """
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    seeds = np.random.SeedSequence(seed).spawn(max(1, -(-n_rows // chunk_rows)))
+    for i, start in enumerate(range(0, max(n_rows, 1), chunk_rows)):
+        rng = np.random.default_rng(seeds[i])
+        _write_chunk(synthetic_frame(min(chunk_rows, n_rows - start), rng), tmp_path, header=(i == 0))
+    os.replace(tmp_path, path)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic ANZHFR-shaped raw extract.")
+    parser.add_argument('--rows', type=int, default=100000, help="number of rows (10k to 10M)")
+    parser.add_argument('--out', default='data/synthetic_raw.csv', help="CSV file to write")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-rows', type=int, default=GENERATOR_CHUNK_ROWS)
+    args = parser.parse_args(argv)
+
+    generate_raw_extract(args.out, args.rows, args.seed, args.chunk_rows)
+    print(f"Wrote {args.rows} synthetic rows to {args.out} ({os.path.getsize(args.out) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+
+# Number of set bits in every possible byte value, used as a popcount fallback
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def pack_mask(mask):
+    """
+    Pack a boolean row mask into a bitmap (one bit per row, 8 rows per byte).
+    """
+    return np.packbits(np.asarray(mask, dtype=bool))
+
+
+def unpack_bitmap(bitmap, n_rows):
+    """
+    Expand a packed bitmap back into a boolean row mask of length n_rows.
+    """
+    return np.unpackbits(bitmap, count=n_rows).astype(bool)
+
+
+def count_bits(bitmap):
+    """
+    Count the rows selected by a packed bitmap.
+    """
+    if hasattr(np, 'bitwise_count'):
+        return int(np.bitwise_count(bitmap).sum())
+    return int(_POPCOUNT_TABLE[bitmap].sum())
+
+
+def build_bitmap_index(df: pd.DataFrame, columns, range_columns=()):
+    """
+    Precompute one packed bitmap per (column, category) pair.
+    Columns missing from the dataframe are skipped, matching how the
+    cohort filters ignore fields that are not in the dataset.
+    Returns a dict with the row count, the byte width of every bitmap,
+    the per-column {value: bitmap} lookup, per-value row counts, the
+    per-row category codes with their values (for group-by counts) and
+    sorted copies of the numeric range columns (used for selectivity).
+    Every category of a categorical column is indexed, even if unused.
+    """
+    n_rows = len(df)
+    index = {
+        'n_rows': n_rows,
+        'n_bytes': (n_rows + 7) // 8,
+        'columns': {},
+        'counts': {},
+        'codes': {},
+        'values': {},
+        'sorted': {}
+    }
+
+    for col in columns:
+        if col not in df.columns:
+            continue
+        # Every distinct value gets an integer code (NaN -> -1)
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            codes = df[col].cat.codes.to_numpy()
+            uniques = list(df[col].cat.categories)
+        else:
+            codes, uniques = pd.factorize(df[col])
+            uniques = list(uniques)
+        codes = pd.to_numeric(pd.Series(codes), downcast='integer').to_numpy()
+        index['columns'][col] = {
+            value: pack_mask(codes == code) for code, value in enumerate(uniques)
+        }
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        index['counts'][col] = {value: int(n) for value, n in zip(uniques, counts)}
+        index['codes'][col] = codes
+        index['values'][col] = uniques
+
+    for col in range_columns:
+        if col not in df.columns:
+            continue
+        values = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=float)
+        index['sorted'][col] = np.sort(values[~np.isnan(values)])
+
+    return index
+
+
+def column_bitmap(index, column, values):
+    """
+    OR together the bitmaps of every requested value in a column.
+    Values that never occur in the data contribute no rows.
+    """
+    bitmaps = index['columns'][column]
+    result = np.zeros(index['n_bytes'], dtype=np.uint8)
+    for value in values:
+        bitmap = bitmaps.get(value)
+        if bitmap is not None:
+            np.bitwise_or(result, bitmap, out=result)
+    return result
+
+
+def range_bitmap(values, lower=None, upper=None):
+    """
+    Bitmap of rows whose value lies within the inclusive [lower, upper] bounds.
+    Either bound may be None; missing values never match.
+    """
+    mask = None
+    if lower is not None:
+        mask = values >= lower
+    if upper is not None:
+        upper_mask = values <= upper
+        mask = upper_mask if mask is None else mask & upper_mask
+    if mask is None:
+        mask = ~np.isnan(values)
+    return pack_mask(mask)
+
+
+def range_count(index, column, lower=None, upper=None):
+    """
+    Count rows within [lower, upper] using the pre-sorted column values.
+    Two binary searches, so it is cheap enough to use as a selectivity estimate.
+    """
+    sorted_values = index['sorted'][column]
+    start = 0 if lower is None else np.searchsorted(sorted_values, lower, side='left')
+    end = len(sorted_values) if upper is None else np.searchsorted(sorted_values, upper, side='right')
+    return int(max(end - start, 0))
+
+
+def all_rows_bitmap(index):
+    """
+    Bitmap selecting every row (padding bits past n_rows stay clear).
+    """
+    return pack_mask(np.ones(index['n_rows'], dtype=bool))
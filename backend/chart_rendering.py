@@ -0,0 +1,93 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from instrumentation import measured_call
+
+# Number of chart worker processes; 0 or 1 renders every chart in the request thread
+CHART_WORKERS = int(os.environ.get('CHART_WORKERS', min(8, os.cpu_count() or 1)))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _warm_up_worker():
+    """
+    Runs once in each worker: select the Agg backend and draw a throwaway
+    figure so font loading and caches are paid before the first real chart.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots()
+    ax.plot([0, 1], [0, 1])
+    fig.canvas.draw()
+    plt.close(fig)
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # fork: workers inherit the already-imported analysis modules and
+            # do not re-run main.py (which would reload the registry)
+            _pool = ProcessPoolExecutor(
+                max_workers=CHART_WORKERS,
+                mp_context=multiprocessing.get_context('fork'),
+                initializer=_warm_up_worker
+            )
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def render_charts_serial(chart_jobs, on_chart=None, timings=None):
+    charts = {}
+    for key, (func, stats) in chart_jobs.items():
+        charts[key], measurement = measured_call(func, stats)
+        if timings is not None:
+            timings.record_chart(key, 'png', measurement)
+        if on_chart:
+            on_chart(key, charts[key])
+    return charts
+
+
+def render_charts(chart_jobs, on_chart=None, timings=None):
+    """
+    Render chart jobs ({chart_key: (generate_fn, stats)}) across the worker
+    pool and gather {chart_key: data URI}.
+    Each generate_* function draws its own figure with the Agg backend, so
+    the jobs are independent and the wall time is roughly the slowest chart.
+    on_chart(chart_key, data_uri) is called as each chart finishes.
+    Each chart is measured where it is drawn and recorded in timings (an
+    instrumentation.AnalysisTimings), if given.
+    Falls back to rendering in-process if the pool is disabled or breaks.
+    """
+    if CHART_WORKERS <= 1 or len(chart_jobs) <= 1:
+        return render_charts_serial(chart_jobs, on_chart, timings)
+
+    charts = {}
+    try:
+        pool = _get_pool()
+        futures = {pool.submit(measured_call, func, stats): key for key, (func, stats) in chart_jobs.items()}
+        for future in as_completed(futures):
+            key = futures[future]
+            charts[key], measurement = future.result()
+            if timings is not None:
+                timings.record_chart(key, 'png', measurement)
+            if on_chart:
+                on_chart(key, charts[key])
+        return charts
+    except BrokenProcessPool as e:
+        print(f"Warning: chart worker pool failed ({str(e)}), rendering charts in-process")
+        _reset_pool()
+        remaining = {key: job for key, job in chart_jobs.items() if key not in charts}
+        charts.update(render_charts_serial(remaining, on_chart, timings))
+        return charts
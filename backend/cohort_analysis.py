@@ -1,63 +1,75 @@
 import pandas as pd
-from mortality_analysis import compute_mortality, generate_mortality_chart
-from residence_analysis import compute_residence, generate_residence_chart
-from residence_transition_analysis import compute_residence_transition, generate_residence_transition_chart
-from fwalk2_analysis import compute_fwalk2, generate_fwalk2_chart
-from afracture_analysis import compute_afracture, generate_afracture_chart
-from timelines_analysis import compute_timelines, generate_timelines_chart
-from time_to_surgery_analysis import compute_time_to_surgery, generate_time_to_surgery_chart
+from storage import read_table
+from chart_rendering import render_charts
+from instrumentation import ANALYSES_TOTAL, AnalysisTimings, measured_call
+from aggregation import (
+    analysis_columns, count_positive, nunique, register_analysis, registered_analyses,
+    run_analyses, run_analysis, total, value_counts, values
+)
+# Analysis modules register themselves with the aggregation engine on import;
+# results are returned in import order
+import mortality_analysis
+import fwalk2_analysis
+import afracture_analysis
+import residence_analysis
+import residence_transition_analysis
+import timelines_analysis
+import time_to_surgery_analysis
 # IMPORT NEW MODULE
-from age_analysis import compute_age, generate_age_chart
-
-# EXPANDABLE CONFIGURATION
-CHART_BLOCKING_RULES = {
-    'residence_chart': ['uresidence'],
-    'fwalk2_chart': ['fwalk2'],
-    'afracture_chart': ['afracture'],
-    'timelines_chart': [],
-    'time_to_surgery_chart': [],
-    'age_chart': [],
-}
+import age_analysis
+
+# Chart output modes: rendered PNG data URIs, or JSON chart specs drawn by the frontend
+CHART_MODES = ('png', 'spec')
+
+def chart_blocking_rules():
+    """
+    Chart key -> filter fields that make the chart redundant (a chart of a
+    field the cohort is already filtered on), as registered by each analysis.
+    """
+    return {
+        analysis['chart']['key']: analysis['chart'].get('blocked_by', [])
+        for analysis in registered_analyses() if analysis['chart']
+    }
 
 def should_generate_chart(chart_key, applied_filters):
     if applied_filters is None:
         return True
-    blocking_keys = CHART_BLOCKING_RULES.get(chart_key, [])
+    blocking_keys = chart_blocking_rules().get(chart_key, [])
     for key in blocking_keys:
         if key in applied_filters and applied_filters[key]:
             return False
     return True
 
-def compute_enhanced_metrics(df, mortality_stats):
+# Admission date columns, in order of preference, for the cohort date range
+DATE_COLUMNS = ['arrdatetime_dt', 'admdatetimeop_dt', 'tarrdatetime_dt']
+
+# Core clinical variables with a <field>_was_missing imputation flag
+IMPUTED_CORE_FIELDS = ['age', 'los_hospital_days', 'time_to_surgery_hrs']
+
+def summarise_enhanced_metrics(aggregates, total_patients, options=None):
     """
     Compute enhanced metrics for research adequacy assessment.
     Returns metrics including:
     - Number of hospitals
     - Date range
     """
-    import numpy as np
-    from datetime import datetime
-    
     metrics = {}
     
     # Number of Hospitals
-    if 'ahos_code' in df.columns:
-        unique_hospitals = df['ahos_code'].dropna().nunique()
-        metrics['n_hospitals'] = int(unique_hospitals)
-    else:
-        metrics['n_hospitals'] = 0
+    metrics['n_hospitals'] = int(aggregates.get('n_hospitals', 0))
     
     # Date Range
-    # Try to find admission date column
-    date_col = None
-    for col in ['arrdatetime_dt', 'admdatetimeop_dt', 'tarrdatetime_dt']:
-        if col in df.columns:
-            date_col = col
-            break
+    # Use the first admission date column in the dataset
+    date_col = next((col for col in DATE_COLUMNS if col in aggregates), None)
     
     if date_col:
-        # Convert to datetime if not already
-        dates = pd.to_datetime(df[date_col], errors='coerce').dropna()
+        # Convert to datetime if not already (registry columns are; parsing
+        # every value again would dominate the whole analysis)
+        dates = aggregates[date_col]
+        if dates.dtype.kind == 'M':
+            dates = pd.Series(dates)
+        else:
+            dates = pd.to_datetime(pd.Series(dates), errors='coerce').dropna()
         
         if len(dates) > 0:
             earliest = dates.min()
@@ -84,9 +96,8 @@ def compute_enhanced_metrics(df, mortality_stats):
         metrics['date_range'] = 'Unknown'
     
     # Gender distribution
-    if 'sex' in df.columns:
-        sex_counts = df['sex'].value_counts()
-        total_patients = len(df)
+    if 'sex' in aggregates:
+        sex_counts = aggregates['sex']
         
         # Get counts for each gender
         male_count = sex_counts.get('Male', 0)
@@ -107,30 +118,28 @@ def compute_enhanced_metrics(df, mortality_stats):
         }
     
     # Imputation tracking (row-level and field-level breakdown)
-    if 'n_imputed_fields' in df.columns:
+    if 'patients_with_imputation' in aggregates:
         # Count patients with ANY imputed value
-        patients_with_imputation = (df['n_imputed_fields'] > 0).sum()
-        total_patients = len(df)
+        patients_with_imputation = aggregates['patients_with_imputation']
         
         metrics['patients_with_imputation'] = int(patients_with_imputation)
         metrics['imputation_rate'] = round(patients_with_imputation / total_patients * 100, 1) if total_patients > 0 else 0
         
         # Average number of imputed fields per patient (among those with imputation)
         if patients_with_imputation > 0:
-            avg_imputed_fields = df[df['n_imputed_fields'] > 0]['n_imputed_fields'].mean()
+            avg_imputed_fields = aggregates['total_imputed_fields'] / patients_with_imputation
             metrics['avg_imputed_fields'] = round(avg_imputed_fields, 1)
         else:
             metrics['avg_imputed_fields'] = 0
         
         # Per-field breakdown for core clinical variables
-        # Check if individual imputation flag columns exist
-        core_fields = ['age', 'los_hospital_days', 'time_to_surgery_hrs']
+        # (only fields whose imputation flag column exists)
         imputation_breakdown = {}
         
-        for field in core_fields:
+        for field in IMPUTED_CORE_FIELDS:
             flag_col = f'{field}_was_missing'
-            if flag_col in df.columns:
-                n_imputed = df[flag_col].sum()
+            if flag_col in aggregates:
+                n_imputed = aggregates[flag_col]
                 imputation_breakdown[field] = {
                     'count': int(n_imputed),
                     'percent': round(n_imputed / total_patients * 100, 1) if total_patients > 0 else 0
@@ -146,85 +155,104 @@ def compute_enhanced_metrics(df, mortality_stats):
     
     return metrics
 
-def analyse_cohort(cohort_id, cohort_csv_path, filters=None):
+register_analysis(
+    'enhanced_metrics',
+    reducers={
+        'n_hospitals': nunique('ahos_code'),
+        **{col: values(col) for col in DATE_COLUMNS},
+        'sex': value_counts('sex'),
+        'patients_with_imputation': count_positive('n_imputed_fields'),
+        'total_imputed_fields': total('n_imputed_fields'),
+        **{f'{field}_was_missing': total(f'{field}_was_missing') for field in IMPUTED_CORE_FIELDS}
+    },
+    finalize=summarise_enhanced_metrics
+)
+
+def compute_enhanced_metrics(df, mortality_stats=None):
+    """
+    Enhanced metrics for research adequacy assessment (see summarise_enhanced_metrics).
+    """
+    return run_analysis('enhanced_metrics', df)
+
+# Columns read by the registered analyses; cohort files are loaded with only these columns
+ANALYSIS_COLUMNS = analysis_columns()
+
+def load_cohort_file(cohort_data_path):
+    """
+    Load a cohort saved as a data file (CSV or Feather), reading only ANALYSIS_COLUMNS.
+    """
+    return read_table(cohort_data_path, columns=ANALYSIS_COLUMNS)
+
+def analyse_cohort(cohort_id, df, filters=None, chart_mode='png', include_raw=False, progress=None, timings=None):
+    """
+    Compute every registered analysis for a cohort's rows.
+    The reducers declared by all analyses are evaluated together in one
+    columnar pass over the referenced columns (see aggregation.py).
+    chart_mode 'png' renders each chart to a PNG data URI; 'spec' returns a
+    small JSON description of each chart (series, labels, colours) for the
+    frontend to draw, which skips matplotlib entirely.
+    Distributions (age, time to surgery) are returned as box plot summaries;
+    include_raw adds every patient's value as well.
+    progress(partial_results, stage), if given, is called once the
+    statistics are ready (stage 'charts', PNG charts still None) and again
+    as each PNG chart finishes.
+    Wall time, CPU time and memory of every stage and chart are recorded in
+    timings (an AnalysisTimings, e.g. one the caller also timed loading the
+    cohort with) and returned as results['timings'].
+    """
+    if chart_mode not in CHART_MODES:
+        raise ValueError(f"Unknown chart mode: {chart_mode}")
+    timings = timings if timings is not None else AnalysisTimings()
+    ANALYSES_TOTAL.inc(chart_mode=chart_mode)
+
     try:
-        df = pd.read_csv(cohort_csv_path)
-        
         results = {
             'cohort_id': cohort_id,
-            'total_patients': len(df)
+            'total_patients': len(df),
+            'chart_mode': chart_mode
         }
         
-        # 1. Mortality Analysis
-        mortality_stats = compute_mortality(df)
-        results['mortality'] = mortality_stats
-        if should_generate_chart('mortality_chart', filters):
-            results['mortality_chart'] = generate_mortality_chart(mortality_stats)
-        else:
-            results['mortality_chart'] = None
+        # Charts are collected as jobs and rendered together once all the
+        # statistics are computed (see render_charts)
+        chart_jobs = {}
 
-        # 2. Walking Ability
-        fwalk2_stats = compute_fwalk2(df)
-        results['fwalk2'] = fwalk2_stats
-        if should_generate_chart('fwalk2_chart', filters):
-            results['fwalk2_chart'] = generate_fwalk2_chart(fwalk2_stats)
-        else:
-            results['fwalk2_chart'] = None
-            
-        # 3. Fracture Type
-        afracture_stats = compute_afracture(df)
-        results['afracture'] = afracture_stats
-        if should_generate_chart('afracture_chart', filters):
-            results['afracture_chart'] = generate_afracture_chart(afracture_stats)
-        else:
-            results['afracture_chart'] = None
+        analyses = registered_analyses()
+        all_stats = run_analyses(df, analyses, timings=timings, include_raw=include_raw)
 
-        # 4. Residence
-        residence_stats = compute_residence(df)
-        results['residence'] = residence_stats
-        if should_generate_chart('residence_chart', filters):
-            results['residence_chart'] = generate_residence_chart(residence_stats)
-        else:
-            results['residence_chart'] = None
+        for analysis in analyses:
+            stats = all_stats[analysis['name']]
+            results[analysis['name']] = stats
 
-        # 5. Residence Transition
-        residence_transition_stats = compute_residence_transition(df)
-        results['residence_transition'] = residence_transition_stats
-        if should_generate_chart('residence_transition_chart', filters):
-            results['residence_transition_chart'] = generate_residence_transition_chart(residence_transition_stats)
-        else:
-            results['residence_transition_chart'] = None
-
-        # 6. Length of Stay Analysis
-        timelines_stats = compute_timelines(df)
-        results['timelines'] = timelines_stats
-        if should_generate_chart('timelines_chart', filters):
-            results['timelines_chart'] = generate_timelines_chart(timelines_stats)
-        else:
-            results['timelines_chart'] = None
-
-        # 7. Time to Surgery Analysis
-        surgery_stats = compute_time_to_surgery(df)
-        results['time_to_surgery'] = surgery_stats
-        if should_generate_chart('time_to_surgery_chart', filters):
-            results['time_to_surgery_chart'] = generate_time_to_surgery_chart(surgery_stats)
-        else:
-            results['time_to_surgery_chart'] = None
-
-        # 8. Age Analysis (NEW)
-        age_stats = compute_age(df)
-        results['age'] = age_stats
-        if should_generate_chart('age_chart', filters):
-            results['age_chart'] = generate_age_chart(age_stats)
-        else:
-            results['age_chart'] = None
+            chart = analysis['chart']
+            if not chart:
+                continue
+            results[chart['key']] = None
+            if not should_generate_chart(chart['key'], filters):
+                continue
+            if chart_mode == 'spec':
+                # Specs are cheap to build, no need for the worker pool
+                results[chart['key']], measurement = measured_call(chart['spec'], stats)
+                timings.record_chart(chart['key'], 'spec', measurement)
+            else:
+                chart_jobs[chart['key']] = (chart['png'], stats)
 
+        mortality_stats = results.get('mortality', {})
         if 'total_patients' in mortality_stats:
             results['total_patients'] = mortality_stats['total_patients']
 
-        # Add enhanced metrics for research adequacy assessment
-        results['enhanced_metrics'] = compute_enhanced_metrics(df, mortality_stats)
+        def chart_done(chart_key, chart):
+            results[chart_key] = chart
+            progress(dict(results), 'charts')
+
+        if progress:
+            progress(dict(results), 'charts')
+
+        # Render all queued charts in parallel across the chart worker pool
+        if chart_jobs:
+            with timings.stage('render_charts'):
+                results.update(render_charts(chart_jobs, chart_done if progress else None, timings))
 
+        results['timings'] = timings.report()
         return results
     except Exception as e:
         print(f"Error analysing cohort {cohort_id}: {str(e)}")
@@ -0,0 +1,312 @@
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use('Agg')  # Non-interactive backend for server-side rendering
+import matplotlib.pyplot as plt
+import base64
+from io import BytesIO
+from aggregation import registered_analyses, run_analyses, run_grouped_analyses
+from chart_rendering import render_charts
+from cohort_analysis import CHART_MODES
+from instrumentation import ANALYSES_TOTAL, AnalysisTimings, measured_call
+from fwalk2_analysis import FWALK2_CATEGORIES
+from mortality_analysis import MORTALITY_COLUMNS
+
+# Colour of each cohort in the comparison charts, assigned in request order
+COHORT_COLORS = ['#4a90e2', '#e24a4a', '#50c878', '#f5a623', '#9b59b6', '#1abc9c', '#e67e22', '#34495e']
+
+MORTALITY_LABELS = {'30_day': '30-day', '90_day': '90-day', '120_day': '120-day', '365_day': '365-day'}
+WALKING_LABELS = {
+    'Walks without aids': 'Unaided',
+    'Walks with either a stick or crutch': 'Stick/Crutch',
+    'Walks with two aids or frame': '2 Aids/Frame',
+    'Uses a wheelchair / bed bound': 'Wheelchair/Bed'
+}
+RESIDENCE_LABELS = ['Private residence', 'Residential aged care facility', 'Other']
+FRACTURE_LABELS = ['Not a pathological or atypical fracture', 'Pathological fracture', 'Atypical fracture']
+
+
+def _path(*keys):
+    """
+    Metric reading a nested value of a cohort's stats (None if absent).
+    """
+    def metric(stats):
+        value = stats
+        for key in keys:
+            if not isinstance(value, dict) or value.get(key) is None:
+                return None
+            value = value[key]
+        return value
+    return metric
+
+
+def _percent(count, total):
+    return round(count / total * 100, 1) if total else None
+
+
+def _mortality_rate(key):
+    def metric(stats):
+        data = (stats.get('mortality') or {}).get(key)
+        return round(data['rate'], 1) if data else None
+    return metric
+
+
+def _walks_unaided(stats):
+    fwalk2 = stats.get('fwalk2') or {}
+    if not fwalk2.get('valid_total'):
+        return None
+    return _percent(fwalk2['counts'].get('Walks without aids', 0), fwalk2['valid_total'])
+
+
+def _share_of_patients(analysis, label):
+    def metric(stats):
+        counts = stats.get(analysis)
+        if not counts:
+            return None
+        return _percent(counts.get(label, 0), stats['total_patients'])
+    return metric
+
+
+# Rows of the comparison table: (key, label, unit, metric(cohort stats))
+COMPARISON_METRICS = [
+    ('patients', 'Patients', '', _path('total_patients')),
+    ('n_hospitals', 'Hospitals', '', _path('enhanced_metrics', 'n_hospitals')),
+    ('female_percent', 'Female', '%', _path('enhanced_metrics', 'gender_distribution', 'female_percent')),
+    ('age_mean', 'Mean age', 'years', _path('age', 'mean')),
+    ('age_median', 'Median age', 'years', _path('age', 'median')),
+    *[(f'mortality_{key}', f'{MORTALITY_LABELS[key]} mortality', '%', _mortality_rate(key)) for key in MORTALITY_COLUMNS],
+    ('time_to_surgery_median', 'Median time to surgery', 'hrs', _path('time_to_surgery', 'median')),
+    ('time_to_surgery_mean', 'Mean time to surgery', 'hrs', _path('time_to_surgery', 'mean')),
+    ('avg_hospital_days', 'Average hospital stay', 'days', _path('timelines', 'avg_hospital_days')),
+    ('avg_acute_days', 'Average acute ward stay', 'days', _path('timelines', 'avg_acute_days')),
+    ('walks_unaided', 'Walking unaided at 120 days', '%', _walks_unaided),
+    ('private_residence', 'Admitted from private residence', '%', _share_of_patients('residence', 'Private residence')),
+    ('pathological_fracture', 'Pathological fracture', '%', _share_of_patients('afracture', 'Pathological fracture')),
+    ('new_racf_rate', 'New RACF entries', '%', _path('residence_transition', 'summary', 'new_racf_rate')),
+    ('imputation_rate', 'Patients with imputed data', '%', _path('enhanced_metrics', 'imputation_rate'))
+]
+
+
+def comparison_table(cohort_stats):
+    """
+    One row per COMPARISON_METRICS entry with the value of each cohort
+    (in cohort order; None where a cohort has no value). Metrics no cohort
+    has are left out.
+    """
+    rows = []
+    for key, label, unit, metric in COMPARISON_METRICS:
+        row_values = [metric(stats) for stats in cohort_stats]
+        if all(value is None for value in row_values):
+            continue
+        rows.append({'key': key, 'label': label, 'unit': unit, 'values': row_values})
+    return rows
+
+
+# ---------- comparison chart specs ----------
+
+def _grouped_bar_spec(title, y_label, categories, cohorts, series_values, value_suffix=''):
+    """
+    Grouped bar chart: one group of bars per category, one bar per cohort.
+    Returns None if no cohort has a value.
+    """
+    if not categories or not any(any(v for v in values) for values in series_values):
+        return None
+    return {
+        'type': 'grouped_bar',
+        'title': title,
+        'y_label': y_label,
+        'value_suffix': value_suffix,
+        'categories': categories,
+        'series': [
+            {'name': cohort['name'], 'values': values, 'color': cohort['color']}
+            for cohort, values in zip(cohorts, series_values)
+        ]
+    }
+
+
+def _mortality_comparison_spec(cohorts, cohort_stats):
+    keys = [key for key in MORTALITY_COLUMNS if any((stats.get('mortality') or {}).get(key) for stats in cohort_stats)]
+    series_values = [[_mortality_rate(key)(stats) or 0 for key in keys] for stats in cohort_stats]
+    return _grouped_bar_spec(
+        'Mortality Rate Across Time Frames', 'Mortality (%)',
+        [MORTALITY_LABELS[key] for key in keys], cohorts, series_values, '%')
+
+
+def _timelines_comparison_spec(cohorts, cohort_stats):
+    series_values = [
+        [(stats.get('timelines') or {}).get('avg_hospital_days', 0), (stats.get('timelines') or {}).get('avg_acute_days', 0)]
+        for stats in cohort_stats
+    ]
+    return _grouped_bar_spec(
+        'Average Length of Stay', 'Average Duration (Days)',
+        ['Total Hospital Stay', 'Acute Ward Stay'], cohorts, series_values, ' days')
+
+
+def _walking_comparison_spec(cohorts, cohort_stats):
+    labels = list(dict.fromkeys(FWALK2_CATEGORIES.values()))
+    series_values = []
+    for stats in cohort_stats:
+        fwalk2 = stats.get('fwalk2') or {}
+        counts, valid_total = fwalk2.get('counts', {}), fwalk2.get('valid_total', 0)
+        series_values.append([_percent(counts.get(label, 0), valid_total) or 0 for label in labels])
+    return _grouped_bar_spec(
+        'Walking Ability After 120 Days', 'Patients with a Recorded Status (%)',
+        [WALKING_LABELS.get(label, label) for label in labels], cohorts, series_values, '%')
+
+
+def _share_comparison_spec(analysis, labels, title):
+    def spec(cohorts, cohort_stats):
+        series_values = [
+            [_share_of_patients(analysis, label)(stats) or 0 for label in labels]
+            for stats in cohort_stats
+        ]
+        return _grouped_bar_spec(title, 'Patients (%)', labels, cohorts, series_values, '%')
+    return spec
+
+
+def _distribution_comparison_spec(analysis, title, y_label):
+    def spec(cohorts, cohort_stats):
+        boxes = []
+        for cohort, stats in zip(cohorts, cohort_stats):
+            summary = (stats.get(analysis) or {}).get('distribution')
+            if not summary:
+                continue
+            boxes.append({
+                'label': cohort['name'],
+                'color': cohort['color'],
+                'box': {
+                    'whislo': summary['whislo'],
+                    'q1': summary['q1'],
+                    'med': summary['median'],
+                    'q3': summary['q3'],
+                    'whishi': summary['whishi']
+                },
+                'fliers': summary['outliers'],
+                'mean': stats[analysis].get('mean')
+            })
+        if not boxes:
+            return None
+        return {'type': 'grouped_box', 'title': title, 'y_label': y_label, 'boxes': boxes}
+    return spec
+
+
+# Comparison charts: (key, spec builder(cohorts, cohort stats))
+COMPARISON_CHARTS = [
+    ('mortality_comparison_chart', _mortality_comparison_spec),
+    ('fwalk2_comparison_chart', _walking_comparison_spec),
+    ('afracture_comparison_chart', _share_comparison_spec('afracture', FRACTURE_LABELS, 'Fracture Classification')),
+    ('residence_comparison_chart', _share_comparison_spec('residence', RESIDENCE_LABELS, 'Pre-Admission Residence Status')),
+    ('timelines_comparison_chart', _timelines_comparison_spec),
+    ('time_to_surgery_comparison_chart', _distribution_comparison_spec('time_to_surgery', 'Time to Surgery Distribution', 'Hours')),
+    ('age_comparison_chart', _distribution_comparison_spec('age', 'Patient Age Distribution', 'Age (Years)'))
+]
+
+
+def generate_comparison_chart(spec: dict):
+    """
+    Draw a comparison chart spec (grouped_bar or grouped_box) with matplotlib.
+    Returns a data URI (base64 PNG).
+    """
+    fig, ax = plt.subplots(figsize=(10, 6))
+
+    if spec['type'] == 'grouped_bar':
+        categories = spec['categories']
+        n_series = len(spec['series'])
+        width = 0.8 / n_series
+        x = np.arange(len(categories))
+        for i, series in enumerate(spec['series']):
+            positions = x - 0.4 + width * (i + 0.5)
+            bars = ax.bar(positions, series['values'], width, label=series['name'], color=series['color'])
+            ax.bar_label(bars, fmt='%g', fontsize=8, padding=2)
+        ax.set_xticks(x)
+        ax.set_xticklabels(categories)
+        ax.legend()
+    else:
+        boxes = spec['boxes']
+        bxp = [
+            {**box['box'], 'label': box['label'], 'fliers': box['fliers'], 'mean': box.get('mean')}
+            for box in boxes
+        ]
+        artists = ax.bxp(bxp, showmeans=True, showfliers=True, patch_artist=True)
+        for patch, box in zip(artists['boxes'], boxes):
+            patch.set_facecolor(box['color'])
+            patch.set_alpha(0.8)
+
+    ax.set_ylabel(spec['y_label'], fontsize=11, fontweight='bold')
+    ax.set_title(spec['title'], fontsize=13, fontweight='bold', pad=20)
+    ax.grid(axis='y', alpha=0.3, linestyle='--')
+
+    plt.tight_layout()
+    buf = BytesIO()
+    plt.savefig(buf, format='png', dpi=100, bbox_inches='tight')
+    buf.seek(0)
+    img64 = base64.b64encode(buf.read()).decode('utf-8')
+    plt.close(fig)
+
+    return f"data:image/png;base64,{img64}"
+
+
+def compare_cohorts(df: pd.DataFrame, cohorts, row_sets, chart_mode='spec', timings=None):
+    """
+    Analyse several saved cohorts side by side.
+    cohorts are the cohorts' metadata (id, name) and row_sets their rows:
+    registry row positions, or a DataFrame for cohorts saved before row
+    sets. Every registered analysis is evaluated for all the row-set
+    cohorts in one grouped pass over the registry, with cohort membership
+    as the grouping key (see aggregation.aggregate_groups); each cohort's
+    stats are exactly what analyse_cohort computes for it alone.
+    Returns the cohorts (with their chart colour), each cohort's stats, the
+    comparison table (COMPARISON_METRICS) and the comparison charts as
+    specs or, with chart_mode 'png', rendered images. Charts are drawn for
+    every comparison, whatever filters the cohorts share.
+    """
+    if chart_mode not in CHART_MODES:
+        raise ValueError(f"Unknown chart mode: {chart_mode}")
+    timings = timings if timings is not None else AnalysisTimings()
+    ANALYSES_TOTAL.inc(len(cohorts), chart_mode=chart_mode)
+
+    analyses = registered_analyses()
+    cohort_stats = [None] * len(cohorts)
+
+    grouped = [i for i, rows in enumerate(row_sets) if not isinstance(rows, pd.DataFrame)]
+    if grouped:
+        row_ids = np.concatenate([np.asarray(row_sets[i], dtype=np.int64) for i in grouped])
+        groups = np.repeat(np.arange(len(grouped)), [len(row_sets[i]) for i in grouped])
+        for i, stats in zip(grouped, run_grouped_analyses(df, row_ids, groups, len(grouped), analyses, timings=timings)):
+            cohort_stats[i] = stats
+    for i, rows in enumerate(row_sets):
+        if isinstance(rows, pd.DataFrame):
+            cohort_stats[i] = run_analyses(rows, analyses, timings=timings)
+
+    cohort_info = []
+    for i, (cohort, stats) in enumerate(zip(cohorts, cohort_stats)):
+        stats['total_patients'] = len(row_sets[i])
+        cohort_info.append({
+            'id': cohort['id'],
+            'name': cohort['name'],
+            'total_patients': stats['total_patients'],
+            'color': COHORT_COLORS[i % len(COHORT_COLORS)]
+        })
+
+    results = {
+        'cohorts': cohort_info,
+        'chart_mode': chart_mode,
+        'metrics': comparison_table(cohort_stats),
+        'stats': cohort_stats,
+        'charts': {}
+    }
+
+    chart_jobs = {}
+    for key, build_spec in COMPARISON_CHARTS:
+        spec, measurement = measured_call(build_spec, cohort_info, cohort_stats)
+        timings.record_chart(key, 'spec', measurement)
+        results['charts'][key] = spec
+        if chart_mode == 'png' and spec is not None:
+            chart_jobs[key] = (generate_comparison_chart, spec)
+
+    if chart_jobs:
+        with timings.stage('render_charts'):
+            results['charts'].update(render_charts(chart_jobs, timings=timings))
+
+    results['timings'] = timings.report()
+    return results
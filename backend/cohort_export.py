@@ -0,0 +1,190 @@
+import gzip
+import pandas as pd
+from cohort_store import select_rows
+
+# pyarrow is optional: without it only (gzip) CSV exports are available
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pa_csv = None
+    pq = None
+
+# Rows taken from the registry per chunk; memory use is bounded by one chunk
+EXPORT_CHUNK_ROWS = 50000
+
+# format -> (file extension, content type)
+EXPORT_FORMATS = {
+    'csv': ('csv', 'text/csv'),
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'arrow': ('arrows', 'application/vnd.apache.arrow.stream')
+}
+EXPORT_COMPRESSIONS = ('gzip', 'zstd')
+COMPRESSION_SUFFIXES = {'gzip': '.gz', 'zstd': '.zst'}
+
+
+class ExportError(ValueError):
+    """An export request that cannot be served (bad format, column, ...)."""
+
+
+class _ChunkSink:
+    """
+    Write-only file object collecting whatever the writers produce, so the
+    bytes can be handed to the response after every chunk.
+    """
+
+    def __init__(self):
+        self._parts = []
+        self.closed = False
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def check_export(df: pd.DataFrame, fmt, compression=None, columns=None):
+    """
+    Validate an export request against the registry.
+    Returns the columns to export (all registry columns by default).
+    Raises ExportError if the request cannot be served here.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ExportError(f"Unknown export format: {fmt}")
+    if compression is not None and compression not in EXPORT_COMPRESSIONS:
+        raise ExportError(f"Unknown compression: {compression}")
+    if pa is None and (fmt != 'csv' or compression == 'zstd'):
+        raise ExportError(f"Exporting {fmt}{' with ' + compression if compression else ''} requires pyarrow")
+
+    if not columns:
+        return list(df.columns)
+    unknown = [c for c in columns if c not in df.columns]
+    if unknown:
+        raise ExportError(f"Unknown columns: {', '.join(unknown)}")
+    return list(dict.fromkeys(columns))
+
+
+def export_filename(name, fmt, compression=None):
+    """
+    Download name of an export. Parquet and Arrow compress internally, so
+    only CSV (and gzip-wrapped Arrow) get a compression suffix.
+    """
+    extension = EXPORT_FORMATS[fmt][0]
+    suffix = ''
+    if compression and (fmt == 'csv' or (fmt == 'arrow' and compression == 'gzip')):
+        suffix = COMPRESSION_SUFFIXES[compression]
+    return f"{name}.{extension}{suffix}"
+
+
+def _chunks(df, row_ids, columns, chunk_rows):
+    for start in range(0, len(row_ids), chunk_rows):
+        yield select_rows(df, row_ids[start:start + chunk_rows], columns)
+
+
+def _arrow_schema(df, columns):
+    """
+    Arrow schema shared by every chunk, taken from the registry's dtypes.
+    Text columns are typed as strings up front: a chunk where they happen to
+    be all missing would otherwise be inferred as null.
+    """
+    schema = pa.Schema.from_pandas(select_rows(df, [], columns), preserve_index=False)
+    for i, field in enumerate(schema):
+        if pa.types.is_null(field.type):
+            schema = schema.set(i, field.with_type(pa.string()))
+    return schema
+
+
+def _csv_stream(chunks, sink, columns, compression):
+    """
+    CSV through pandas, used when pyarrow is not installed.
+    """
+    out = gzip.GzipFile(fileobj=sink, mode='wb') if compression == 'gzip' else sink
+
+    header = True
+    for chunk in chunks:
+        out.write(chunk.to_csv(index=False, header=header).encode('utf-8'))
+        header = False
+        yield
+    if header:
+        # Empty cohort: still write the header row
+        out.write(pd.DataFrame(columns=columns).to_csv(index=False).encode('utf-8'))
+    out.close()
+    yield
+
+
+def _arrow_csv_stream(chunks, sink, schema, compression):
+    # pyarrow's CSV writer is several times faster than DataFrame.to_csv
+    out = pa.CompressedOutputStream(sink, compression) if compression else sink
+    writer = pa_csv.CSVWriter(out, schema)
+    for chunk in chunks:
+        writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+        yield
+    writer.close()
+    if out is not sink:
+        out.close()
+    yield
+
+
+def _parquet_stream(chunks, sink, schema, compression):
+    writer = pq.ParquetWriter(sink, schema, compression=compression or 'snappy')
+    for chunk in chunks:
+        writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+        yield
+    writer.close()
+    yield
+
+
+def _arrow_stream(chunks, sink, schema, compression):
+    # zstd compresses the IPC buffers themselves; gzip (not an IPC codec)
+    # wraps the whole stream
+    out = pa.CompressedOutputStream(sink, 'gzip') if compression == 'gzip' else sink
+    options = pa.ipc.IpcWriteOptions(compression='zstd' if compression == 'zstd' else None)
+    writer = pa.ipc.new_stream(out, schema, options=options)
+    for chunk in chunks:
+        writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+        yield
+    writer.close()
+    if out is not sink:
+        out.close()
+    yield
+
+
+def stream_export(df: pd.DataFrame, row_ids, columns, fmt, compression=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Stream the given registry rows as a file in fmt, yielding bytes.
+    Rows are taken from the registry one chunk of row positions at a time
+    and written straight to the output, so the whole cohort is never
+    materialised and memory use does not depend on the cohort size.
+    Call check_export first to validate the request.
+    """
+    sink = _ChunkSink()
+    chunks = _chunks(df, row_ids, columns, chunk_rows)
+
+    if fmt == 'csv' and pa is None:
+        steps = _csv_stream(chunks, sink, columns, compression)
+    elif fmt == 'csv':
+        steps = _arrow_csv_stream(chunks, sink, _arrow_schema(df, columns), compression)
+    elif fmt == 'parquet':
+        steps = _parquet_stream(chunks, sink, _arrow_schema(df, columns), compression)
+    else:
+        steps = _arrow_stream(chunks, sink, _arrow_schema(df, columns), compression)
+
+    for _ in steps:
+        data = sink.drain()
+        if data:
+            yield data
@@ -0,0 +1,228 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from bitmap_index import (
+    all_rows_bitmap, column_bitmap, count_bits, range_bitmap, range_count, unpack_bitmap
+)
+
+# Categorical fields the cohort builder can filter on
+CATEGORICAL_FILTERS = [
+    'sex', 'ptype', 'uresidence', 'walk', 'cogstat', 'frailty',
+    'addelassess', 'ftype', 'afracture', 'asa', 'e_dadmit',
+    'painassess', 'painmanage', 'analges', 'surg', 'delay',
+    'anaesth', 'wbear', 'ward', 'gerimed', 'delassess', 'fassess',
+    'pulcers', 'mobil', 'bonemed', 'dbonemed1', 'malnutrition',
+    'ons', 'wdest', 'fwalk2', 'dresidence', 'fbonemed2', 'fop2'
+]
+
+# Numeric fields filtered by an inclusive range: column -> (min key, max key)
+RANGE_FILTERS = {
+    'age': ('minAge', 'maxAge'),
+}
+
+# Evaluated predicate bitmaps kept per index, so a builder session that adds
+# or removes one filter at a time only evaluates the predicate that changed
+PREDICATE_CACHE_SIZE = 128
+
+_predicate_lock = threading.Lock()
+
+
+def _bound(filters, key):
+    value = filters.get(key)
+    if value is None or value == '':
+        return None
+    return float(value)
+
+
+def filter_cardinality(filters):
+    """
+    Size of a cohort builder filter set: the number of active filters and
+    of the values they select (each range bound counts as one value).
+    """
+    filters = filters if isinstance(filters, dict) else {}
+    fields = values = 0
+    for min_key, max_key in RANGE_FILTERS.values():
+        bounds = sum(_bound(filters, key) is not None for key in (min_key, max_key))
+        fields += bounds > 0
+        values += bounds
+    for filter_key in CATEGORICAL_FILTERS:
+        selected = filters.get(filter_key)
+        if selected:
+            fields += 1
+            values += len(selected)
+    return {'fields': fields, 'values': values}
+
+
+def compile_filter_plan(filters, index):
+    """
+    Turn the cohort builder filters JSON into an ordered list of predicates.
+    Each predicate carries an estimated row count taken from the bitmap index
+    (exact per-category counts, binary search over the sorted range columns),
+    and the plan is sorted most selective first so evaluation can stop as
+    soon as the running mask is empty.
+    """
+    plan = []
+
+    # Range predicates (age)
+    for column, (min_key, max_key) in RANGE_FILTERS.items():
+        lower = _bound(filters, min_key)
+        upper = _bound(filters, max_key)
+        if (lower is None and upper is None) or column not in index['sorted']:
+            continue
+        plan.append({
+            'kind': 'range',
+            'column': column,
+            'lower': lower,
+            'upper': upper,
+            'estimate': range_count(index, column, lower, upper)
+        })
+
+    # Categorical predicates
+    for filter_key in CATEGORICAL_FILTERS:
+        filter_values = filters.get(filter_key)
+        if filter_values and len(filter_values) > 0 and filter_key in index['columns']:
+            counts = index['counts'][filter_key]
+            plan.append({
+                'kind': 'category',
+                'column': filter_key,
+                'values': list(filter_values),
+                'estimate': sum(counts.get(value, 0) for value in set(filter_values))
+            })
+
+    plan.sort(key=lambda predicate: predicate['estimate'])
+    return plan
+
+
+def _evaluate_predicate(df: pd.DataFrame, index, predicate):
+    if predicate['kind'] == 'range':
+        values = pd.to_numeric(df[predicate['column']], errors='coerce').to_numpy(dtype=float)
+        return range_bitmap(values, predicate['lower'], predicate['upper'])
+    return column_bitmap(index, predicate['column'], predicate['values'])
+
+
+def _predicate_key(predicate):
+    if predicate['kind'] == 'range':
+        return ('range', predicate['column'], predicate['lower'], predicate['upper'])
+    return ('category', predicate['column'], frozenset(predicate['values']))
+
+
+def predicate_bitmap(df: pd.DataFrame, index, predicate):
+    """
+    Evaluate a single compiled predicate to a packed bitmap.
+    Results are cached on the index (least recently used dropped first);
+    the returned bitmap is shared and must not be modified.
+    """
+    key = _predicate_key(predicate)
+    with _predicate_lock:
+        cache = index.setdefault('predicate_cache', OrderedDict())
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+
+    bitmap = _evaluate_predicate(df, index, predicate)
+    with _predicate_lock:
+        cache[key] = bitmap
+        while len(cache) > PREDICATE_CACHE_SIZE:
+            cache.popitem(last=False)
+    return bitmap
+
+
+def evaluate_filter_plan(df: pd.DataFrame, index, plan):
+    """
+    AND every predicate of a compiled plan into one fused bitmap.
+    Stops early once no rows are left, so an impossible combination
+    costs at most one predicate evaluation after it empties.
+    """
+    result = all_rows_bitmap(index)
+    for predicate in plan:
+        if predicate['estimate'] == 0:
+            return np.zeros_like(result)
+        np.bitwise_and(result, predicate_bitmap(df, index, predicate), out=result)
+        if not result.any():
+            break
+    return result
+
+
+def cohort_bitmap(df: pd.DataFrame, index, filters):
+    """
+    Compile and evaluate the filters, returning the packed cohort bitmap.
+    """
+    return evaluate_filter_plan(df, index, compile_filter_plan(filters or {}, index))
+
+
+def cohort_count(df: pd.DataFrame, index, filters):
+    """
+    Number of patients matching the filters.
+    """
+    return count_bits(cohort_bitmap(df, index, filters))
+
+
+def cohort_mask(df: pd.DataFrame, index, filters):
+    """
+    Boolean row mask (aligned with df) for the patients matching the filters.
+    """
+    return unpack_bitmap(cohort_bitmap(df, index, filters), index['n_rows'])
+
+
+def option_counts(df: pd.DataFrame, index, filters):
+    """
+    Live counts for the cohort builder: the current cohort size and, for
+    every categorical filter, the size the cohort would have if each of
+    its options were toggled (ticked if unticked, unticked if ticked).
+
+    Options of one filter are ORed and filters are ANDed, so toggling an
+    option of column c only depends on the rows matching every *other*
+    filter. Those rows are grouped by c's category codes in one bincount:
+    - c not filtered: toggled count = rows with that option
+    - option ticked: current count minus its rows (all other-filter rows
+      if it was the only ticked option)
+    - option unticked: current count plus its rows
+    The other-filter masks come from prefix/suffix ANDs of the cached
+    predicate bitmaps, so each request evaluates only new predicates.
+    Returns {'count': int, 'options': {column: {value: count}}}.
+    """
+    filters = filters or {}
+    plan = compile_filter_plan(filters, index)
+    bitmaps = [predicate_bitmap(df, index, predicate) for predicate in plan]
+
+    # prefix[i] = AND of bitmaps[:i], suffix[i] = AND of bitmaps[i:]
+    prefix = [all_rows_bitmap(index)]
+    for bitmap in bitmaps:
+        prefix.append(np.bitwise_and(prefix[-1], bitmap))
+    suffix = [all_rows_bitmap(index)]
+    for bitmap in reversed(bitmaps):
+        suffix.append(np.bitwise_and(suffix[-1], bitmap))
+    suffix.reverse()
+
+    n_rows = index['n_rows']
+    current_rows = np.flatnonzero(unpack_bitmap(prefix[-1], n_rows))
+    current = len(current_rows)
+
+    other_rows = {}
+    for i, predicate in enumerate(plan):
+        if predicate['kind'] == 'category':
+            others = np.bitwise_and(prefix[i], suffix[i + 1])
+            other_rows[predicate['column']] = np.flatnonzero(unpack_bitmap(others, n_rows))
+
+    options = {}
+    for column in CATEGORICAL_FILTERS:
+        if column not in index['codes']:
+            continue
+        values = index['values'][column]
+        rows = other_rows.get(column, current_rows)
+        # Shift by one so missing values (code -1) land in their own bin
+        grouped = np.bincount(index['codes'][column][rows] + 1, minlength=len(values) + 1)[1:]
+
+        selected = set(filters.get(column) or []) if column in other_rows else set()
+        counts = {}
+        for value, n in zip(values, grouped.tolist()):
+            if not selected:
+                counts[value] = n
+            elif value in selected:
+                counts[value] = len(rows) if selected == {value} else current - n
+            else:
+                counts[value] = current + n
+        options[column] = counts
+
+    return {'count': current, 'options': options}
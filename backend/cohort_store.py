@@ -0,0 +1,96 @@
+import hashlib
+import os
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+# Advisory file locks are POSIX only; elsewhere locking is a no-op
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+ROW_SET_SUFFIX = '.rows.npz'
+
+
+def dataset_fingerprint(path, chunk_size=1024 * 1024):
+    """
+    Content hash of the cleaned dataset file, used as its version.
+    Saved row sets are only valid against the exact dataset they were built from.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+@contextmanager
+def file_lock(path):
+    """
+    Hold an exclusive advisory lock on path for the duration of the block,
+    serialising read-modify-write updates between server processes.
+    """
+    with open(path, 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def row_set_path(directory, cohort_id):
+    return os.path.join(directory, f"{cohort_id}{ROW_SET_SUFFIX}")
+
+
+def _delta_dtype(max_delta):
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if max_delta <= np.iinfo(dtype).max:
+            return dtype
+    return np.uint64
+
+
+def save_row_set(path, mask, dataset_version):
+    """
+    Persist a cohort as the positions of its rows in the registry.
+    Positions are stored sorted and delta-encoded in the narrowest unsigned
+    type that fits, then zip-compressed; dense cohorts shrink to a few bits
+    per patient. Returns the number of rows saved.
+    """
+    mask = np.asarray(mask, dtype=bool)
+    row_ids = np.flatnonzero(mask)
+    deltas = np.diff(row_ids, prepend=0)
+    max_delta = int(deltas.max()) if len(deltas) else 0
+
+    tmp_path = f"{path}.tmp.npz"
+    np.savez_compressed(
+        tmp_path,
+        deltas=deltas.astype(_delta_dtype(max_delta)),
+        n_rows=np.int64(len(mask)),
+        dataset_version=np.array(dataset_version)
+    )
+    os.replace(tmp_path, path)
+    return len(row_ids)
+
+
+def load_row_set(path):
+    """
+    Load a saved row set.
+    Returns (row_ids, n_rows, dataset_version).
+    """
+    with np.load(path) as data:
+        row_ids = np.cumsum(data['deltas'], dtype=np.int64)
+        return row_ids, int(data['n_rows']), str(data['dataset_version'])
+
+
+def select_rows(df: pd.DataFrame, row_ids, columns=None):
+    """
+    Materialise only the requested rows (and columns) of the registry.
+    Uses positional take, so nothing outside the cohort is copied.
+    """
+    if columns is None:
+        return df.iloc[row_ids]
+    positions = [df.columns.get_loc(c) for c in columns if c in df.columns]
+    return df.iloc[row_ids, positions]
@@ -0,0 +1,130 @@
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+# A column store is a directory of .npy files (one per column, category
+# columns as their integer codes) plus a JSON manifest. Opening it memory-maps
+# every file read-only, so all processes serving the same dataset share one
+# copy of the registry through the OS page cache.
+COLUMN_STORE_SUFFIX = '.colstore'
+MANIFEST_NAME = 'manifest.json'
+
+
+def column_store_root(path):
+    """
+    Directory holding the column stores of a dataset file (one per version).
+    """
+    root, _ = os.path.splitext(path)
+    return root + COLUMN_STORE_SUFFIX
+
+
+def _version_dir(root, dataset_version):
+    return os.path.join(root, dataset_version or 'none')
+
+
+def _json_value(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _column_kind(series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return 'category'
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return 'datetime'
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+        return 'numeric'
+    # Remaining text columns are stored as codes + labels as well (they come
+    # back as categoricals: only the codes can be shared zero-copy)
+    return 'category'
+
+
+def write_column_store(df: pd.DataFrame, root, dataset_version):
+    """
+    Write df as a column store for dataset_version under root.
+    The store is built in a temporary directory and renamed into place, so
+    concurrent writers (e.g. several workers starting at once) are safe:
+    the first rename wins and the others discard their copy.
+    Returns the store directory.
+    """
+    final_dir = _version_dir(root, dataset_version)
+    tmp_dir = f"{final_dir}.tmp-{os.getpid()}"
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    columns = []
+    for i, col in enumerate(df.columns):
+        series = df[col]
+        kind = _column_kind(series)
+        entry = {'name': col, 'kind': kind, 'file': f"{i}.npy"}
+
+        if kind == 'category':
+            if not isinstance(series.dtype, pd.CategoricalDtype):
+                series = series.astype('category')
+            data = series.cat.codes.to_numpy()
+            entry['categories'] = [_json_value(c) for c in series.cat.categories]
+            entry['ordered'] = bool(series.cat.ordered)
+        else:
+            data = series.to_numpy()
+
+        np.save(os.path.join(tmp_dir, entry['file']), np.ascontiguousarray(data))
+        columns.append(entry)
+
+    manifest = {
+        'dataset_version': dataset_version,
+        'n_rows': len(df),
+        'columns': columns
+    }
+    # Manifest last: a store without one is incomplete
+    with open(os.path.join(tmp_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f)
+
+    try:
+        os.rename(tmp_dir, final_dir)
+    except OSError:
+        # Another process published this version first
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return final_dir
+
+
+def open_column_store(root, dataset_version):
+    """
+    Attach to the column store of dataset_version: every column is a
+    read-only memory map of its .npy file, wrapped without copying.
+    Returns None if there is no complete store for that version.
+    """
+    store_dir = _version_dir(root, dataset_version)
+    manifest_path = os.path.join(store_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, 'r') as f:
+        manifest = json.load(f)
+
+    data = {}
+    for entry in manifest['columns']:
+        values = np.load(os.path.join(store_dir, entry['file']), mmap_mode='r')
+        if entry['kind'] == 'category':
+            dtype = pd.CategoricalDtype(entry['categories'], ordered=entry['ordered'])
+            data[entry['name']] = pd.Categorical.from_codes(values, dtype=dtype, validate=False)
+        else:
+            data[entry['name']] = values
+
+    # copy=False keeps one block per column, so nothing is consolidated (copied)
+    return pd.DataFrame(data, copy=False)
+
+
+def prune_column_stores(root, keep_version):
+    """
+    Delete the stores of every other dataset version. Processes still
+    attached to an old store keep their mappings until they exit.
+    """
+    removed = []
+    if not os.path.isdir(root):
+        return removed
+    keep = os.path.basename(_version_dir(root, keep_version))
+    for name in os.listdir(root):
+        # Also leaves a store of this version that is still being written
+        if not name.startswith(keep):
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+            removed.append(name)
+    return removed
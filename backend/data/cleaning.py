@@ -10,25 +10,33 @@ This script performs:
   - derives LOS and time_to_surgery
   - basic bounds checking and missing-value handling
   - saves cleaned CSV locally
+Large extracts: python clean_data.py --chunk-rows 200000 streams the input in
+row batches (bounded memory); only the KNN imputation sees all rows at once.
+--impute blocked replaces the exact (quadratic) KNN imputation with a k-d tree
+search within hospitals, which is what makes nightly reruns feasible.
+--incremental keeps a checkpoint per stage and only redoes what changed.
 """
 
 
+import argparse
+import hashlib
+import inspect
+import json
 import os
+import shutil
 import sys
 from datetime import datetime
 import pandas as pd
 import numpy as np
-from sklearn.impute import KNNImputer
-
-
-print("Python is looking in:", os.getcwd())
-print("Files in this directory:", os.listdir())
 
 
 # ===== CONFIG - change INPUT_CSV to your local confidential file =====
 INPUT_CSV = "unsw_datathon_2025.csv"
 OUTPUT_CSV = "cleaned_anzhfr_full.csv"
+OUTPUT_FEATHER = "cleaned_anzhfr_full.feather"  # columnar copy read by the backend
 BACKUP_CSV = "backup_original.csv"
+CHUNK_DIR = "cleaning_chunks"  # per-batch stage output of the chunked mode
+CHECKPOINT_DIR = "cleaning_checkpoints"  # per-stage output of the incremental mode
 # ===================================================================
 
 
@@ -44,12 +52,16 @@ def backup_original(df):
     df.to_csv(BACKUP_CSV, index=False)
 
 
-def overview(df, title="Overview"):
+def overview(df, title="Overview", n_rows=None, missing=None):
+    # The chunked mode passes the row count and NaN counts accumulated over
+    # its batches instead of a frame (df=None)
+    if df is not None:
+        n_rows, missing = len(df), df.isna().sum()
     print(f"\n=== {title} ===")
-    print("Shape:", df.shape)
-    print("Columns:", ", ".join(df.columns.tolist()))
+    print("Shape:", (n_rows, len(missing)))
+    print("Columns:", ", ".join(missing.index.tolist()))
     print("Missing (top 20):")
-    print(df.isna().sum().sort_values(ascending=False).head(20))
+    print(missing.sort_values(ascending=False).head(20))
     print("====================\n")
 
 
@@ -351,119 +363,208 @@ mort_map = {1: "Alive", 2: "Deceased"}
 # ---------------- end mappings ----------------
 
 
-def apply_mappings(df):
-    # Helper to map many columns, skip if column not present
-    mapping_pairs = [
-        ("sex", sex_map),
-        ("ptype", ptype_map),
-        ("uresidence", uresidence_map),
-        ("e_dadmit", e_dadmit_map),
-        ("painassess", painassess_map),
-        ("painmanage", painmanage_map),
-        ("tfanalges", tfanalges_map),
-        ("ward", ward_map),
-        ("walk", walk_map),
-        ("cogassess", cogassess_map),
-        ("cogstat", cogstat_map),
-        ("addelassess", addelassess_map),
-        ("bonemed", bonemed_map),
-        ("passess", passess_map),
-        ("afracture", afracture_map),
-        ("ftype", ftype_map),
-        ("asa", asa_map),
-        ("frailty", frailty_map),
-        ("delay", delay_map),
-        ("anaesth", anaesth_map),
-        ("analges", analges_map),
-        ("consult", consult_map),
-        ("wbear", wbear_map),
-        ("mobil", mobil_map),
-        ("pulcers", pulcers_map),
-        ("fassess", fassess_map),
-        ("dbonemed1", dbonemed1_map),
-        ("delassess", delassess_map),
-        ("malnutrition", malnutrition_map),
-        ("ons", ons_map),
-        ("mobil2", mobil2_map),
-        ("wdest", wdest_map),
-        ("dresidence", dresidence_map),
-        ("fresidence2", fresidence2_map),
-        ("weight_bear120", weight_bear120_map),
-        ("fwalk2", fwalk2_map),
-        ("fbonemed2", fbonemed2_map),
-        ("fop2", fop2_map),
-        ("surg", surg_map),
-        ("gerimed", gerimed_map),
-        ("mort30d", mort_map),
-        ("mort90d", mort_map),
-        ("mort120d", mort_map),
-        ("mort365d", mort_map)
-    ]
+# (column, value-label map) pairs applied by apply_mappings, also used by the
+# backend to build categorical dtypes for the cleaned registry
+MAPPING_PAIRS = [
+    ("sex", sex_map),
+    ("ptype", ptype_map),
+    ("uresidence", uresidence_map),
+    ("e_dadmit", e_dadmit_map),
+    ("painassess", painassess_map),
+    ("painmanage", painmanage_map),
+    ("tfanalges", tfanalges_map),
+    ("ward", ward_map),
+    ("walk", walk_map),
+    ("cogassess", cogassess_map),
+    ("cogstat", cogstat_map),
+    ("addelassess", addelassess_map),
+    ("bonemed", bonemed_map),
+    ("passess", passess_map),
+    ("afracture", afracture_map),
+    ("ftype", ftype_map),
+    ("asa", asa_map),
+    ("frailty", frailty_map),
+    ("delay", delay_map),
+    ("anaesth", anaesth_map),
+    ("analges", analges_map),
+    ("consult", consult_map),
+    ("wbear", wbear_map),
+    ("mobil", mobil_map),
+    ("pulcers", pulcers_map),
+    ("fassess", fassess_map),
+    ("dbonemed1", dbonemed1_map),
+    ("delassess", delassess_map),
+    ("malnutrition", malnutrition_map),
+    ("ons", ons_map),
+    ("mobil2", mobil2_map),
+    ("wdest", wdest_map),
+    ("dresidence", dresidence_map),
+    ("fresidence2", fresidence2_map),
+    ("weight_bear120", weight_bear120_map),
+    ("fwalk2", fwalk2_map),
+    ("fbonemed2", fbonemed2_map),
+    ("fop2", fop2_map),
+    ("surg", surg_map),
+    ("gerimed", gerimed_map),
+    ("mort30d", mort_map),
+    ("mort90d", mort_map),
+    ("mort120d", mort_map),
+    ("mort365d", mort_map)
+]
+
+
+def label_categories(mdict):
+    """
+    Ordered, de-duplicated labels of a value-label map plus the
+    "Not recorded" label apply_mappings uses for missing codes.
+    """
+    labels = list(dict.fromkeys(mdict.values()))
+    if "Not recorded" not in labels:
+        labels.append("Not recorded")
+    return labels
 
 
-    for col, mdict in mapping_pairs:
-        if col in df.columns:
+# Map labelled columns straight to category codes (see mapped_categorical)
+# rather than to object strings; the cleaned CSV is the same either way
+CATEGORICAL_MAPPINGS = True
+# Threads mapping columns concurrently
+MAPPING_WORKERS = min(8, os.cpu_count() or 1)
+
+
+def mapped_categorical(series, mdict):
+    """
+    Map a column of integer codes to a categorical of its labels without
+    building any strings: a lookup array turns each code into the index of
+    its label in label_categories(mdict), and codes that are missing or not
+    in the map share the "Not recorded" code.
+    Returns None for non-numeric columns (mapped the slow way instead).
+    """
+    if not pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+        return None
+    labels = label_categories(mdict)
+    not_recorded = labels.index("Not recorded")
+    # One slot per code up to the largest, plus a trailing "Not recorded" slot
+    lookup = np.full(max(mdict) + 2, not_recorded, dtype=np.int16)
+    for code, label in mdict.items():
+        lookup[code] = labels.index(label)
+
+    values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+    # NaN fails every comparison, so it lands in the trailing slot too
+    valid = (values >= 0) & (values < len(lookup) - 1) & (values == np.floor(values))
+    positions = np.where(valid, values, len(lookup) - 1).astype(np.int64)
+    return pd.Categorical.from_codes(lookup[positions], dtype=pd.CategoricalDtype(labels))
+
+
+def apply_mappings(df, categorical=None):
+    """
+    Replace the labelled numeric codes with their labels, missing or unknown
+    codes becoming "Not recorded".
+    categorical (default CATEGORICAL_MAPPINGS) produces category columns,
+    mapped concurrently on MAPPING_WORKERS threads.
+    """
+    categorical = CATEGORICAL_MAPPINGS if categorical is None else categorical
+    # Helper to map many columns, skip if column not present
+    pairs = [(col, mdict) for col, mdict in MAPPING_PAIRS if col in df.columns]
+
+    def map_column(pair):
+        col, mdict = pair
+        mapped = mapped_categorical(df[col], mdict) if categorical else None
+        if mapped is None:
             # Some columns may be floats (NaN); convert to Int where possible before mapping
             # We'll map using pd.Series.map which handles floats and NaN
-            df[col] = df[col].map(mdict).fillna("Not recorded")
+            mapped = df[col].map(mdict).fillna("Not recorded")
+        return mapped
+
+    if categorical and len(pairs) > 1 and MAPPING_WORKERS > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=MAPPING_WORKERS) as pool:
+            mapped = list(pool.map(map_column, pairs))
+    else:
+        mapped = [map_column(pair) for pair in pairs]
+
+    for (col, _), values in zip(pairs, mapped):
+        df[col] = values
     return df
 
 
 # ---------- Date construction ----------
-def build_datetime_from_parts(df, prefix):
+DATETIME_PREFIXES = [
+    "tarrdatetime", "arrdatetime", "depdatetime", "admdatetimeop",
+    "sdatetime", "gdate", "wdisch", "hdisch"
+]
+
+# "H:M:S" or "H:M"; anything else (including missing) is midnight
+HMS_PATTERN = r'^([^:]*):([^:]*)(?::([^:]*))?$'
+
+
+def hms_to_seconds(values):
+    """
+    Seconds since midnight of "H:M:S" / "H:M" strings, as int64.
+    Each distinct string is parsed once, with a single regex extraction
+    (times repeat heavily: there are at most 86,400 valid ones).
+    Components that are not numbers count as 0, fractions are truncated.
     """
-    Given a prefix like 'arrdatetime', tries to build a datetime from:
+    codes, uniques = pd.factorize(pd.Series(values))
+    parts = pd.Series(uniques.astype(str)).str.extract(HMS_PATTERN)
+    parts = parts.apply(pd.to_numeric, errors='coerce').fillna(0).astype(np.int64)
+    seconds = (parts[0] * 3600 + parts[1] * 60 + parts[2]).to_numpy()
+    # Missing values (code -1) pick the trailing 0
+    return np.append(seconds, 0)[codes]
+
+
+def build_datetimes(df, prefixes=DATETIME_PREFIXES):
+    """
+    For each prefix like 'arrdatetime', builds a datetime from:
       prefix + _datediff (days since 2010-01-01) and prefix + _hms (time)
     Creates column: prefix + '_dt'
     
     The _datediff column represents days since 2010-01-01 epoch.
     The _year and _month columns appear to be approximate/administrative dates
     and don't accurately represent the actual datetime.
+    
+    All prefixes are done in one batched pass: the day offsets of every
+    prefix are converted together and the time strings of every prefix are
+    parsed together (see hms_to_seconds).
     """
-    dcol = f"{prefix}_datediff"  # Days since 2010-01-01
-    hmscol = f"{prefix}_hms"
-    outcol = f"{prefix}_dt"
+    # Epoch: 2010-01-01
+    epoch = np.datetime64('2010-01-01')
+    present = [p for p in prefixes if f"{p}_datediff" in df.columns]
+    n = len(df)
     
-    # Only attempt if datediff exists
-    if dcol in df.columns:
-        # Epoch: 2010-01-01
-        epoch = pd.Timestamp('2010-01-01')
-        
-        # Calculate date from datediff (days since epoch)
-        day_offset = pd.to_timedelta(df[dcol].fillna(0), unit='D', errors='coerce')
-        result_dt = epoch + day_offset
-        
-        # Set to NaT where datediff was actually missing
-        result_dt[df[dcol].isna()] = pd.NaT
-        
-        # Handle HMS component if it exists
-        if hmscol in df.columns:
-            hms = df[hmscol].fillna("00:00:00").astype(str)
-            # Clean common formats like "12:00" -> "12:00:00"
-            hms = hms.apply(lambda v: v if ":" in v and v.count(":")==2 else (v + ":00" if ":" in v else "00:00:00"))
-            
-            # Extract time components and add to date
-            time_parts = hms.str.split(':', expand=True)
-            time_parts.columns = ['hour', 'minute', 'second']
-            time_parts = time_parts.apply(pd.to_numeric, errors='coerce').fillna(0)
-            
-            time_delta = pd.to_timedelta(
-                time_parts['hour'].astype(int), unit='h'
-            ) + pd.to_timedelta(
-                time_parts['minute'].astype(int), unit='m'
-            ) + pd.to_timedelta(
-                time_parts['second'].astype(int), unit='s'
-            )
-            
-            result_dt = result_dt + time_delta
-        
-        df[outcol] = result_dt
-    else:
-        # column components not present -> create empty dt col
-        df[outcol] = pd.NaT
+    # Day offsets of all prefixes as one stacked column
+    days = pd.concat([df[f"{p}_datediff"] for p in present], ignore_index=True) if present else pd.Series(dtype=float)
+    missing = days.isna().to_numpy()
+    offsets = pd.to_timedelta(days.fillna(0), unit='D', errors='coerce').to_numpy().astype('timedelta64[us]')
+    
+    # Time of day of the prefixes that have an _hms column
+    timed = [p for p in present if f"{p}_hms" in df.columns]
+    if timed:
+        seconds = hms_to_seconds(pd.concat([df[f"{p}_hms"] for p in timed], ignore_index=True))
+        for i, p in enumerate(timed):
+            j = present.index(p)
+            offsets[j * n:(j + 1) * n] += seconds[i * n:(i + 1) * n].astype('timedelta64[s]')
+    
+    stacked = epoch + offsets
+    # NaT where datediff was actually missing
+    stacked[missing] = np.datetime64('NaT')
+    
+    for p in prefixes:
+        if p in present:
+            j = present.index(p)
+            df[f"{p}_dt"] = pd.Series(stacked[j * n:(j + 1) * n], index=df.index)
+        else:
+            # column components not present -> create empty dt col
+            df[f"{p}_dt"] = pd.NaT
     return df
 
 
+def build_datetime_from_parts(df, prefix):
+    """
+    Build prefix + '_dt' for a single prefix (see build_datetimes).
+    """
+    return build_datetimes(df, [prefix])
+
+
 # ---------- derived durations ----------
 def derive_durations(df):
     # Common pairs from your variable list:
@@ -518,32 +619,142 @@ def numeric_and_bounds(df):
 
 
 # ---------- KNN imputation for continuous variables ----------
-def knn_impute_continuous(df, n_neighbors=5):
+# Continuous variables that may have missing values
+CONTINUOUS_VARS = [
+    'age',
+    'los_hospital_days',
+    'los_acute_ward_days', 
+    'time_to_surgery_hrs',
+    'transfer_to_operating_days'
+]
+
+# Core clinical variables to track for data quality (excludes transfer_to_operating_days)
+# Transfer is expected to be missing for most patients (not transferred)
+CORE_CLINICAL_VARS = [
+    'age',
+    'los_hospital_days',
+    'time_to_surgery_hrs'
+]
+
+# Imputation methods: 'knn' is scikit-learn's exact KNNImputer (quadratic in
+# rows); 'blocked' imputes within strata using k-d trees (see blocked_knn_impute)
+IMPUTE_METHODS = ('knn', 'blocked')
+# Blocked mode: strata (e.g. hospital) neighbours are searched within
+IMPUTE_STRATA = ['ahos_code']
+# Strata with fewer rows than this are pooled together
+MIN_STRATUM_ROWS = 200
+# Rows queried against a k-d tree at a time
+IMPUTE_BATCH_ROWS = 50000
+
+
+def _impute_block(X, n_neighbors, batch_rows, workers, targets=None):
+    """
+    Distance-weighted KNN imputation of the NaNs in X (rows x features), or
+    only in the rows selected by the targets mask.
+    Rows are grouped by their pattern of observed features. For each
+    missing feature, the donors are the rows that have it and every feature
+    the pattern observes; a k-d tree over the donors' observed features is
+    queried batch by batch. Weights are 1/distance (exact matches only, when
+    there are any), as KNNImputer(weights='distance') uses.
+    Values with no donor are left NaN.
+    """
+    from scipy.spatial import cKDTree
+
+    out = X.copy()
+    n_features = X.shape[1]
+    observed = ~np.isnan(X)
+    patterns = observed @ (1 << np.arange(n_features))
+    complete = (1 << n_features) - 1
+
+    for pattern in np.unique(patterns):
+        if pattern == complete:
+            continue
+        rows = np.flatnonzero((patterns == pattern) if targets is None else (patterns == pattern) & targets)
+        if len(rows) == 0:
+            continue
+        obs_cols = [j for j in range(n_features) if pattern >> j & 1]
+        for col in [j for j in range(n_features) if not pattern >> j & 1]:
+            donors = np.flatnonzero(observed[:, obs_cols].all(axis=1) & observed[:, col])
+            if len(donors) == 0:
+                continue
+            if not obs_cols:
+                # Nothing to measure distance on: donor mean
+                out[rows, col] = X[donors, col].mean()
+                continue
+
+            k = min(n_neighbors, len(donors))
+            tree = cKDTree(X[np.ix_(donors, obs_cols)])
+            for start in range(0, len(rows), batch_rows):
+                batch = rows[start:start + batch_rows]
+                dist, idx = tree.query(X[np.ix_(batch, obs_cols)], k=k, workers=workers)
+                dist, idx = dist.reshape(len(batch), k), idx.reshape(len(batch), k)
+                values = X[donors[idx], col]
+                exact = dist == 0
+                with np.errstate(divide='ignore'):
+                    weights = np.where(exact.any(axis=1, keepdims=True), exact, 1.0 / dist)
+                out[batch, col] = (weights * values).sum(axis=1) / weights.sum(axis=1)
+    return out
+
+
+def blocked_knn_impute(X, strata=None, n_neighbors=5, batch_rows=IMPUTE_BATCH_ROWS, n_jobs=None):
+    """
+    Scalable approximation of KNNImputer(weights='distance') over X.
+    - strata: one label per row (e.g. hospital); neighbours are only searched
+      within a row's stratum, and strata smaller than MIN_STRATUM_ROWS are
+      pooled, so the cost grows with stratum size rather than row count
+    - neighbours come from k-d trees instead of all pairwise distances,
+      queried in batches of batch_rows
+    - strata are imputed in parallel (n_jobs threads, default all cores);
+      without strata the tree queries use the cores instead
+    Returns the imputed copy of X.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    n_jobs = n_jobs or os.cpu_count() or 1
+    X = np.asarray(X, dtype=np.float64)
+    observed = ~np.isnan(X)
+    if strata is None:
+        out = _impute_block(X, n_neighbors, batch_rows, n_jobs)
+    else:
+        codes, _ = pd.factorize(pd.Series(strata), use_na_sentinel=False)
+        sizes = np.bincount(codes)
+        # Small strata share one block
+        codes = np.where(sizes[codes] < MIN_STRATUM_ROWS, -1, codes)
+        blocks = [np.flatnonzero(codes == code) for code in np.unique(codes)]
+
+        out = np.empty_like(X)
+
+        def impute(rows):
+            out[rows] = _impute_block(X[rows], n_neighbors, batch_rows, 1)
+
+        with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+            list(pool.map(impute, blocks))
+
+        # Values with no donor in their stratum: search all rows
+        left = (np.isnan(out) & observed.any(axis=0)).any(axis=1)
+        if left.any():
+            refill = _impute_block(X, n_neighbors, batch_rows, n_jobs, targets=left)
+            out[left] = np.where(np.isnan(out[left]), refill[left], out[left])
+
+    # Last resort (no donor anywhere): the column mean
+    still_missing = np.isnan(out) & observed.any(axis=0)
+    if still_missing.any():
+        means = np.nanmean(np.where(observed.any(axis=0), X, 0.0), axis=0)
+        out[still_missing] = np.take(means, np.nonzero(still_missing)[1])
+    return out
+
+
+def knn_impute_continuous(df, n_neighbors=5, method='knn', strata=None):
     """
     Use KNN imputation for continuous variables with missing values.
     This provides more sophisticated imputation than simple mean/median filling.
     Also tracks which rows had imputed values for data quality assessment.
+    method='blocked' uses blocked_knn_impute, within the strata columns
+    given (default IMPUTE_STRATA, those present in df).
     """
-    # Identify continuous variables that may have missing values
-    continuous_vars = [
-        'age',
-        'los_hospital_days',
-        'los_acute_ward_days', 
-        'time_to_surgery_hrs',
-        'transfer_to_operating_days'
-    ]
-    
-    # Core clinical variables to track for data quality (excludes transfer_to_operating_days)
-    # Transfer is expected to be missing for most patients (not transferred)
-    core_clinical_vars = [
-        'age',
-        'los_hospital_days',
-        'time_to_surgery_hrs'
-    ]
-    
     # Filter to only columns that exist in the dataframe
-    continuous_vars = [col for col in continuous_vars if col in df.columns]
-    core_clinical_vars = [col for col in core_clinical_vars if col in df.columns]
+    continuous_vars = [col for col in CONTINUOUS_VARS if col in df.columns]
+    core_clinical_vars = [col for col in CORE_CLINICAL_VARS if col in df.columns]
     
     if not continuous_vars:
         print("No continuous variables found for KNN imputation.")
@@ -567,11 +778,19 @@ def knn_impute_continuous(df, n_neighbors=5):
         # Create boolean mask: True where originally NaN
         imputation_map[col] = df[col].isna().copy()
     
-    # Create KNN imputer
-    imputer = KNNImputer(n_neighbors=n_neighbors, weights='distance')
-    
-    # Apply imputation only to continuous variables
-    df[continuous_vars] = imputer.fit_transform(df[continuous_vars])
+    if method == 'blocked':
+        strata = [col for col in (IMPUTE_STRATA if strata is None else strata) if col in df.columns]
+        labels = df[strata].astype(str).agg('|'.join, axis=1) if strata else None
+        print(f"Blocked KNN imputation within: {', '.join(strata) or 'all rows'}")
+        df[continuous_vars] = blocked_knn_impute(df[continuous_vars].to_numpy(), labels, n_neighbors)
+    else:
+        # Create KNN imputer (imported here so the label maps above can be
+        # imported by the backend without scikit-learn installed)
+        from sklearn.impute import KNNImputer
+        imputer = KNNImputer(n_neighbors=n_neighbors, weights='distance')
+        
+        # Apply imputation only to continuous variables
+        df[continuous_vars] = imputer.fit_transform(df[continuous_vars])
     
     print(f"KNN imputation complete with {n_neighbors} neighbors.")
     print(f"Missing counts after imputation:")
@@ -625,8 +844,451 @@ def fill_defaults(df):
     return df
 
 
+# ---------- columnar output ----------
+def label_categoricals(df, extra=True):
+    """
+    Store labelled columns dictionary-encoded, with the value-label map's
+    labels as categories. extra=False keeps exactly those categories (every
+    batch of the chunked mode must share one dictionary); apply_mappings
+    only ever produces these labels.
+    """
+    for col, mdict in MAPPING_PAIRS:
+        if col in df.columns:
+            labels = label_categories(mdict)
+            if extra:
+                labels = labels + [v for v in pd.unique(df[col].dropna()) if v not in labels]
+            df[col] = pd.Categorical(df[col], categories=labels)
+    return df
+
+
+def save_columnar(df, path=OUTPUT_FEATHER):
+    """
+    Save the cleaned frame as an uncompressed Feather (Arrow IPC) file the
+    backend can memory-map and read column by column.
+    Labelled columns are stored dictionary-encoded (categorical).
+    Skipped when pyarrow is not installed; the CSV remains the source of truth.
+    """
+    try:
+        import pyarrow.feather as feather
+    except ImportError:
+        print("pyarrow not installed - skipping columnar output.")
+        return
+
+    df = label_categoricals(df)
+    feather.write_feather(df, path, compression='uncompressed')
+    print(f">>> Columnar copy saved locally as: {path}")
+
+
+# ---------- chunked (bounded-memory) pipeline ----------
+def clean_batch(df):
+    """
+    Row-local stages 1-4 (mappings, datetimes, durations, bounds) on one
+    batch of rows. None of them look at other rows, so batches give the
+    same result as the whole frame.
+    """
+    df = apply_mappings(df)
+    df = build_datetimes(df)
+    df = derive_durations(df)
+    return numeric_and_bounds(df)
+
+
+def _chunk_path(i):
+    return os.path.join(CHUNK_DIR, f"part-{i:05d}.arrow")
+
+
+def _unified_type(pa, types):
+    """
+    Type of a column across batches: a column can read as int in one batch
+    and float (has NaN) or all-NaN in another, as pandas does over the file.
+    """
+    types = [t for t in dict.fromkeys(types) if not pa.types.is_null(t)]
+    if not types:
+        return pa.float64()
+    if len(types) == 1:
+        return types[0]
+    if all(pa.types.is_integer(t) or pa.types.is_floating(t) or pa.types.is_boolean(t) for t in types):
+        return pa.float64()
+    if all(pa.types.is_timestamp(t) for t in types):
+        return pa.timestamp('ns')
+    return pa.string()
+
+
+def _unified_schema(pa, paths):
+    schemas = [pa.ipc.open_file(pa.memory_map(path, 'r')).schema for path in paths]
+    names = list(dict.fromkeys(name for schema in schemas for name in schema.names))
+    return pa.schema([
+        (name, _unified_type(pa, [s.field(name).type for s in schemas if name in s.names]))
+        for name in names
+    ])
+
+
+def _cast_table(pa, table, schema, columns=None):
+    fields = [schema.field(name) for name in (columns or schema.names)]
+    arrays = [
+        table.column(field.name).cast(field.type) if field.name in table.column_names
+        else pa.nulls(table.num_rows, field.type)
+        for field in fields
+    ]
+    return pa.table(arrays, schema=pa.schema(fields))
+
+
+def _read_chunk(pa, path, schema, columns=None):
+    """
+    Read a stored batch (or some of its columns) cast to the unified schema.
+    """
+    table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    return _cast_table(pa, table, schema, columns).to_pandas()
+
+
+def _write_arrow(pa, table, path):
+    # Temp file + rename: an interrupted run never leaves a partial file
+    tmp_path = f"{path}.tmp"
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def main_chunked(chunk_rows, impute_method='knn', impute_strata=None):
+    """
+    Bounded-memory version of main() for large extracts.
+    1. The input is streamed in batches of chunk_rows; stages 1-4 run on each
+       batch and the result is appended to CHUNK_DIR as an Arrow file.
+    2. KNN imputation is the only global step: it reads just the continuous
+       columns of every batch (a few floats per row) and fits once.
+    3. Each batch is read back, gets its imputed values and the defaults,
+       and is appended to the cleaned CSV and the Feather copy.
+    Peak memory is one batch plus the continuous columns.
+    """
+    try:
+        import pyarrow as pa
+    except ImportError:
+        print("ERROR: the chunked mode needs pyarrow for its columnar batch output")
+        sys.exit(1)
+    if not os.path.exists(INPUT_CSV):
+        print(f"ERROR: file not found: {INPUT_CSV}")
+        sys.exit(1)
+
+    print(f"Starting local cleaning pipeline in batches of {chunk_rows} rows...")
+    print(f">>> Saving local backup to {BACKUP_CSV}")
+    shutil.copyfile(INPUT_CSV, BACKUP_CSV)
+
+    shutil.rmtree(CHUNK_DIR, ignore_errors=True)
+    os.makedirs(CHUNK_DIR)
+
+    # 1-4) Row-local stages, batch by batch
+    paths = []
+    n_rows, missing = 0, None
+    for i, batch in enumerate(pd.read_csv(INPUT_CSV, chunksize=chunk_rows)):
+        n_rows += len(batch)
+        missing = batch.isna().sum() if missing is None else missing.add(batch.isna().sum(), fill_value=0)
+        batch = clean_batch(batch)
+        path = _chunk_path(i)
+        with pa.OSFile(path, 'wb') as sink:
+            table = pa.Table.from_pandas(batch, preserve_index=False)
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        paths.append(path)
+        print(f"  batch {i + 1}: {len(batch)} rows cleaned")
+    if not paths:
+        print("ERROR: the input file has no rows")
+        sys.exit(1)
+    overview(None, "Before cleaning", n_rows, missing.astype(int))
+    print("Applied label mappings, datetimes, durations and bounds.")
+
+    # 5) KNN imputation: global fit over the continuous (and strata) columns only
+    schema = _unified_schema(pa, paths)
+    continuous_vars = [col for col in CONTINUOUS_VARS if col in schema.names]
+    strata = []
+    if impute_method == 'blocked':
+        strata = [col for col in (IMPUTE_STRATA if impute_strata is None else impute_strata) if col in schema.names]
+    continuous = pd.concat(
+        [_read_chunk(pa, path, schema, continuous_vars + strata) for path in paths],
+        ignore_index=True
+    )
+    imputed = knn_impute_continuous(continuous, n_neighbors=5, method=impute_method, strata=strata)
+    imputed = imputed.drop(columns=strata)
+    print("Applied KNN imputation for continuous variables.")
+
+    # 6-7) Defaults, then append every batch to the outputs
+    feather_tmp = f"{OUTPUT_FEATHER}.tmp"
+    feather_sink = feather_writer = feather_schema = None
+    missing = None
+    start = 0
+    for i, path in enumerate(paths):
+        batch = _read_chunk(pa, path, schema)
+        rows = slice(start, start + len(batch))
+        start += len(batch)
+        for col in imputed.columns:
+            batch[col] = imputed[col].iloc[rows].to_numpy()
+        batch = fill_defaults(batch)
+        missing = batch.isna().sum() if missing is None else missing.add(batch.isna().sum(), fill_value=0)
+
+        batch.to_csv(OUTPUT_CSV, index=False, mode='w' if i == 0 else 'a', header=i == 0)
+
+        table = pa.Table.from_pandas(label_categoricals(batch, extra=False), schema=feather_schema, preserve_index=False)
+        if feather_writer is None:
+            feather_schema = table.schema
+            feather_sink = pa.OSFile(feather_tmp, 'wb')
+            feather_writer = pa.ipc.new_file(feather_sink, feather_schema)
+        feather_writer.write_table(table)
+    print("Filled defaults for misc columns.")
+
+    overview(None, "After cleaning", n_rows, missing.astype(int))
+    print(f">>> Cleaned file saved locally as: {OUTPUT_CSV}")
+    feather_writer.close()
+    feather_sink.close()
+    # Renamed after the CSV is complete so the backend sees it as up to date
+    os.replace(feather_tmp, OUTPUT_FEATHER)
+    print(f">>> Columnar copy saved locally as: {OUTPUT_FEATHER}")
+    shutil.rmtree(CHUNK_DIR, ignore_errors=True)
+    print("Done. Keep this file local. Do NOT upload confidential data anywhere.")
+
+
+# ---------- incremental pipeline (per-stage checkpoints) ----------
+def impute_stage(df, method='knn', strata=None):
+    return knn_impute_continuous(df, n_neighbors=5, method=method, strata=strata)
+
+
+# The stage graph, in order: (name, function, row_local, code it depends on).
+# A stage's checkpoint key hashes the previous stage's key with the source
+# of that code (and the stage parameters), so editing a stage, a helper it
+# uses or a value-label map invalidates that stage and every later one.
+# row_local stages only look at their own row, so rows appended to the input
+# can be processed on their own and appended to the checkpoint.
+CLEANING_STAGES = [
+    ('mappings', apply_mappings, True, [apply_mappings, mapped_categorical, MAPPING_PAIRS, CATEGORICAL_MAPPINGS]),
+    ('datetimes', build_datetimes, True, [build_datetimes, hms_to_seconds, HMS_PATTERN, DATETIME_PREFIXES]),
+    ('durations', derive_durations, True, [derive_durations]),
+    ('bounds', numeric_and_bounds, True, [numeric_and_bounds]),
+    ('imputation', impute_stage, False, [
+        impute_stage, knn_impute_continuous, blocked_knn_impute, _impute_block,
+        CONTINUOUS_VARS, CORE_CLINICAL_VARS, MIN_STRATUM_ROWS
+    ]),
+    ('defaults', fill_defaults, True, [fill_defaults])
+]
+CHECKPOINT_MANIFEST = os.path.join(CHECKPOINT_DIR, "manifest.json")
+
+
+def _code_version(code):
+    digest = hashlib.sha256()
+    for item in code:
+        digest.update((inspect.getsource(item) if callable(item) else repr(item)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _stage_keys(input_key, params):
+    """
+    Checkpoint key of every stage, chained from the input hash.
+    """
+    keys = {}
+    key = input_key
+    for name, _, _, code in CLEANING_STAGES:
+        payload = json.dumps([key, name, _code_version(code), params.get(name)], sort_keys=True)
+        key = hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+        keys[name] = key
+    return keys
+
+
+def _checkpoint_path(name, key):
+    return os.path.join(CHECKPOINT_DIR, f"{name}-{key}.arrow")
+
+
+def _input_digest(path, prefix_size=None):
+    """
+    sha256 of the input file, plus (if prefix_size is given) the sha256 of
+    its first prefix_size bytes, both from one read of the file.
+    """
+    digest = hashlib.sha256()
+    prefix_digest = None
+    read = 0
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(1024 * 1024)
+            if prefix_size is not None and prefix_digest is None and read + len(block) >= prefix_size:
+                digest.update(block[:prefix_size - read])
+                prefix_digest = digest.copy().hexdigest()
+                digest.update(block[prefix_size - read:])
+            else:
+                digest.update(block)
+            read += len(block)
+            if not block:
+                break
+    return digest.hexdigest(), prefix_digest
+
+
+def _read_appended_rows(path, offset):
+    """
+    Rows of the input after byte offset (the size of the previous input),
+    parsed with the file's header. None if offset is not at a line start.
+    """
+    from io import BytesIO
+    with open(path, 'rb') as f:
+        header = f.readline()
+        f.seek(offset - 1)
+        if f.read(1) != b'\n':
+            return None
+        return pd.read_csv(BytesIO(header + f.read()))
+
+
+def main_incremental(impute_method='knn', impute_strata=None):
+    """
+    Stage-graph runner: every stage's output is kept in CHECKPOINT_DIR as an
+    Arrow file keyed by the input hash and the code version of that stage
+    and the ones before it. A run reuses the checkpoints that are still
+    valid and only runs the stages after them.
+    If the input only grew (new rows appended, earlier bytes unchanged), the
+    row-local stages before imputation run on the new rows alone and are
+    appended to the previous checkpoints; imputation (a global fit) and the
+    stages after it run over all rows.
+    """
+    try:
+        import pyarrow as pa
+    except ImportError:
+        print("ERROR: the incremental mode needs pyarrow for its checkpoints")
+        sys.exit(1)
+    if not os.path.exists(INPUT_CSV):
+        print(f"ERROR: file not found: {INPUT_CSV}")
+        sys.exit(1)
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+
+    previous = {}
+    if os.path.exists(CHECKPOINT_MANIFEST):
+        with open(CHECKPOINT_MANIFEST, 'r') as f:
+            previous = json.load(f)
+    previous_input = previous.get('input', {})
+
+    input_size = os.path.getsize(INPUT_CSV)
+    prefix_size = previous_input.get('size')
+    if prefix_size is not None and not 0 < prefix_size < input_size:
+        prefix_size = None
+    input_hash, prefix_hash = _input_digest(INPUT_CSV, prefix_size)
+
+    params = {'imputation': {'method': impute_method, 'strata': impute_strata}}
+    keys = _stage_keys(input_hash, params)
+    # The same chain without the input: tells whether a stage's code (or an
+    # earlier stage's) changed since the previous run
+    code_keys = _stage_keys('', params)
+    print(f"Starting incremental cleaning pipeline (input {input_hash[:16]})...")
+
+    # Outputs written by this mode from the same final checkpoint (and not
+    # rewritten since, e.g. by a run without --incremental)
+    outputs_current = (
+        previous.get('output') == keys[CLEANING_STAGES[-1][0]]
+        and os.path.exists(OUTPUT_CSV) and os.path.exists(OUTPUT_FEATHER)
+        and previous.get('output_mtime') == os.path.getmtime(OUTPUT_CSV)
+    )
+    if outputs_current:
+        print("Nothing changed since the last run: outputs are up to date.")
+        return
+    print(f">>> Saving local backup to {BACKUP_CSV}")
+    shutil.copyfile(INPUT_CSV, BACKUP_CSV)
+
+    # Rows appended to an otherwise unchanged input
+    appended = None
+    previous_keys = previous.get('stages', {})
+    previous_code = previous.get('code', {})
+    if prefix_hash is not None and prefix_hash == previous_input.get('sha256'):
+        appended = _read_appended_rows(INPUT_CSV, prefix_size)
+        if appended is not None:
+            print(f"Input grew by {len(appended)} rows; earlier rows unchanged.")
+
+    df = None
+    done = None
+    for i, (name, func, row_local, _) in enumerate(CLEANING_STAGES):
+        path = _checkpoint_path(name, keys[name])
+        if os.path.exists(path):
+            print(f"  {name}: checkpoint reused")
+            df, done, appended = None, path, None
+            continue
+
+        old_path = _checkpoint_path(name, previous_keys[name]) if name in previous_keys else None
+        can_append = (
+            appended is not None and row_local and old_path and os.path.exists(old_path)
+            and previous_code.get(name) == code_keys[name]
+            and all(CLEANING_STAGES[j][2] for j in range(i))
+        )
+        if can_append:
+            # Earlier rows are the previous run's checkpoint; clean only the new ones
+            appended = func(appended)
+            old = pa.ipc.open_file(pa.memory_map(old_path, 'r')).read_all()
+            new = pa.Table.from_pandas(appended, preserve_index=False)
+            schema = pa.schema([
+                (field, _unified_type(pa, [old.schema.field(field).type if field in old.schema.names else pa.null(),
+                                           new.schema.field(field).type if field in new.schema.names else pa.null()]))
+                for field in dict.fromkeys(old.schema.names + new.schema.names)
+            ])
+            table = pa.concat_tables([_cast_table(pa, old, schema), _cast_table(pa, new, schema)])
+            _write_arrow(pa, table, path)
+            print(f"  {name}: appended {len(appended)} rows to the previous checkpoint")
+            df, done = None, path
+            continue
+
+        # Recompute this stage from the last checkpoint (or the raw input)
+        appended = None
+        if df is None:
+            df = pa.ipc.open_file(pa.memory_map(done, 'r')).read_all().to_pandas() if done else safe_read_csv(INPUT_CSV)
+        if name == 'imputation':
+            df = func(df, impute_method, impute_strata)
+        else:
+            df = func(df)
+        _write_arrow(pa, pa.Table.from_pandas(df, preserve_index=False), path)
+        print(f"  {name}: ran")
+        done = path
+
+    if df is None:
+        df = pa.ipc.open_file(pa.memory_map(done, 'r')).read_all().to_pandas()
+    overview(df, "After cleaning")
+    df.to_csv(OUTPUT_CSV, index=False)
+    print(f">>> Cleaned file saved locally as: {OUTPUT_CSV}")
+    save_columnar(df)
+
+    with open(CHECKPOINT_MANIFEST, 'w') as f:
+        json.dump({
+            'input': {'size': input_size, 'sha256': input_hash},
+            'stages': keys,
+            'code': code_keys,
+            'output': keys[CLEANING_STAGES[-1][0]],
+            'output_mtime': os.path.getmtime(OUTPUT_CSV)
+        }, f, indent=2)
+    # Only the current checkpoints are kept
+    current = {os.path.basename(_checkpoint_path(name, key)) for name, key in keys.items()}
+    for filename in os.listdir(CHECKPOINT_DIR):
+        if filename.endswith('.arrow') and filename not in current:
+            os.remove(os.path.join(CHECKPOINT_DIR, filename))
+    print("Done. Keep this file local. Do NOT upload confidential data anywhere.")
+
+
 # ---------- main pipeline ----------
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Clean the ANZHFR extract.")
+    parser.add_argument(
+        '--chunk-rows', type=int, default=None,
+        help="process the input in batches of this many rows (bounded memory)"
+    )
+    parser.add_argument(
+        '--impute', choices=IMPUTE_METHODS, default='knn',
+        help="'knn': exact KNNImputer; 'blocked': k-d tree KNN within strata (scales to large extracts)"
+    )
+    parser.add_argument(
+        '--impute-strata', default=','.join(IMPUTE_STRATA),
+        help="comma-separated columns the blocked imputation searches neighbours within ('' for none)"
+    )
+    parser.add_argument(
+        '--incremental', action='store_true',
+        help=f"keep per-stage checkpoints in {CHECKPOINT_DIR}/ and only redo what changed"
+    )
+    args = parser.parse_args(argv)
+    strata = [col for col in args.impute_strata.split(',') if col]
+    if args.incremental and args.chunk_rows:
+        parser.error("--incremental and --chunk-rows cannot be combined")
+    if args.incremental:
+        return main_incremental(args.impute, strata)
+    if args.chunk_rows:
+        return main_chunked(args.chunk_rows, args.impute, strata)
+
+    print("Python is looking in:", os.getcwd())
+    print("Files in this directory:", os.listdir())
     print("Starting local cleaning pipeline...")
     df = safe_read_csv(INPUT_CSV)
     backup_original(df)
@@ -639,12 +1301,7 @@ def main():
 
 
     # 2) Build datetime-like columns for each prefix you provided
-    prefixes = [
-        "tarrdatetime", "arrdatetime", "depdatetime", "admdatetimeop",
-        "sdatetime", "gdate", "wdisch", "hdisch"
-    ]
-    for p in prefixes:
-        df = build_datetime_from_parts(df, p)
+    df = build_datetimes(df)
     print("Constructed datetime-like columns (suffix _dt).")
 
 
@@ -658,7 +1315,7 @@ def main():
     print("Cleaned numeric ranges and bounds.")
 
     # 5) Apply KNN imputation for continuous variables
-    df = knn_impute_continuous(df, n_neighbors=5)
+    df = knn_impute_continuous(df, n_neighbors=5, method=args.impute, strata=strata)
     print("Applied KNN imputation for continuous variables.")
 
     # 6) Fill defaults and minor fixes
@@ -669,6 +1326,8 @@ def main():
     overview(df, "After cleaning")
     df.to_csv(OUTPUT_CSV, index=False)
     print(f">>> Cleaned file saved locally as: {OUTPUT_CSV}")
+    # Written after the CSV so the backend sees it as up to date
+    save_columnar(df)
     print("Done. Keep this file local. Do NOT upload confidential data anywhere.")
 
 
@@ -0,0 +1,84 @@
+import numpy as np
+
+# Outliers beyond this many are sampled down (evenly across their sorted
+# values, so the most extreme ones are always kept)
+MAX_OUTLIERS = 100
+
+# Whisker reach in IQRs, the same rule matplotlib's box plot uses
+WHISKER_IQR = 1.5
+
+
+def _histogram(values, start, stop, bin_width):
+    """
+    Counts per fixed-width bin over [start, stop); values outside the range
+    are counted in the first/last bin.
+    """
+    n_bins = max(1, int(np.ceil((stop - start) / bin_width)))
+    bins = np.floor((values - start) / bin_width).astype(np.int64)
+    np.clip(bins, 0, n_bins - 1, out=bins)
+    return {
+        'start': float(start),
+        'bin_width': float(bin_width),
+        'counts': np.bincount(bins, minlength=n_bins).tolist()
+    }
+
+
+def _sample_outliers(outliers, max_outliers):
+    outliers = np.sort(outliers)
+    if len(outliers) <= max_outliers:
+        return outliers
+    positions = np.unique(np.linspace(0, len(outliers) - 1, max_outliers).round().astype(np.int64))
+    return outliers[positions]
+
+
+def summarise_distribution(values, hist_range, bin_width, max_outliers=MAX_OUTLIERS):
+    """
+    Box plot summary of a numeric series, computed with vectorised NumPy:
+    quartiles, whiskers (furthest values within 1.5 x IQR of the box),
+    the outlier count with a bounded sample of outlier values, and a
+    fixed-bin histogram over hist_range = (start, stop).
+    The size of the result does not depend on the number of values.
+    Returns None if there are no values.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return None
+
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+    iqr = q3 - q1
+    low_fence = q1 - WHISKER_IQR * iqr
+    high_fence = q3 + WHISKER_IQR * iqr
+
+    inside = (values >= low_fence) & (values <= high_fence)
+    whislo = values[inside].min() if inside.any() else q1
+    whishi = values[inside].max() if inside.any() else q3
+    outliers = values[(values < whislo) | (values > whishi)]
+
+    return {
+        'count': int(len(values)),
+        'q1': float(q1),
+        'median': float(median),
+        'q3': float(q3),
+        'whislo': float(whislo),
+        'whishi': float(whishi),
+        'n_outliers': int(len(outliers)),
+        'outliers': _sample_outliers(outliers, max_outliers).tolist(),
+        'histogram': _histogram(values, hist_range[0], hist_range[1], bin_width)
+    }
+
+
+def bxp_stats(summary, label, mean=None):
+    """
+    Convert a distribution summary into the dict matplotlib's Axes.bxp draws.
+    """
+    return {
+        'label': label,
+        'whislo': summary['whislo'],
+        'q1': summary['q1'],
+        'med': summary['median'],
+        'q3': summary['q3'],
+        'whishi': summary['whishi'],
+        'fliers': summary['outliers'],
+        'mean': mean
+    }
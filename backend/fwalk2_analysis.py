@@ -4,55 +4,55 @@ matplotlib.use('Agg')  # Non-interactive backend for server-side rendering
 import matplotlib.pyplot as plt
 import base64
 from io import BytesIO
+from aggregation import register_analysis, run_analysis, value_counts
 
-def compute_fwalk2(df: pd.DataFrame):
+# Walking ability categories tracked, with the label each is counted under.
+# Note: We accept both "Walks without aids" (user prompt) and
+# "Walks without walking aids" (standard schema) to be safe.
+FWALK2_CATEGORIES = {
+    'Walks without walking aids': 'Walks without aids',
+    'Walks without aids': 'Walks without aids',
+    'Walks with either a stick or crutch': 'Walks with either a stick or crutch',
+    'Walks with two aids or frame': 'Walks with two aids or frame',
+    'Uses a wheelchair / bed bound': 'Uses a wheelchair / bed bound'
+}
+
+def summarise_fwalk2(aggregates: dict, total_patients: int, options=None):
     """
-    Compute counts for walking ability at 120 days (fwalk2).
-    Excludes 'Not recorded' or 'Not relevant' entries from the total count
-    for percentage calculations.
+    Build walking ability counts from the fwalk2 label counts.
+    Labels outside FWALK2_CATEGORIES ("Not recorded", "Not relevant", ...)
+    are excluded from the counts and from the valid total.
     """
-    if 'fwalk2' not in df.columns:
+    if 'fwalk2' not in aggregates:
         return {}
 
-    # Define the valid categories we want to track
-    # Note: We check for both "Walks without aids" (user prompt) and 
-    # "Walks without walking aids" (standard schema) to be safe.
-    valid_categories = [
-        'Walks without walking aids', 
-        'Walks without aids',
-        'Walks with either a stick or crutch', 
-        'Walks with two aids or frame', 
-        'Uses a wheelchair / bed bound'
-    ]
-
-    # Filter data to only include the specific categories (effectively excluding "Not recorded", "Not relevant", etc.)
-    df_clean = df[df['fwalk2'].isin(valid_categories)].copy()
-    
-    # Normalize 'Walks without walking aids' if there are naming variations
-    df_clean['fwalk2'] = df_clean['fwalk2'].replace('Walks without walking aids', 'Walks without aids')
-
-    counts = df_clean['fwalk2'].value_counts()
-    
-    # Calculate the valid total (excluding Not recorded/Not relevant)
-    valid_total = len(df_clean)
+    counts = {label: 0 for label in dict.fromkeys(FWALK2_CATEGORIES.values())}
+    for value, n in aggregates['fwalk2'].items():
+        if value in FWALK2_CATEGORIES:
+            counts[FWALK2_CATEGORIES[value]] += int(n)
 
     # Return raw counts and the valid total for context if needed
-    stats = {
-        'counts': {
-            'Walks without aids': int(counts.get('Walks without aids', 0)),
-            'Walks with either a stick or crutch': int(counts.get('Walks with either a stick or crutch', 0)),
-            'Walks with two aids or frame': int(counts.get('Walks with two aids or frame', 0)),
-            'Uses a wheelchair / bed bound': int(counts.get('Uses a wheelchair / bed bound', 0))
-        },
-        'valid_total': valid_total
+    return {
+        'counts': counts,
+        'valid_total': sum(counts.values())
     }
 
-    return stats
+def compute_fwalk2(df: pd.DataFrame):
+    """
+    Compute counts for walking ability at 120 days (fwalk2).
+    Excludes 'Not recorded' or 'Not relevant' entries from the total count
+    for percentage calculations.
+    """
+    return run_analysis('fwalk2', df)
 
-def generate_fwalk2_chart(stats: dict):
+# Pie colours, assigned in slice order
+FWALK2_COLORS = ['#50c878', '#4a90e2', '#f5a623', '#e24a4a']
+
+
+def _fwalk2_slices(stats: dict):
     """
-    Generate a pie chart for walking ability at 120 days.
-    Returns a data URI (base64 PNG) or None if insufficient data.
+    Non-zero walking ability slices with their short display labels.
+    Returns (display_labels, sizes) or None if there is nothing to plot.
     """
     counts = stats.get('counts', {})
     valid_total = stats.get('valid_total', 0)
@@ -80,10 +80,45 @@ def generate_fwalk2_chart(stats: dict):
     }
     display_labels = [short_labels.get(l, l) for l in labels]
 
+    return display_labels, list(sizes)
+
+
+def generate_fwalk2_chart_spec(stats: dict):
+    """
+    Describe the walking ability pie chart for client-side rendering.
+    Returns a dict, or None if insufficient data.
+    """
+    slices = _fwalk2_slices(stats)
+    if slices is None:
+        return None
+    display_labels, sizes = slices
+
+    return {
+        'type': 'pie',
+        'title': 'Walking Ability After 120 Days',
+        'subtitle': '(Excluding Not Recorded)',
+        'legend_title': 'Walking Ability',
+        'slices': [
+            {'label': l, 'value': s, 'color': c}
+            for l, s, c in zip(display_labels, sizes, FWALK2_COLORS)
+        ]
+    }
+
+
+def generate_fwalk2_chart(stats: dict):
+    """
+    Generate a pie chart for walking ability at 120 days.
+    Returns a data URI (base64 PNG) or None if insufficient data.
+    """
+    slices = _fwalk2_slices(stats)
+    if slices is None:
+        return None
+    display_labels, sizes = slices
+
     fig, ax = plt.subplots(figsize=(8, 6))
     
     # Define colors
-    colors = ['#50c878', '#4a90e2', '#f5a623', '#e24a4a']
+    colors = FWALK2_COLORS
     
     wedges, texts, autotexts = ax.pie(
         sizes, 
@@ -115,4 +150,17 @@ def generate_fwalk2_chart(stats: dict):
     img64 = base64.b64encode(buf.read()).decode('utf-8')
     plt.close(fig)
 
-    return f"data:image/png;base64,{img64}"
\ No newline at end of file
+    return f"data:image/png;base64,{img64}"
+
+
+register_analysis(
+    'fwalk2',
+    reducers={'fwalk2': value_counts('fwalk2')},
+    finalize=summarise_fwalk2,
+    chart={
+        'key': 'fwalk2_chart',
+        'png': generate_fwalk2_chart,
+        'spec': generate_fwalk2_chart_spec,
+        'blocked_by': ['fwalk2']
+    }
+)
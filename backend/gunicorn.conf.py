@@ -0,0 +1,21 @@
+# Production server configuration.
+# Run from the backend directory:  gunicorn -c gunicorn.conf.py
+#
+# The app is loaded once in the master process (preload_app) and forked into
+# the workers. The registry is attached from its memory-mapped column store
+# (see column_store.py), so all workers share one copy of it in the OS page
+# cache instead of each parsing the dataset.
+import multiprocessing
+import os
+
+os.environ.setdefault('SHARED_REGISTRY', '1')
+# Concurrency comes from the web workers; render charts in the request's own
+# worker rather than giving every worker a chart process pool
+os.environ.setdefault('CHART_WORKERS', '1')
+
+wsgi_app = 'main:app'
+bind = os.environ.get('BIND', '0.0.0.0:5050')
+workers = int(os.environ.get('WEB_CONCURRENCY', min(4, multiprocessing.cpu_count())))
+preload_app = True
+# Whole-registry PNG analyses can take a few seconds
+timeout = 120
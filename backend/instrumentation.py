@@ -0,0 +1,351 @@
+import collections
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Measure allocations with tracemalloc (adds noticeable overhead to every
+# allocation, so off by default: stages then report the change in RSS)
+TRACE_ALLOCATIONS = os.environ.get('ANALYSIS_TRACEMALLOC', '').lower() in ('1', 'true', 'yes')
+# Sampling profiler: seconds between stack samples, stacks kept in a report
+PROFILE_INTERVAL_SECONDS = 0.005
+PROFILE_TOP_STACKS = 50
+
+# Observations per label set that summaries compute their quantiles over
+SUMMARY_WINDOW = 1024
+SUMMARY_QUANTILES = (0.5, 0.95, 0.99)
+
+# Latency buckets (seconds) and memory buckets (bytes) of the histograms
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+MEMORY_BUCKETS = tuple(2**20 * 4**i for i in range(8))  # 1 MB .. 16 GB
+
+if TRACE_ALLOCATIONS and not tracemalloc.is_tracing():
+    tracemalloc.start()
+
+
+def rss_bytes():
+    """
+    Resident set size of this process (0 where /proc is not available).
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return 0
+
+
+# ---------- Prometheus-style metrics ----------
+# Each server process keeps its own metrics (scrape every worker, or run a
+# single worker, to see all traffic)
+
+_metrics = []
+_metrics_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        with _metrics_lock:
+            _metrics.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with _metrics_lock:
+            items = sorted((key, _snapshot(value)) for key, value in self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+
+def _snapshot(value):
+    # Copy mutable metric state so it can be rendered outside the lock
+    if isinstance(value, dict):
+        return {k: (list(v) if isinstance(v, (list, collections.deque)) else v) for k, v in value.items()}
+    return value
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _metrics_lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_label_text(self.labelnames, key)} {value}"]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=TIME_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _metrics_lock:
+            entry = self._values.setdefault(key, {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry['counts'][i] += 1
+            entry['sum'] += value
+            entry['count'] += 1
+
+    def _render_value(self, key, entry):
+        lines = [
+            f"{self.name}_bucket{_label_text(self.labelnames, key, [('le', bound)])} {n}"
+            for bound, n in zip(self.buckets, entry['counts'])
+        ]
+        lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, [('le', '+Inf')])} {entry['count']}")
+        lines.append(f"{self.name}_sum{_label_text(self.labelnames, key)} {entry['sum']}")
+        lines.append(f"{self.name}_count{_label_text(self.labelnames, key)} {entry['count']}")
+        return lines
+
+
+class Summary(_Metric):
+    """
+    Quantiles (p50/p95/p99) over the most recent SUMMARY_WINDOW observations
+    of each label set, plus the all-time sum and count.
+    """
+    kind = 'summary'
+
+    def __init__(self, name, documentation, labelnames=(), quantiles=SUMMARY_QUANTILES, window=SUMMARY_WINDOW):
+        super().__init__(name, documentation, labelnames)
+        self.quantiles = tuple(quantiles)
+        self.window = window
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _metrics_lock:
+            entry = self._values.setdefault(key, {'recent': collections.deque(maxlen=self.window), 'sum': 0.0, 'count': 0})
+            entry['recent'].append(value)
+            entry['sum'] += value
+            entry['count'] += 1
+
+    def quantile_values(self, **labels):
+        """
+        {quantile: value} over the recent observations of one label set.
+        """
+        with _metrics_lock:
+            entry = self._values.get(self._key(labels))
+            recent = sorted(entry['recent']) if entry else []
+        return {q: _quantile(recent, q) for q in self.quantiles}
+
+    def _render_value(self, key, entry):
+        recent = sorted(entry['recent'])
+        lines = [
+            f"{self.name}{_label_text(self.labelnames, key, [('quantile', q)])} {_quantile(recent, q)}"
+            for q in self.quantiles
+        ]
+        lines.append(f"{self.name}_sum{_label_text(self.labelnames, key)} {entry['sum']}")
+        lines.append(f"{self.name}_count{_label_text(self.labelnames, key)} {entry['count']}")
+        return lines
+
+
+def _quantile(ordered, q):
+    # Nearest rank; NaN without observations (as Prometheus clients report)
+    if not ordered:
+        return float('nan')
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def render_metrics():
+    """
+    All metrics in the Prometheus text exposition format.
+    """
+    with _metrics_lock:
+        metrics = list(_metrics)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    lines += [
+        "# HELP process_resident_memory_bytes Resident memory size in bytes.",
+        "# TYPE process_resident_memory_bytes gauge",
+        f"process_resident_memory_bytes {rss_bytes()}"
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+STAGE_SECONDS = Histogram(
+    'analysis_stage_seconds', 'Wall time of each cohort analysis stage.', ['stage'])
+STAGE_CPU_SECONDS = Counter(
+    'analysis_stage_cpu_seconds_total', 'CPU time spent in each cohort analysis stage.', ['stage'])
+STAGE_MEMORY_BYTES = Histogram(
+    'analysis_stage_memory_bytes',
+    'Memory allocated by each cohort analysis stage (tracemalloc peak, else RSS growth).',
+    ['stage'], buckets=MEMORY_BUCKETS)
+CHART_SECONDS = Histogram(
+    'analysis_chart_seconds', 'Wall time of building each chart.', ['chart', 'mode'])
+ANALYSES_TOTAL = Counter(
+    'analyses_total', 'Cohort analyses computed (cache misses).', ['chart_mode'])
+
+
+# ---------- per-analysis measurements ----------
+
+def _start_measurement():
+    start = {
+        'wall': time.perf_counter(),
+        'cpu': time.thread_time(),
+        'rss': rss_bytes(),
+        'traced': None
+    }
+    if tracemalloc.is_tracing():
+        # Peak since here; concurrent requests share the tracer, so this is
+        # an upper bound when analyses overlap
+        tracemalloc.reset_peak()
+        start['traced'] = tracemalloc.get_traced_memory()[0]
+    return start
+
+
+def _finish_measurement(start):
+    measurement = {
+        'wall_ms': round((time.perf_counter() - start['wall']) * 1000, 2),
+        'cpu_ms': round((time.thread_time() - start['cpu']) * 1000, 2),
+        'rss_delta_mb': round((rss_bytes() - start['rss']) / 2**20, 2)
+    }
+    if start['traced'] is not None and tracemalloc.is_tracing():
+        measurement['alloc_peak_mb'] = round((tracemalloc.get_traced_memory()[1] - start['traced']) / 2**20, 2)
+    return measurement
+
+
+def measured_call(func, *args):
+    """
+    Call func(*args) and return (result, measurement). Used for charts
+    rendered in worker processes, which measure themselves.
+    """
+    start = _start_measurement()
+    result = func(*args)
+    return result, _finish_measurement(start)
+
+
+def _memory_bytes(measurement):
+    if 'alloc_peak_mb' in measurement:
+        return measurement['alloc_peak_mb'] * 2**20
+    return max(measurement['rss_delta_mb'], 0) * 2**20
+
+
+class AnalysisTimings:
+    """
+    Wall time, CPU time (of the measuring thread) and memory of each stage
+    of one analysis, and of each chart. Every measurement is also recorded
+    in the process metrics (see render_metrics).
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = []
+        self.charts = {}
+        self.profile = None
+
+    @contextmanager
+    def stage(self, name):
+        start = _start_measurement()
+        try:
+            yield
+        finally:
+            self.record_stage(name, _finish_measurement(start))
+
+    def record_stage(self, name, measurement):
+        self.stages.append({'stage': name, **measurement})
+        STAGE_SECONDS.observe(measurement['wall_ms'] / 1000, stage=name)
+        STAGE_CPU_SECONDS.inc(measurement['cpu_ms'] / 1000, stage=name)
+        STAGE_MEMORY_BYTES.observe(_memory_bytes(measurement), stage=name)
+
+    def record_chart(self, key, mode, measurement):
+        self.charts[key] = {'mode': mode, **measurement}
+        CHART_SECONDS.observe(measurement['wall_ms'] / 1000, chart=key, mode=mode)
+
+    def report(self):
+        report = {
+            'total_ms': round((time.perf_counter() - self.started) * 1000, 2),
+            'stages': list(self.stages),
+            'charts': dict(self.charts)
+        }
+        if self.profile is not None:
+            report['profile'] = self.profile
+        return report
+
+
+# ---------- sampling profiler ----------
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread at a fixed interval from a background
+    thread and counts identical stacks. report() gives the most frequent
+    stacks in the collapsed "outer;...;inner" format used by flame graph
+    tools (flamegraph.pl, speedscope). Only that thread is seen: charts
+    rendered in worker processes are not sampled.
+    """
+
+    def __init__(self, thread_id=None, interval=PROFILE_INTERVAL_SECONDS):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.samples = collections.Counter()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+
+    def _run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._done.set()
+        self._thread.join()
+        return self.report()
+
+    def report(self, top=PROFILE_TOP_STACKS):
+        return {
+            'interval_ms': self.interval * 1000,
+            'samples': sum(self.samples.values()),
+            'stacks': [{'stack': stack, 'count': n} for stack, n in self.samples.most_common(top)]
+        }
+
+
+@contextmanager
+def profiled(timings, enabled=True):
+    """
+    Sample the calling thread while the block runs and attach the profile
+    to timings (a no-op unless enabled).
+    """
+    if not enabled:
+        yield
+        return
+    profiler = SamplingProfiler().start()
+    try:
+        yield
+    finally:
+        timings.profile = profiler.stop()
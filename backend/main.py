@@ -1,11 +1,25 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request, stream_with_context
 from flask_cors import CORS
 import pandas as pd
+import numpy as np
 import os
 import json
+from contextlib import contextmanager
 from datetime import datetime
 # Import local module when running as a script from the backend directory
-from cohort_analysis import analyse_cohort
+from cohort_analysis import ANALYSIS_COLUMNS, CHART_MODES, analyse_cohort, load_cohort_file
+from cohort_comparison import compare_cohorts
+from bitmap_index import build_bitmap_index
+from cohort_filters import CATEGORICAL_FILTERS, RANGE_FILTERS, cohort_count, cohort_mask, option_counts
+from registry import load_registry, load_shared_registry, memory_usage_mb
+from storage import columnar_path, remove_table
+from cohort_store import dataset_fingerprint, file_lock, load_row_set, row_set_path, save_row_set, select_rows
+from analysis_cache import cache_key, get_cached, invalidate_cohort, prune_other_versions, put_cached
+from analysis_jobs import forget_jobs, get_job, submit_job
+from cohort_export import EXPORT_FORMATS, ExportError, check_export, export_filename, stream_export
+from instrumentation import AnalysisTimings, profiled, render_metrics
+from request_metrics import install_request_metrics
+from response_encoding import analysis_etag, install_response_encoding, is_not_modified, not_modified, with_etag
 
 app = Flask(__name__)
 CORS(app, origins=["http://localhost:5173"])
@@ -14,34 +28,143 @@ CORS(app, origins=["http://localhost:5173"])
 DATA_PATH = "data/cleaned_anzhfr_full.csv"
 COHORTS_FILE = "data/saved_cohorts.json"
 COHORTS_DATA_DIR = "data/cohorts"
+# Most saved cohorts one comparison request may analyse
+COMPARE_MAX_COHORTS = 12
+# First part of the cache keys of cohort comparisons
+COMPARISON_KEY = "comparison"
+# Set by the production server config (gunicorn.conf.py): attach to the
+# memory-mapped column store so every worker shares one copy of the registry
+SHARED_REGISTRY = os.environ.get('SHARED_REGISTRY', '').lower() in ('1', 'true', 'yes')
 df = None
+bitmap_index = None
+dataset_version = None
 saved_cohorts = {}
+# Modification time of COHORTS_FILE when saved_cohorts was last read
+saved_cohorts_mtime = None
 
 # Create cohorts directory if it doesn't exist
 if not os.path.exists(COHORTS_DATA_DIR):
     os.makedirs(COHORTS_DATA_DIR)
 
 def load_data():
-    global df
+    global df, bitmap_index, dataset_version
     if os.path.exists(DATA_PATH):
-        df = pd.read_csv(DATA_PATH)
-        print(f"Loaded data: {df.shape[0]} rows, {df.shape[1]} columns")
+        dataset_version = dataset_fingerprint(DATA_PATH)
+        df = load_shared_registry(DATA_PATH, dataset_version) if SHARED_REGISTRY else load_registry(DATA_PATH)
+        print(f"Loaded data: {df.shape[0]} rows, {df.shape[1]} columns ({memory_usage_mb(df)} MB), version {dataset_version}")
     else:
         print(f"Warning: Data file not found at {DATA_PATH}")
         df = pd.DataFrame()
+        dataset_version = None
+    
+    # Cached analyses of any other dataset version are no longer valid
+    pruned = prune_other_versions(dataset_version)
+    if pruned:
+        print(f"Pruned {pruned} cached analyses of an older dataset")
+    
+    # Build the per-category bitmaps once so cohort counts never copy rows
+    bitmap_index = build_bitmap_index(df, CATEGORICAL_FILTERS, RANGE_FILTERS.keys())
+    print(f"Built bitmap index for {len(bitmap_index['columns'])} filter columns")
+
+def _cohorts_file_mtime():
+    return os.path.getmtime(COHORTS_FILE) if os.path.exists(COHORTS_FILE) else None
 
-def load_cohorts():
-    global saved_cohorts
+def load_cohorts(verbose=True):
+    global saved_cohorts, saved_cohorts_mtime
+    saved_cohorts_mtime = _cohorts_file_mtime()
     if os.path.exists(COHORTS_FILE):
         with open(COHORTS_FILE, 'r') as f:
             saved_cohorts = json.load(f)
-        print(f"Loaded {len(saved_cohorts)} saved cohorts")
+        if verbose:
+            print(f"Loaded {len(saved_cohorts)} saved cohorts")
     else:
         saved_cohorts = {}
 
 def save_cohorts():
-    with open(COHORTS_FILE, 'w') as f:
+    global saved_cohorts_mtime
+    # Temp file + rename, so other server processes never read a partial file
+    tmp_path = f"{COHORTS_FILE}.tmp"
+    with open(tmp_path, 'w') as f:
         json.dump(saved_cohorts, f, indent=2)
+    os.replace(tmp_path, COHORTS_FILE)
+    saved_cohorts_mtime = _cohorts_file_mtime()
+
+@contextmanager
+def updating_cohorts():
+    """
+    Read-modify-write of the saved cohorts under a file lock: reloads the
+    latest metadata (another worker may have changed it), runs the block,
+    then writes it back.
+    """
+    with file_lock(f"{COHORTS_FILE}.lock"):
+        load_cohorts(verbose=False)
+        yield saved_cohorts
+        save_cohorts()
+
+@app.before_request
+def refresh_cohorts():
+    # With several server processes, pick up cohorts saved/deleted by the others
+    if _cohorts_file_mtime() != saved_cohorts_mtime:
+        load_cohorts(verbose=False)
+
+def cohort_data_path(cohort):
+    # Cohorts saved before columnar storage only recorded a csv_path
+    return cohort.get('data_path') or cohort.get('csv_path')
+
+def cohort_data_exists(cohort):
+    rows_path = cohort.get('rows_path')
+    if rows_path:
+        return os.path.exists(rows_path)
+    data_path = cohort_data_path(cohort)
+    return bool(data_path) and (os.path.exists(data_path) or os.path.exists(columnar_path(data_path)))
+
+def cohort_row_ids(cohort):
+    """
+    Registry row positions of a cohort saved as a row set.
+    If the cleaned dataset changed since the cohort was saved, the rows are
+    rebuilt from the cohort's saved filters and the row set is rewritten.
+    """
+    row_ids, n_rows, version = load_row_set(cohort['rows_path'])
+    if version != dataset_version or n_rows != len(df):
+        print(f"Dataset changed since cohort {cohort['id']} was saved - rebuilding its rows from filters")
+        mask = cohort_mask(df, bitmap_index, cohort.get('filters') or {})
+        save_row_set(cohort['rows_path'], mask, dataset_version)
+        cohort['dataset_version'] = dataset_version
+        with updating_cohorts() as cohorts:
+            if cohort['id'] in cohorts:
+                cohorts[cohort['id']]['dataset_version'] = dataset_version
+        row_ids = np.flatnonzero(mask)
+    return row_ids
+
+def load_cohort_data(cohort, columns=ANALYSIS_COLUMNS):
+    """
+    Materialise a saved cohort's rows: row-set cohorts are taken lazily from
+    the in-memory registry, older cohorts are read from their data file.
+    """
+    if cohort.get('rows_path'):
+        return select_rows(df, cohort_row_ids(cohort), columns)
+    return load_cohort_file(cohort_data_path(cohort))
+
+def request_filters():
+    """
+    Cohort filters carried by the current request (for the request metrics),
+    or None for routes without filters.
+    """
+    rule = request.url_rule.rule if request.url_rule is not None else None
+    if rule in ('/api/cohort', '/api/cohort/counts'):
+        return request.get_json(silent=True) or {}
+    if rule == '/api/cohorts' and request.method == 'POST':
+        return (request.get_json(silent=True) or {}).get('filters') or {}
+    if rule in ('/api/cohorts/<cohort_id>/analyse', '/api/cohorts/<cohort_id>/analyse/jobs'):
+        cohort = saved_cohorts.get(request.view_args.get('cohort_id'))
+        return (cohort.get('filters') or {}) if cohort else None
+    return None
+
+# Latency, response size and filter metrics per route, plus the slow-request log
+install_request_metrics(app, request_filters)
+# Arrow IPC / gzip / brotli responses as the client accepts (after the
+# metrics, so they record the encoded sizes)
+install_response_encoding(app)
 
 # Load data on startup
 load_data()
@@ -53,34 +176,8 @@ def build_cohort():
         filters = request.json
         print(f"Received filters: {filters}")
         
-        # Start with full dataset
-        filtered_df = df.copy()
-        
-        # Apply age filters
-        if filters.get('minAge') and filters['minAge'] != '':
-            min_age = float(filters['minAge'])
-            filtered_df = filtered_df[filtered_df['age'] >= min_age]
-        
-        if filters.get('maxAge') and filters['maxAge'] != '':
-            max_age = float(filters['maxAge'])
-            filtered_df = filtered_df[filtered_df['age'] <= max_age]
-        
-        # Apply categorical filters - iterate through all possible filter fields
-        categorical_filters = [
-            'sex', 'ptype', 'uresidence', 'walk', 'cogstat', 'frailty', 
-            'addelassess', 'ftype', 'afracture', 'asa', 'e_dadmit', 
-            'painassess', 'painmanage', 'analges', 'surg', 'delay', 
-            'anaesth', 'wbear', 'ward', 'gerimed', 'delassess', 'fassess',
-            'pulcers', 'mobil', 'bonemed', 'dbonemed1', 'malnutrition', 
-            'ons', 'wdest', 'fwalk2', 'dresidence', 'fbonemed2', 'fop2'
-        ]
-        
-        for filter_key in categorical_filters:
-            filter_values = filters.get(filter_key)
-            if filter_values and len(filter_values) > 0 and filter_key in filtered_df.columns:
-                filtered_df = filtered_df[filtered_df[filter_key].isin(filter_values)]
-        
-        count = len(filtered_df)
+        # AND/OR the precomputed category bitmaps instead of copying the dataset
+        count = cohort_count(df, bitmap_index, filters)
         print(f"Cohort size: {count}")
         
         return jsonify({
@@ -94,6 +191,25 @@ def build_cohort():
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
+@app.route("/api/cohort/counts", methods=['POST'])
+def live_counts():
+    """Current cohort size plus the size each filter option would give if toggled"""
+    try:
+        filters = request.json or {}
+        counts = option_counts(df, bitmap_index, filters)
+        
+        return jsonify({
+            "count": counts['count'],
+            "options": counts['options'],
+            "filters": filters
+        })
+    
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
 @app.route("/api/cohorts", methods=['GET'])
 def get_cohorts():
     """Get all saved cohorts"""
@@ -111,52 +227,29 @@ def save_cohort():
         if not cohort_name:
             return jsonify({"error": "Cohort name is required"}), 400
         
-        # Generate unique ID
-        cohort_id = f"cohort_{len(saved_cohorts) + 1}_{datetime.now().strftime('%Y%m%d%H%M%S')}"
-        
-        # Re-apply filters to get the actual filtered data
-        filtered_df = df.copy()
-        
-        # Apply age filters
-        if filters.get('minAge') and filters['minAge'] != '':
-            min_age = float(filters['minAge'])
-            filtered_df = filtered_df[filtered_df['age'] >= min_age]
-        
-        if filters.get('maxAge') and filters['maxAge'] != '':
-            max_age = float(filters['maxAge'])
-            filtered_df = filtered_df[filtered_df['age'] <= max_age]
-        
-        # Apply categorical filters
-        categorical_filters = [
-            'sex', 'ptype', 'uresidence', 'walk', 'cogstat', 'frailty', 
-            'addelassess', 'ftype', 'afracture', 'asa', 'e_dadmit', 
-            'painassess', 'painmanage', 'analges', 'surg', 'delay', 
-            'anaesth', 'wbear', 'ward', 'gerimed', 'delassess', 'fassess',
-            'pulcers', 'mobil', 'bonemed', 'dbonemed1', 'malnutrition', 
-            'ons', 'wdest', 'fwalk2', 'dresidence', 'fbonemed2', 'fop2'
-        ]
-        
-        for filter_key in categorical_filters:
-            filter_values = filters.get(filter_key)
-            if filter_values and len(filter_values) > 0 and filter_key in filtered_df.columns:
-                filtered_df = filtered_df[filtered_df[filter_key].isin(filter_values)]
-        
-        # Save the filtered data to CSV
-        csv_path = os.path.join(COHORTS_DATA_DIR, f"{cohort_id}.csv")
-        filtered_df.to_csv(csv_path, index=False)
-        print(f"Saved cohort data to: {csv_path} ({len(filtered_df)} rows)")
-        
-        # Save metadata
-        saved_cohorts[cohort_id] = {
-            "id": cohort_id,
-            "name": cohort_name,
-            "filters": filters,
-            "count": count,
-            "csv_path": csv_path,
-            "created_at": datetime.now().isoformat()
-        }
+        # Re-apply filters to find the matching registry rows
+        mask = cohort_mask(df, bitmap_index, filters)
+        
+        with updating_cohorts() as cohorts:
+            # Generate unique ID
+            cohort_id = f"cohort_{len(cohorts) + 1}_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+            
+            # Persist the rows as a compressed row set
+            rows_path = row_set_path(COHORTS_DATA_DIR, cohort_id)
+            n_rows = save_row_set(rows_path, mask, dataset_version)
+            print(f"Saved cohort rows to: {rows_path} ({n_rows} rows)")
+            
+            # Save metadata
+            cohorts[cohort_id] = {
+                "id": cohort_id,
+                "name": cohort_name,
+                "filters": filters,
+                "count": count,
+                "rows_path": rows_path,
+                "dataset_version": dataset_version,
+                "created_at": datetime.now().isoformat()
+            }
         
-        save_cohorts()
         print(f"Saved cohort: {cohort_name} ({count} patients)")
         
         return jsonify(saved_cohorts[cohort_id])
@@ -171,17 +264,26 @@ def save_cohort():
 def delete_cohort(cohort_id):
     """Delete a saved cohort"""
     try:
-        if cohort_id in saved_cohorts:
-            cohort_name = saved_cohorts[cohort_id]['name']
+        with updating_cohorts() as cohorts:
+            cohort = cohorts.pop(cohort_id, None)
+        
+        if cohort is not None:
+            cohort_name = cohort['name']
             
-            # Delete the CSV file if it exists
-            csv_path = saved_cohorts[cohort_id].get('csv_path')
-            if csv_path and os.path.exists(csv_path):
-                os.remove(csv_path)
-                print(f"Deleted CSV file: {csv_path}")
+            # Delete the cohort row set, or the data file (and any columnar copy) of older cohorts
+            rows_path = cohort.get('rows_path')
+            if rows_path and os.path.exists(rows_path):
+                os.remove(rows_path)
+                print(f"Deleted row set: {rows_path}")
+            data_path = cohort_data_path(cohort)
+            if data_path:
+                for removed_path in remove_table(data_path):
+                    print(f"Deleted data file: {removed_path}")
             
-            del saved_cohorts[cohort_id]
-            save_cohorts()
+            invalidate_cohort(cohort_id)
+            # Comparisons are keyed by a hash of all their cohorts, so forget them all
+            invalidate_cohort(COMPARISON_KEY)
+            forget_jobs(lambda job_id: job_id.split('__')[0] == cohort_id)
             print(f"Deleted cohort: {cohort_name}")
             return jsonify({"success": True, "message": f"Deleted cohort: {cohort_name}"})
         else:
@@ -191,32 +293,139 @@ def delete_cohort(cohort_id):
         print(f"Error deleting cohort: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
-@app.route("/api/cohorts/<cohort_id>/analyse", methods=['POST'])
-def analyse_cohort_endpoint(cohort_id):
-    """Analyse a saved cohort"""
+@app.route("/api/cohorts/<cohort_id>/export", methods=['GET'])
+def export_cohort(cohort_id):
+    """Download a saved cohort's rows.
+    ?format=csv (default), parquet or arrow (Arrow IPC stream)
+    ?columns=a,b,c exports only those columns (default: all)
+    ?compression=gzip or zstd
+    The file is streamed chunk by chunk from the registry."""
     try:
         if cohort_id not in saved_cohorts:
             return jsonify({"error": "Cohort not found"}), 404
-        
         cohort = saved_cohorts[cohort_id]
-        csv_path = cohort.get('csv_path')
-        # RETRIEVE FILTERS
-        cohort_filters = cohort.get('filters', {}) 
-        
-        if not csv_path or not os.path.exists(csv_path):
+        if not cohort_data_exists(cohort):
             return jsonify({"error": "Cohort data file not found"}), 404
         
+        fmt = request.args.get('format', 'csv')
+        compression = request.args.get('compression') or None
+        columns = [c for c in request.args.get('columns', '').split(',') if c]
+        
+        if cohort.get('rows_path'):
+            source, row_ids = df, cohort_row_ids(cohort)
+        else:
+            # Cohorts saved before row sets carry their own data file
+            source = load_cohort_file(cohort_data_path(cohort))
+            row_ids = np.arange(len(source))
+        
+        try:
+            columns = check_export(source, fmt, compression, columns)
+        except ExportError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        filename = export_filename(cohort_id, fmt, compression)
+        print(f"Exporting cohort: {cohort['name']} ({len(row_ids)} rows, {len(columns)} columns) as {filename}")
+        return Response(
+            stream_with_context(stream_export(source, row_ids, columns, fmt, compression)),
+            mimetype=EXPORT_FORMATS[fmt][1],
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+        )
+    
+    except Exception as e:
+        print(f"Error exporting cohort: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+def parse_analysis_request(cohort_id):
+    """
+    Validate an analysis request for a saved cohort.
+    Returns (cohort, chart_mode, include_raw, cache key) and None, or None
+    and an error response.
+    """
+    if cohort_id not in saved_cohorts:
+        return None, (jsonify({"error": "Cohort not found"}), 404)
+    
+    chart_mode = request.args.get('charts', 'png')
+    if chart_mode not in CHART_MODES:
+        return None, (jsonify({"error": f"Unknown chart mode: {chart_mode}"}), 400)
+    include_raw = request.args.get('raw', '').lower() in ('1', 'true', 'yes')
+    
+    cohort = saved_cohorts[cohort_id]
+    if not cohort_data_exists(cohort):
+        return None, (jsonify({"error": "Cohort data file not found"}), 404)
+    
+    # Saved cohorts are immutable, so a cached analysis stays valid until the
+    # cohort is deleted or the cleaned dataset changes
+    variant = '' if chart_mode == 'png' else chart_mode
+    if include_raw:
+        variant += 'raw'
+    key = cache_key(cohort_id, cohort.get('filters', {}), dataset_version, variant=variant)
+    return (cohort, chart_mode, include_raw, key), None
+
+def run_cohort_analysis(cohort, chart_mode, include_raw, key, progress=None, profile=False):
+    """
+    Analyse a saved cohort and cache the results.
+    progress(partial_results, stage) receives the statistics as soon as they
+    are ready and each chart as it is rendered.
+    The results carry a 'timings' block (per stage and chart, see
+    instrumentation.py), plus a sampled profile of the analysis if profile
+    is set; timings describe this computation and are not cached.
+    """
+    metadata = {'cohort_name': cohort['name'], 'created_at': cohort['created_at']}
+    
+    def report(partial, stage):
+        progress({**partial, **metadata}, stage)
+    
+    timings = AnalysisTimings()
+    with profiled(timings, profile):
+        with timings.stage('load'):
+            cohort_df = load_cohort_data(cohort)
+        
         # PASS FILTERS TO ANALYSIS
-        analysis_results = analyse_cohort(cohort_id, csv_path, cohort_filters)
+        analysis_results = analyse_cohort(
+            cohort['id'], cohort_df, cohort.get('filters', {}),
+            chart_mode, include_raw, progress=report if progress else None, timings=timings
+        )
+    analysis_results['timings'] = timings.report()
+    
+    # Add cohort metadata
+    analysis_results.update(metadata)
+    put_cached(key, {k: v for k, v in analysis_results.items() if k != 'timings'})
+    
+    print(f"Analysed cohort: {cohort['name']}")
+    return analysis_results
+
+@app.route("/api/cohorts/<cohort_id>/analyse", methods=['GET', 'POST'])
+def analyse_cohort_endpoint(cohort_id):
+    """Analyse a saved cohort.
+    ?charts=spec returns chart specs for the frontend to draw; the default
+    (png) returns rendered images, e.g. for export.
+    ?raw=1 adds the per-patient values behind the distribution summaries.
+    ?profile=1 recomputes the analysis (bypassing the cache) under the
+    sampling profiler and adds the hottest stacks to the timings block.
+    Responses carry an ETag (saved-cohort analyses never change), so a
+    client sending it back in If-None-Match gets 304 Not Modified."""
+    try:
+        params, error = parse_analysis_request(cohort_id)
+        if error:
+            return error
+        cohort, chart_mode, include_raw, key = params
+        profile = request.args.get('profile', '').lower() in ('1', 'true', 'yes')
+        
+        etag = analysis_etag(key)
+        if not profile and is_not_modified(etag):
+            return not_modified(etag)
         
-        # Add cohort metadata
-        analysis_results['cohort_name'] = cohort['name']
-        analysis_results['created_at'] = cohort['created_at']
+        cached_results = None if profile else get_cached(key)
+        if cached_results is not None:
+            print(f"Served cached analysis: {cohort['name']}")
+            return with_etag(jsonify(cached_results), etag)
         
-        print(f"Analysed cohort: {cohort['name']}")
+        analysis_results = run_cohort_analysis(cohort, chart_mode, include_raw, key, profile=profile)
+        # Stage breakdown for the slow-request log
+        g.analysis_timings = analysis_results.get('timings')
         print(f"Enhanced metrics in results: {analysis_results.get('enhanced_metrics', 'NOT FOUND')}")
         
-        return jsonify(analysis_results)
+        return with_etag(jsonify(analysis_results), etag)
     
     except Exception as e:
         print(f"Error analysing cohort: {str(e)}")
@@ -224,5 +433,155 @@ def analyse_cohort_endpoint(cohort_id):
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
+@app.route("/api/cohorts/<cohort_id>/analyse/jobs", methods=['POST'])
+def submit_analysis_job(cohort_id):
+    """Start analysing a saved cohort in the background.
+    Takes the same query parameters as /analyse and returns a job to poll at
+    /api/analysis-jobs/<job_id>. A request identical to one already running
+    joins that job instead of starting another; a cached analysis comes
+    back as a finished job.
+    ?results=0 leaves the results out of a finished job, for clients that
+    fetch them from the job URL (which their HTTP cache can revalidate)."""
+    try:
+        params, error = parse_analysis_request(cohort_id)
+        if error:
+            return error
+        cohort, chart_mode, include_raw, key = params
+        with_results = request.args.get('results', '1').lower() not in ('0', 'false', 'no')
+        
+        # The cache key doubles as the job ID, so identical requests coalesce
+        cached_results = get_cached(key)
+        if cached_results is not None:
+            return jsonify({
+                "job_id": key, "status": "done", "stage": "done",
+                "results": cached_results if with_results else None, "error": None
+            })
+        
+        job = submit_job(key, lambda progress: run_cohort_analysis(cohort, chart_mode, include_raw, key, progress))
+        print(f"Analysis job {job['status']}: {cohort['name']}")
+        return jsonify(job), 202
+    
+    except Exception as e:
+        print(f"Error submitting analysis job: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/analysis-jobs/<job_id>", methods=['GET'])
+def get_analysis_job(job_id):
+    """Status of an analysis job: queued, running (with the statistics and
+    any charts rendered so far), done (with the full results) or failed.
+    A finished job has an ETag: its results never change."""
+    try:
+        # Jobs belong to a saved cohort (the ID starts with the cohort ID)
+        if job_id.split('__')[0] not in saved_cohorts:
+            return jsonify({"error": "Job not found"}), 404
+        
+        # The job ID is the analysis cache key
+        etag = analysis_etag(job_id)
+        if is_not_modified(etag):
+            return not_modified(etag)
+        
+        job = get_job(job_id)
+        if job is None:
+            # Expired (or finished in another process): the results are cached
+            cached_results = get_cached(job_id)
+            if cached_results is None:
+                return jsonify({"error": "Job not found"}), 404
+            job = {"job_id": job_id, "status": "done", "stage": "done", "results": cached_results, "error": None}
+        
+        if job['status'] == 'done':
+            return with_etag(jsonify(job), etag)
+        response = jsonify(job)
+        # Partial results must not be cached
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    
+    except Exception as e:
+        print(f"Error reading analysis job: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+def parse_comparison_request():
+    """
+    Validate a cohort comparison request: the cohort IDs come from the JSON
+    body ({"cohort_ids": [...]}) or, for GET, ?cohorts=a,b,c.
+    Returns (cohorts, chart_mode, cache key) and None, or None and an error
+    response.
+    """
+    if request.method == 'POST':
+        cohort_ids = (request.get_json(silent=True) or {}).get('cohort_ids') or []
+    else:
+        cohort_ids = [c for c in request.args.get('cohorts', '').split(',') if c]
+    if not isinstance(cohort_ids, list) or not cohort_ids:
+        return None, (jsonify({"error": "cohort_ids must list at least one saved cohort"}), 400)
+    cohort_ids = list(dict.fromkeys(str(c) for c in cohort_ids))
+    if len(cohort_ids) > COMPARE_MAX_COHORTS:
+        return None, (jsonify({"error": f"At most {COMPARE_MAX_COHORTS} cohorts can be compared at once"}), 400)
+    
+    chart_mode = request.args.get('charts', 'spec')
+    if chart_mode not in CHART_MODES:
+        return None, (jsonify({"error": f"Unknown chart mode: {chart_mode}"}), 400)
+    
+    missing = [c for c in cohort_ids if c not in saved_cohorts]
+    if missing:
+        return None, (jsonify({"error": f"Cohort not found: {', '.join(missing)}"}), 404)
+    cohorts = [saved_cohorts[c] for c in cohort_ids]
+    for cohort in cohorts:
+        if not cohort_data_exists(cohort):
+            return None, (jsonify({"error": f"Cohort data file not found: {cohort['id']}"}), 404)
+    
+    filters = [[cohort['id'], cohort.get('filters', {})] for cohort in cohorts]
+    key = cache_key(COMPARISON_KEY, filters, dataset_version, variant=chart_mode)
+    return (cohorts, chart_mode, key), None
+
+@app.route("/api/cohorts/compare", methods=['GET', 'POST'])
+def compare_cohorts_endpoint():
+    """Analyse several saved cohorts side by side.
+    Every analysis is computed for all the cohorts in one grouped pass over
+    the registry, and the response holds a comparison table (one row per
+    metric, one value per cohort), each cohort's statistics and combined
+    comparison charts (?charts=spec, the default, or png).
+    Like /analyse, responses are cached and carry an ETag."""
+    try:
+        params, error = parse_comparison_request()
+        if error:
+            return error
+        cohorts, chart_mode, key = params
+        
+        etag = analysis_etag(key)
+        if is_not_modified(etag):
+            return not_modified(etag)
+        
+        cached_results = get_cached(key)
+        if cached_results is not None:
+            print(f"Served cached comparison of {len(cohorts)} cohorts")
+            return with_etag(jsonify(cached_results), etag)
+        
+        timings = AnalysisTimings()
+        with timings.stage('load'):
+            # Row-set cohorts stay as registry row positions; older cohorts
+            # are read from their data file
+            row_sets = [
+                cohort_row_ids(cohort) if cohort.get('rows_path') else load_cohort_file(cohort_data_path(cohort))
+                for cohort in cohorts
+            ]
+        results = compare_cohorts(df, cohorts, row_sets, chart_mode, timings=timings)
+        put_cached(key, {k: v for k, v in results.items() if k != 'timings'})
+        # Stage breakdown for the slow-request log
+        g.analysis_timings = results['timings']
+        
+        print(f"Compared cohorts: {', '.join(cohort['name'] for cohort in cohorts)}")
+        return with_etag(jsonify(results), etag)
+    
+    except Exception as e:
+        print(f"Error comparing cohorts: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/metrics", methods=['GET'])
+def metrics():
+    """Analysis stage, chart and memory metrics of this server process in
+    the Prometheus text format."""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == "__main__":
     app.run(debug=True, port=5050)
\ No newline at end of file
@@ -4,37 +4,47 @@ matplotlib.use('Agg')  # Non-interactive backend for server-side rendering
 import matplotlib.pyplot as plt
 import base64
 from io import BytesIO
+from aggregation import register_analysis, run_analysis, value_counts
 
-def compute_mortality(df: pd.DataFrame):
+# Timeframe key -> mortality status column
+MORTALITY_COLUMNS = {
+    '30_day': 'mort30d',
+    '90_day': 'mort90d',
+    '120_day': 'mort120d',
+    '365_day': 'mort365d',
+}
+
+def summarise_mortality(aggregates: dict, total_patients: int, options=None):
     """
-    Compute mortality counts/rates for timeframes present in the dataset.
-    Expects columns: mort30d, mort90d, mort120d, mort365d with values 'Alive'/'Deceased'.
-    Returns dict with counts and rates.
+    Build mortality counts/rates from the per-column status counts.
+    Timeframes whose column is not in the dataset are None.
     """
-    total_patients = len(df)
-
-    def calc(col):
-        if col in df.columns:
-            deceased = (df[col] == 'Deceased').sum()
+    def calc(key):
+        if key in aggregates:
+            deceased = aggregates[key].get('Deceased', 0)
             return {
                 'count': int(deceased),
                 'rate': float(deceased / total_patients * 100) if total_patients > 0 else 0.0
             }
         return None
 
-    return {
-        '30_day': calc('mort30d'),
-        '90_day': calc('mort90d'),
-        '120_day': calc('mort120d'),
-        '365_day': calc('mort365d'),
-        'total_patients': total_patients,
-    }
+    stats = {key: calc(key) for key in MORTALITY_COLUMNS}
+    stats['total_patients'] = total_patients
+    return stats
+
+def compute_mortality(df: pd.DataFrame):
+    """
+    Compute mortality counts/rates for timeframes present in the dataset.
+    Expects columns: mort30d, mort90d, mort120d, mort365d with values 'Alive'/'Deceased'.
+    Returns dict with counts and rates.
+    """
+    return run_analysis('mortality', df)
 
 
-def generate_mortality_chart(mortality: dict):
+def _mortality_series(mortality: dict):
     """
-    Generate a grouped bar chart (Alive vs Deceased) for each timeframe.
-    Returns a data URI (base64 PNG) or None if insufficient data.
+    Alive/Deceased counts per timeframe present in the mortality stats.
+    Returns (frames, alive_counts, deceased_counts).
     """
     total_patients = mortality.get('total_patients', 0)
 
@@ -55,6 +65,41 @@ def generate_mortality_chart(mortality: dict):
     add_frame('120-day', '120_day')
     add_frame('365-day', '365_day')
 
+    return frames, alive_counts, deceased_counts
+
+
+def generate_mortality_chart_spec(mortality: dict):
+    """
+    Describe the mortality chart (series, labels, colours) for client-side rendering.
+    Returns a dict, or None if insufficient data.
+    """
+    frames, alive_counts, deceased_counts = _mortality_series(mortality)
+
+    if not frames:
+        return None
+
+    return {
+        'type': 'stacked_bar',
+        'title': 'Mortality Status Across Time Frames',
+        'x_label': 'Time Frame',
+        'y_label': 'Number of Patients',
+        'categories': frames,
+        'series': [
+            {'name': 'Alive', 'values': alive_counts, 'color': '#4a90e2', 'label_color': '#173a5e'},
+            {'name': 'Deceased', 'values': deceased_counts, 'color': '#e24a4a', 'label_color': '#7a1f1f'}
+        ],
+        'show_totals': True
+    }
+
+
+def generate_mortality_chart(mortality: dict):
+    """
+    Generate a grouped bar chart (Alive vs Deceased) for each timeframe.
+    Returns a data URI (base64 PNG) or None if insufficient data.
+    """
+    total_patients = mortality.get('total_patients', 0)
+    frames, alive_counts, deceased_counts = _mortality_series(mortality)
+
     if not frames:
         return None
 
@@ -91,3 +136,15 @@ def generate_mortality_chart(mortality: dict):
     plt.close(fig)
 
     return f"data:image/png;base64,{img64}"
+
+
+register_analysis(
+    'mortality',
+    reducers={key: value_counts(col) for key, col in MORTALITY_COLUMNS.items()},
+    finalize=summarise_mortality,
+    chart={
+        'key': 'mortality_chart',
+        'png': generate_mortality_chart,
+        'spec': generate_mortality_chart_spec
+    }
+)
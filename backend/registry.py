@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+# Value-label maps live with the cleaning pipeline so both sides agree on labels
+from data.cleaning import MAPPING_PAIRS, label_categories
+from storage import read_table
+from column_store import column_store_root, open_column_store, prune_column_stores, write_column_store
+
+# Continuous clinical measures are kept as float64 so the summary statistics
+# (means, medians, rounding) match what the analyses computed from the CSV
+FLOAT64_COLUMNS = {
+    'age',
+    'los_hospital_days',
+    'los_acute_ward_days',
+    'time_to_surgery_hrs',
+    'transfer_to_operating_days'
+}
+
+# Object columns with at most this share of distinct values become categories
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+
+def category_schema():
+    """
+    Column -> ordered category labels, built from the cleaning.py value-label maps.
+    """
+    return {col: label_categories(mdict) for col, mdict in MAPPING_PAIRS}
+
+
+def _to_schema_categorical(series, labels):
+    """
+    Convert a column to a categorical whose categories follow the value-label
+    order, keeping any unexpected labels found in the data at the end.
+    """
+    series = series.astype('category')
+    extra = [c for c in series.cat.categories if c not in labels]
+    return series.cat.set_categories(labels + extra)
+
+
+def _is_imputation_flag(col):
+    return col.endswith('_was_missing') or col == 'n_imputed_fields'
+
+
+def apply_schema(df: pd.DataFrame):
+    """
+    Convert a cleaned registry frame to its compact in-memory representation:
+    - labelled columns -> category dtype ordered like the value-label maps
+    - imputation flags and counts -> int8
+    - *_dt columns -> datetime64
+    - other numeric columns -> smallest integer/float type that holds them
+    - low-cardinality text columns -> category
+    Modifies and returns df.
+    """
+    schema = category_schema()
+
+    for col in df.columns:
+        series = df[col]
+
+        if col in schema:
+            df[col] = _to_schema_categorical(series, schema[col])
+        elif _is_imputation_flag(col):
+            df[col] = pd.to_numeric(series, errors='coerce').fillna(0).astype(np.int8)
+        elif col.endswith('_dt'):
+            df[col] = pd.to_datetime(series, errors='coerce')
+        elif pd.api.types.is_integer_dtype(series):
+            df[col] = pd.to_numeric(series, downcast='integer')
+        elif pd.api.types.is_float_dtype(series):
+            if col in FLOAT64_COLUMNS:
+                continue
+            # Whole-number columns without gaps (e.g. day offsets) fit in an integer type
+            values = series.to_numpy()
+            if not np.isnan(values).any() and np.array_equal(values, np.round(values)):
+                df[col] = pd.to_numeric(series.astype(np.int64), downcast='integer')
+            else:
+                df[col] = pd.to_numeric(series, downcast='float')
+        elif (pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)) and len(series) > 0:
+            if series.nunique(dropna=True) <= len(series) * CATEGORY_MAX_UNIQUE_RATIO:
+                df[col] = series.astype('category')
+
+    return df
+
+
+def _read_registry_csv(path):
+    """
+    Parse the cleaned registry CSV with labelled columns read straight to
+    category, so the long label strings are never one Python object per row.
+    """
+    schema = category_schema()
+    return apply_schema(pd.read_csv(path, dtype={col: 'category' for col in schema}))
+
+
+def load_registry(path, columns=None):
+    """
+    Read the cleaned registry with the typed schema applied.
+    Uses the columnar (Feather) copy when it is current and migrates the
+    CSV to it otherwise; columns limits the read to the listed columns.
+    """
+    df = read_table(path, columns=columns, csv_reader=_read_registry_csv)
+    return apply_schema(df)
+
+
+def load_shared_registry(path, dataset_version):
+    """
+    Attach to the memory-mapped column store of this dataset version,
+    building it from the cleaned registry first if it does not exist yet.
+    Every process that attaches shares the same pages, so N server workers
+    hold one copy of the registry rather than N. The columns are read-only.
+    """
+    root = column_store_root(path)
+    df = open_column_store(root, dataset_version)
+    if df is None:
+        write_column_store(load_registry(path), root, dataset_version)
+        prune_column_stores(root, dataset_version)
+        df = open_column_store(root, dataset_version)
+    return df
+
+
+def memory_usage_mb(df: pd.DataFrame):
+    """
+    Deep memory footprint of a dataframe in megabytes.
+    """
+    return round(df.memory_usage(deep=True).sum() / (1024 * 1024), 1)
@@ -0,0 +1,112 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from flask import g, request
+from cohort_filters import filter_cardinality
+from instrumentation import TIME_BUCKETS, Histogram, Summary
+
+# Requests slower than this are written to the slow-request log (0 logs every request)
+SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_SECONDS', 1.0))
+# One JSON object per line; empty disables the log file
+SLOW_REQUEST_LOG = os.environ.get('SLOW_REQUEST_LOG', "data/slow_requests.jsonl")
+
+SIZE_BUCKETS = tuple(2**10 * 4**i for i in range(10))  # 1 KB .. 256 MB
+CARDINALITY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Latency of API requests.', ['route', 'method', 'status'],
+    buckets=TIME_BUCKETS)
+REQUEST_LATENCY = Summary(
+    'http_request_latency_seconds', 'Recent p50/p95/p99 latency of API requests.', ['route', 'method'])
+RESPONSE_BYTES = Histogram(
+    'http_response_size_bytes', 'Size of API response bodies (streamed responses are not counted).',
+    ['route', 'method'], buckets=SIZE_BUCKETS)
+FILTER_FIELDS = Histogram(
+    'cohort_filter_fields', 'Active cohort builder filters per request.', ['route'],
+    buckets=CARDINALITY_BUCKETS)
+FILTER_VALUES = Histogram(
+    'cohort_filter_values', 'Filter values (selected options and range bounds) per request.', ['route'],
+    buckets=CARDINALITY_BUCKETS)
+
+_log_lock = threading.Lock()
+
+
+def _write_slow_request(entry):
+    line = json.dumps(entry, default=str)
+    print(f"Slow request: {entry['method']} {entry['path']} {entry['duration_ms']} ms")
+    if not SLOW_REQUEST_LOG:
+        return
+    try:
+        directory = os.path.dirname(SLOW_REQUEST_LOG)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # A single appended line per request, so server processes can share the file
+        with _log_lock, open(SLOW_REQUEST_LOG, 'a') as f:
+            f.write(line + '\n')
+    except OSError as e:
+        print(f"Warning: could not write slow request log {SLOW_REQUEST_LOG}: {str(e)}")
+
+
+def install_request_metrics(app, request_filters):
+    """
+    Time every request to app and record its latency (histogram and recent
+    quantiles per route), response size and, for requests that carry cohort
+    filters, the filter cardinality. Requests slower than
+    SLOW_REQUEST_SECONDS are logged as JSON with their filters and, when a
+    view stored an analysis timings report in g.analysis_timings, its stage
+    breakdown.
+    request_filters() returns the cohort filters of the current request, or
+    None for routes without filters.
+    """
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    # Ahead of every other before_request handler, so they are timed too
+    app.before_request_funcs.setdefault(None, []).insert(0, start_timer)
+
+    @app.after_request
+    def record_request(response):
+        started = g.get('request_started')
+        if started is None:
+            return response
+        duration = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        method = request.method
+
+        REQUEST_SECONDS.observe(duration, route=route, method=method, status=response.status_code)
+        REQUEST_LATENCY.observe(duration, route=route, method=method)
+        size = None if response.is_streamed else response.calculate_content_length()
+        if size is not None:
+            RESPONSE_BYTES.observe(size, route=route, method=method)
+
+        filters = cardinality = None
+        if method != 'OPTIONS':
+            try:
+                filters = request_filters()
+            except Exception as e:
+                print(f"Warning: could not read request filters: {str(e)}")
+        if filters is not None:
+            cardinality = filter_cardinality(filters)
+            FILTER_FIELDS.observe(cardinality['fields'], route=route)
+            FILTER_VALUES.observe(cardinality['values'], route=route)
+
+        if duration >= SLOW_REQUEST_SECONDS:
+            timings = g.get('analysis_timings')
+            _write_slow_request({
+                'time': datetime.now(timezone.utc).isoformat(),
+                'pid': os.getpid(),
+                'method': method,
+                'route': route,
+                'path': request.path,
+                'query': request.query_string.decode('utf-8', 'replace'),
+                'status': response.status_code,
+                'duration_ms': round(duration * 1000, 2),
+                'response_bytes': size,
+                'filters': filters,
+                'filter_cardinality': cardinality,
+                'stages': timings.get('stages') if timings else None,
+                'charts': timings.get('charts') if timings else None
+            })
+        return response
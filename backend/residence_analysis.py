@@ -4,48 +4,44 @@ matplotlib.use('Agg')  # Non-interactive backend for server-side rendering
 import matplotlib.pyplot as plt
 import base64
 from io import BytesIO
+from aggregation import register_analysis, run_analysis, value_counts
 
-def compute_residence(df: pd.DataFrame):
+def summarise_residence(aggregates: dict, total_patients: int, options=None):
     """
-    Compute counts for pre-admission residence status (uresidence).
-    Merges 'Not recorded' into 'Other'.
-    Returns a dictionary of counts.
+    Build pre-admission residence counts from the uresidence label counts.
+    'Not recorded', missing and any unexpected labels are counted as 'Other',
+    so the counts always add up to the whole cohort.
     """
-    if 'uresidence' not in df.columns:
+    if 'uresidence' not in aggregates:
         return {}
 
-    # Create a copy to avoid SettingWithCopy warnings on the original df
-    res_data = df['uresidence'].copy()
+    counts = aggregates['uresidence']
     
-    # Standardize/Merge values
     # We want 3 categories: Private residence, Residential aged care facility, Other
-    res_data = res_data.replace('Not recorded', 'Other')
-    
-    # Handle any potential nulls as Other
-    res_data = res_data.fillna('Other')
-
-    counts = res_data.value_counts()
-    
-    # Ensure all keys exist for consistency, even if 0
     stats = {
         'Private residence': int(counts.get('Private residence', 0)),
-        'Residential aged care facility': int(counts.get('Residential aged care facility', 0)),
-        'Other': int(counts.get('Other', 0))
+        'Residential aged care facility': int(counts.get('Residential aged care facility', 0))
     }
-    
-    # If there were other categories in the data not accounted for, add them to Other
-    # (This ensures the chart represents 100% of the cohort)
-    known_sum = sum(stats.values())
-    total_rows = len(df)
-    if known_sum < total_rows:
-        stats['Other'] += (total_rows - known_sum)
+    stats['Other'] = total_patients - sum(stats.values())
 
     return stats
 
-def generate_residence_chart(stats: dict):
+def compute_residence(df: pd.DataFrame):
     """
-    Generate a pie chart for residence status.
-    Returns a data URI (base64 PNG) or None if insufficient data.
+    Compute counts for pre-admission residence status (uresidence).
+    Merges 'Not recorded' into 'Other'.
+    Returns a dictionary of counts.
+    """
+    return run_analysis('residence', df)
+
+# Pie colours (safe pastel palette), assigned in slice order
+RESIDENCE_COLORS = ['#4a90e2', '#50c878', '#e24a4a', '#f5a623']
+
+
+def _residence_slices(stats: dict):
+    """
+    Non-zero residence slices with their display labels.
+    Returns (display_labels, sizes) or None if there is nothing to plot.
     """
     labels = list(stats.keys())
     sizes = list(stats.values())
@@ -61,10 +57,44 @@ def generate_residence_chart(stats: dict):
     # Shorten long labels for the chart display
     display_labels = [l.replace('Residential aged care facility', 'RACF') for l in labels]
 
+    return display_labels, list(sizes)
+
+
+def generate_residence_chart_spec(stats: dict):
+    """
+    Describe the residence pie chart for client-side rendering.
+    Returns a dict, or None if insufficient data.
+    """
+    slices = _residence_slices(stats)
+    if slices is None:
+        return None
+    display_labels, sizes = slices
+
+    return {
+        'type': 'pie',
+        'title': 'Pre-Admission Residence Status',
+        'legend_title': 'Residence Type',
+        'slices': [
+            {'label': l, 'value': s, 'color': c}
+            for l, s, c in zip(display_labels, sizes, RESIDENCE_COLORS)
+        ]
+    }
+
+
+def generate_residence_chart(stats: dict):
+    """
+    Generate a pie chart for residence status.
+    Returns a data URI (base64 PNG) or None if insufficient data.
+    """
+    slices = _residence_slices(stats)
+    if slices is None:
+        return None
+    display_labels, sizes = slices
+
     fig, ax = plt.subplots(figsize=(8, 6))
     
     # Define colors (Safe pastel palette)
-    colors = ['#4a90e2', '#50c878', '#e24a4a', '#f5a623']
+    colors = RESIDENCE_COLORS
     
     wedges, texts, autotexts = ax.pie(
         sizes, 
@@ -96,4 +126,17 @@ def generate_residence_chart(stats: dict):
     img64 = base64.b64encode(buf.read()).decode('utf-8')
     plt.close(fig)
 
-    return f"data:image/png;base64,{img64}"
\ No newline at end of file
+    return f"data:image/png;base64,{img64}"
+
+
+register_analysis(
+    'residence',
+    reducers={'uresidence': value_counts('uresidence')},
+    finalize=summarise_residence,
+    chart={
+        'key': 'residence_chart',
+        'png': generate_residence_chart,
+        'spec': generate_residence_chart_spec,
+        'blocked_by': ['uresidence']
+    }
+)
@@ -1,75 +1,77 @@
+import numpy as np
 import pandas as pd
 import matplotlib
 matplotlib.use('Agg')  # Non-interactive backend for server-side rendering
 import matplotlib.pyplot as plt
 import base64
 from io import BytesIO
+from aggregation import crosstab, register_analysis, run_analysis
 
-def compute_residence_transition(df: pd.DataFrame):
+# Simplified residence groups, in matrix order
+RESIDENCE_GROUPS = ['Home', 'RACF', 'Other', 'Unknown']
+
+# Transition label for each (admission group, discharge group) pair;
+# pairs not listed fall under 'Other Transitions'
+TRANSITION_LABELS = {
+    ('Home', 'Home'): 'Home → Home',
+    ('Home', 'RACF'): 'Home → RACF (New Entry)',
+    ('RACF', 'RACF'): 'RACF → RACF',
+    ('RACF', 'Home'): 'RACF → Home (Returned)',
+    ('Home', 'Other'): 'Home → Other',
+    ('RACF', 'Other'): 'RACF → Other',
+    ('Other', 'Home'): 'Other → Home',
+    ('Other', 'RACF'): 'Other → RACF',
+}
+
+def categorize_residence(value):
     """
-    Compute residence transitions from admission (uresidence) to discharge (dresidence).
-    Tracks:
-    - Stayed home → stayed home
-    - Home → RACF (new RACF entries)
-    - RACF → RACF (stayed in RACF)
-    - RACF → Home (returned home)
-    - Other transitions
+    Simplify a residence label to one of RESIDENCE_GROUPS.
+    """
+    if pd.isna(value) or value in ('Unknown', 'Not recorded'):
+        return 'Unknown'
+    elif 'Residential aged care facility' in str(value) or 'RACF' in str(value):
+        return 'RACF'
+    elif 'Private residence' in str(value) or 'Home' in str(value):
+        return 'Home'
+    else:
+        return 'Other'
+
+def _group_lookup(labels):
+    """
+    Index into RESIDENCE_GROUPS for each label, plus a trailing Unknown
+    slot for missing values.
+    """
+    unknown = RESIDENCE_GROUPS.index('Unknown')
+    return np.array(
+        [RESIDENCE_GROUPS.index(categorize_residence(label)) for label in labels] + [unknown],
+        dtype=np.int64
+    )
+
+def summarise_residence_transition(aggregates: dict, total_patients: int, options=None):
+    """
+    Build residence transition counts from the uresidence x dresidence crosstab.
+    Only the distinct labels are categorised; the label crosstab is then
+    folded into the origin -> destination matrix over RESIDENCE_GROUPS.
     """
-    if 'uresidence' not in df.columns or 'dresidence' not in df.columns:
+    if 'transitions' not in aggregates:
         return {}
 
-    # Create a working dataframe with both columns
-    transition_df = df[['uresidence', 'dresidence']].copy()
-    
-    # Clean up the data - replace 'Not recorded' and nulls with 'Unknown'
-    transition_df['uresidence'] = transition_df['uresidence'].fillna('Unknown').replace('Not recorded', 'Unknown')
-    transition_df['dresidence'] = transition_df['dresidence'].fillna('Unknown').replace('Not recorded', 'Unknown')
-    
-    # Simplify categories for analysis
-    def categorize_residence(value):
-        if pd.isna(value) or value == 'Unknown':
-            return 'Unknown'
-        elif 'Residential aged care facility' in str(value) or 'RACF' in str(value):
-            return 'RACF'
-        elif 'Private residence' in str(value) or 'Home' in str(value):
-            return 'Home'
-        else:
-            return 'Other'
-    
-    transition_df['uresidence_cat'] = transition_df['uresidence'].apply(categorize_residence)
-    transition_df['dresidence_cat'] = transition_df['dresidence'].apply(categorize_residence)
-    
-    # Create transition labels
-    def get_transition_label(row):
-        u = row['uresidence_cat']
-        d = row['dresidence_cat']
-        
-        if u == 'Home' and d == 'Home':
-            return 'Home → Home'
-        elif u == 'Home' and d == 'RACF':
-            return 'Home → RACF (New Entry)'
-        elif u == 'RACF' and d == 'RACF':
-            return 'RACF → RACF'
-        elif u == 'RACF' and d == 'Home':
-            return 'RACF → Home (Returned)'
-        elif u == 'Home' and d == 'Other':
-            return 'Home → Other'
-        elif u == 'RACF' and d == 'Other':
-            return 'RACF → Other'
-        elif u == 'Other' and d == 'Home':
-            return 'Other → Home'
-        elif u == 'Other' and d == 'RACF':
-            return 'Other → RACF'
-        else:
-            return 'Other Transitions'
-    
-    transition_df['transition'] = transition_df.apply(get_transition_label, axis=1)
-    
-    # Count transitions
-    transition_counts = transition_df['transition'].value_counts()
+    origin_labels, destination_labels, label_counts = aggregates['transitions']
+    n_groups = len(RESIDENCE_GROUPS)
+    origin = _group_lookup(origin_labels)
+    destination = _group_lookup(destination_labels)
+
+    matrix = np.zeros((n_groups, n_groups), dtype=np.int64)
+    np.add.at(matrix, (origin[:, None], destination[None, :]), label_counts)
+
+    transition_counts = {label: 0 for label in TRANSITION_LABELS.values()}
+    transition_counts['Other Transitions'] = 0
+    for i, u in enumerate(RESIDENCE_GROUPS):
+        for j, d in enumerate(RESIDENCE_GROUPS):
+            label = TRANSITION_LABELS.get((u, d), 'Other Transitions')
+            transition_counts[label] += int(matrix[i, j])
     
     # Calculate key metrics
-    total_patients = len(transition_df)
     new_racf_entries = transition_counts.get('Home → RACF (New Entry)', 0)
     returned_home = transition_counts.get('RACF → Home (Returned)', 0)
     stayed_home = transition_counts.get('Home → Home', 0)
@@ -94,15 +96,33 @@ def compute_residence_transition(df: pd.DataFrame):
             'returned_home_from_racf': int(returned_home),
             'stayed_home': int(stayed_home),
             'stayed_racf': int(stayed_racf)
+        },
+        # counts[i][j]: patients admitted from groups[i], discharged to groups[j]
+        'matrix': {
+            'groups': RESIDENCE_GROUPS,
+            'counts': matrix.tolist()
         }
     }
     
     return stats
 
-def generate_residence_transition_chart(stats: dict):
+def compute_residence_transition(df: pd.DataFrame):
     """
-    Generate a horizontal bar chart showing residence transitions.
-    Returns a data URI (base64 PNG) or None if insufficient data.
+    Compute residence transitions from admission (uresidence) to discharge (dresidence).
+    Tracks:
+    - Stayed home → stayed home
+    - Home → RACF (new RACF entries)
+    - RACF → RACF (stayed in RACF)
+    - RACF → Home (returned home)
+    - Other transitions
+    Also returns the full origin → destination matrix over RESIDENCE_GROUPS.
+    """
+    return run_analysis('residence_transition', df)
+
+def _transition_bars(stats: dict):
+    """
+    Non-zero transitions sorted by count, with their highlight colours.
+    Returns (labels, values, colors) or None if there is nothing to plot.
     """
     transitions = stats.get('transitions', {})
     
@@ -118,9 +138,6 @@ def generate_residence_transition_chart(stats: dict):
     
     labels, values = zip(*sorted_items)
     
-    # Create figure
-    fig, ax = plt.subplots(figsize=(10, 6))
-    
     # Define colors - highlight new RACF entries
     colors = []
     for label in labels:
@@ -134,6 +151,41 @@ def generate_residence_transition_chart(stats: dict):
             colors.append('#f5a623')  # Orange for stayed RACF
         else:
             colors.append('#cccccc')  # Grey for other
+
+    return list(labels), list(values), colors
+
+def generate_residence_transition_chart_spec(stats: dict):
+    """
+    Describe the residence transition bar chart for client-side rendering.
+    Returns a dict, or None if insufficient data.
+    """
+    bars = _transition_bars(stats)
+    if bars is None:
+        return None
+    labels, values, colors = bars
+
+    return {
+        'type': 'hbar',
+        'title': 'Residence Transitions: Admission to Discharge',
+        'x_label': 'Number of Patients',
+        'bars': [
+            {'label': l, 'value': v, 'color': c}
+            for l, v, c in zip(labels, values, colors)
+        ]
+    }
+
+def generate_residence_transition_chart(stats: dict):
+    """
+    Generate a horizontal bar chart showing residence transitions.
+    Returns a data URI (base64 PNG) or None if insufficient data.
+    """
+    bars = _transition_bars(stats)
+    if bars is None:
+        return None
+    labels, values, colors = bars
+    
+    # Create figure
+    fig, ax = plt.subplots(figsize=(10, 6))
     
     # Create horizontal bar chart
     bars = ax.barh(range(len(labels)), values, color=colors)
@@ -163,3 +215,15 @@ def generate_residence_transition_chart(stats: dict):
     plt.close(fig)
 
     return f"data:image/png;base64,{img64}"
+
+
+register_analysis(
+    'residence_transition',
+    reducers={'transitions': crosstab('uresidence', 'dresidence')},
+    finalize=summarise_residence_transition,
+    chart={
+        'key': 'residence_transition_chart',
+        'png': generate_residence_transition_chart,
+        'spec': generate_residence_transition_chart_spec
+    }
+)
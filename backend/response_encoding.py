@@ -0,0 +1,171 @@
+import gzip
+import json
+import numbers
+from flask import Response, request
+
+# brotli and pyarrow are optional: without them responses are only gzipped
+# and always JSON
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# Bodies smaller than this are sent as they are (compression would not pay off)
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/plain', 'text/csv', 'application/vnd.apache.arrow.stream')
+
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+# Numeric lists at least this long (e.g. raw_data) travel as Arrow columns
+ARROW_MIN_ARRAY = 64
+ARROW_COLUMN_KEY = '$arrow_column'
+
+# Saved-cohort analyses never change, but clients must revalidate (the
+# cohort may be deleted or the dataset refreshed)
+ANALYSIS_CACHE_CONTROL = 'private, no-cache'
+
+
+def response_format():
+    """
+    'arrow' if the client asked for Arrow IPC (and pyarrow is installed),
+    otherwise 'json'.
+    """
+    if pa is None:
+        return 'json'
+    best = request.accept_mimetypes.best_match(['application/json', ARROW_MIMETYPE], default='application/json')
+    return 'arrow' if best == ARROW_MIMETYPE else 'json'
+
+
+def _add_vary(response, header):
+    vary = [v.strip() for v in response.headers.get('Vary', '').split(',') if v.strip()]
+    if header not in vary:
+        vary.append(header)
+    response.headers['Vary'] = ', '.join(vary)
+
+
+# ---------- ETags ----------
+
+def analysis_etag(key):
+    """
+    ETag of an immutable analysis response: its cache key (cohort, filters,
+    dataset version, variant) and the negotiated format. Weak, as the same
+    analysis may be sent with different compression.
+    """
+    return f"{key}.{response_format()}"
+
+
+def is_not_modified(etag):
+    """
+    Whether the client's If-None-Match already names this ETag.
+    """
+    return request.if_none_match.contains_weak(etag)
+
+
+def not_modified(etag):
+    response = Response(status=304)
+    return with_etag(response, etag)
+
+
+def with_etag(response, etag):
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = ANALYSIS_CACHE_CONTROL
+    _add_vary(response, 'Accept')
+    return response
+
+
+# ---------- Arrow IPC ----------
+
+def _is_numeric_list(value):
+    return (
+        isinstance(value, list) and len(value) >= ARROW_MIN_ARRAY
+        and all(v is None or (isinstance(v, numbers.Real) and not isinstance(v, bool)) for v in value)
+    )
+
+
+def arrow_payload(data):
+    """
+    Encode a JSON-like value as an Arrow IPC stream with a single row: each
+    long numeric list becomes a float64 list column (named by its path, e.g.
+    "age.raw_data") and is replaced by {"$arrow_column": name} in the rest
+    of the document, which travels as JSON in the schema metadata ("json").
+    """
+    columns = {}
+
+    def extract(value, path):
+        if isinstance(value, dict):
+            return {k: extract(v, f"{path}.{k}" if path else str(k)) for k, v in value.items()}
+        if _is_numeric_list(value):
+            columns[path] = pa.array([[float('nan') if v is None else float(v) for v in value]], type=pa.list_(pa.float64()))
+            return {ARROW_COLUMN_KEY: path}
+        if isinstance(value, list):
+            return [extract(v, f"{path}[{i}]") for i, v in enumerate(value)]
+        return value
+
+    document = extract(data, '')
+    table = pa.table(columns) if columns else pa.table({'_': pa.array([None], type=pa.null())})
+    table = table.replace_schema_metadata({'json': json.dumps(document)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+# ---------- after_request hooks ----------
+
+def _encode_arrow(response):
+    if (response.mimetype != 'application/json' or response.is_streamed
+            or response.status_code == 304 or response_format() != 'arrow'):
+        return response
+    data = response.get_json(silent=True)
+    if data is None:
+        return response
+    response.set_data(arrow_payload(data))
+    response.mimetype = ARROW_MIMETYPE
+    return response
+
+
+def _compress(response):
+    if response.mimetype in ('application/json', ARROW_MIMETYPE):
+        _add_vary(response, 'Accept')
+    if (response.is_streamed or response.direct_passthrough or response.status_code < 200
+            or response.status_code in (204, 304) or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    _add_vary(response, 'Accept-Encoding')
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+    encoding = request.accept_encodings.best_match(encodings)
+    if encoding == 'br':
+        data = brotli.compress(data, quality=BROTLI_QUALITY)
+    elif encoding == 'gzip':
+        data = gzip.compress(data, compresslevel=GZIP_LEVEL)
+    else:
+        return response
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    if response.get_etag()[0]:
+        # Compressed bytes differ from the original, so a strong ETag would be wrong
+        etag, _ = response.get_etag()
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def install_response_encoding(app):
+    """
+    Content negotiation for every response of app: JSON bodies are sent as
+    Arrow IPC when the client prefers it (Accept), then compressed with
+    brotli or gzip as Accept-Encoding allows. Streamed responses (exports)
+    are left alone.
+    Install after the request metrics so the recorded sizes are the bytes
+    actually sent (after_request hooks run in reverse order).
+    """
+    app.after_request(_compress)
+    app.after_request(_encode_arrow)
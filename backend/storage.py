@@ -0,0 +1,108 @@
+import os
+import pandas as pd
+
+# pyarrow is optional: without it everything keeps working from CSV
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:
+    pa = None
+    feather = None
+
+COLUMNAR_SUFFIX = '.feather'
+
+
+def columnar_available():
+    return feather is not None
+
+
+def columnar_path(path):
+    """
+    Path of the Feather (Arrow IPC) file that stands in for a CSV file.
+    """
+    root, ext = os.path.splitext(path)
+    return path if ext == COLUMNAR_SUFFIX else root + COLUMNAR_SUFFIX
+
+
+def _is_current(csv_path, arrow_path):
+    """
+    A columnar copy is usable if it exists and is not older than its CSV.
+    """
+    if not os.path.exists(arrow_path):
+        return False
+    if not os.path.exists(csv_path):
+        return True
+    return os.path.getmtime(arrow_path) >= os.path.getmtime(csv_path)
+
+
+def write_table(df: pd.DataFrame, path):
+    """
+    Write a dataframe as an uncompressed Feather v2 file so it can be
+    memory-mapped on read. Written to a temporary name and renamed, so a
+    reader never sees a half-written file.
+    """
+    tmp_path = f"{path}.tmp"
+    feather.write_feather(df.reset_index(drop=True), tmp_path, compression='uncompressed')
+    os.replace(tmp_path, path)
+
+
+def table_columns(path):
+    """
+    Column names stored in a Feather file, read from the schema only.
+    """
+    with pa.memory_map(path, 'r') as source:
+        return pa.ipc.open_file(source).schema.names
+
+
+def _read_feather(path, columns=None):
+    if columns is not None:
+        available = set(table_columns(path))
+        columns = [c for c in columns if c in available]
+    return feather.read_feather(path, columns=columns, memory_map=True)
+
+
+def _read_csv(path, columns=None, csv_reader=None):
+    if csv_reader is not None:
+        df = csv_reader(path)
+        return df if columns is None else df[[c for c in columns if c in df.columns]]
+    if columns is None:
+        return pd.read_csv(path)
+    wanted = set(columns)
+    return pd.read_csv(path, usecols=lambda c: c in wanted)
+
+
+def read_table(path, columns=None, csv_reader=None):
+    """
+    Read a table stored either as CSV or as Feather.
+    For a CSV path the Feather copy next to it is used when it is up to date;
+    otherwise the CSV is parsed (with csv_reader if given) and migrated to
+    Feather so the next read is a memory-mapped, column-pruned load.
+    If columns is given, only those columns (that exist) are returned.
+    """
+    if not columnar_available():
+        return _read_csv(path, columns, csv_reader)
+
+    arrow_path = columnar_path(path)
+    if arrow_path == path or _is_current(path, arrow_path):
+        return _read_feather(arrow_path, columns)
+
+    df = _read_csv(path, None, csv_reader)
+    try:
+        write_table(df, arrow_path)
+        print(f"Migrated {path} to columnar storage: {arrow_path}")
+    except Exception as e:
+        print(f"Warning: could not write columnar copy of {path}: {str(e)}")
+    return df if columns is None else df[[c for c in columns if c in df.columns]]
+
+
+def remove_table(path):
+    """
+    Delete a stored table together with its columnar copy, if any.
+    Returns the list of files that were removed.
+    """
+    removed = []
+    for candidate in {path, columnar_path(path)}:
+        if candidate and os.path.exists(candidate):
+            os.remove(candidate)
+            removed.append(candidate)
+    return removed
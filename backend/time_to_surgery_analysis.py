@@ -1,59 +1,107 @@
+import numpy as np
 import pandas as pd
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import base64
 from io import BytesIO
+from distribution_summary import summarise_distribution, bxp_stats
+from aggregation import register_analysis, run_analysis, values
 
-def compute_time_to_surgery(df: pd.DataFrame):
+# Fixed histogram bins over the plotted window (hours)
+SURGERY_HIST_RANGE = (0, 336)
+SURGERY_BIN_WIDTH = 6
+
+def summarise_time_to_surgery(aggregates: dict, total_patients: int, options=None):
     """
-    Extracts the raw time_to_surgery_hrs data for the box plot.
+    Summarise the time_to_surgery_hrs distribution for the box plot
+    (quartiles, whiskers, outlier sample, histogram).
     Filters out unrealistic values (< 0 or > 336 hours).
     Calculates summary statistics for display.
+    The per-patient values are only included as raw_data if options
+    has include_raw set.
     """
-    stats = {}
+    options = options or {}
+    stats = {'distribution': None}
     
-    if 'time_to_surgery_hrs' in df.columns:
-        # Drop NaNs first
-        clean_data = df['time_to_surgery_hrs'].dropna()
+    if 'time_to_surgery_hrs' in aggregates:
+        # Missing values are already dropped
+        clean_data = aggregates['time_to_surgery_hrs']
         
         # FILTER: Keep only values between 0 and 336 hours (14 days)
         clean_data = clean_data[(clean_data >= 0) & (clean_data <= 336)]
         
-        stats['raw_data'] = clean_data.tolist()
+        if options.get('include_raw'):
+            stats['raw_data'] = clean_data.tolist()
         
         # Calculate summary stats for text display
-        if not clean_data.empty:
-            stats['mean'] = round(clean_data.mean(), 1)
-            stats['median'] = round(clean_data.median(), 1)
-            stats['min'] = round(clean_data.min(), 1)
-            stats['max'] = round(clean_data.max(), 1)
+        if len(clean_data) > 0:
+            stats['distribution'] = summarise_distribution(clean_data, SURGERY_HIST_RANGE, SURGERY_BIN_WIDTH)
+            stats['mean'] = round(float(clean_data.mean()), 1)
+            stats['median'] = round(float(np.median(clean_data)), 1)
+            stats['min'] = round(float(clean_data.min()), 1)
+            stats['max'] = round(float(clean_data.max()), 1)
             stats['count'] = len(clean_data)
         else:
-            stats['raw_data'] = []
             stats['mean'] = 0
             stats['median'] = 0
             stats['max'] = 0
-    else:
-        stats['raw_data'] = []
         
     return stats
 
+def compute_time_to_surgery(df: pd.DataFrame, include_raw=False):
+    """
+    Box plot summary and display statistics for time_to_surgery_hrs
+    (see summarise_time_to_surgery).
+    """
+    return run_analysis('time_to_surgery', df, include_raw=include_raw)
+
+def generate_time_to_surgery_chart_spec(stats: dict):
+    """
+    Describe the box plot (quartiles, whiskers, outlier sample) for client-side rendering.
+    """
+    summary = stats.get('distribution')
+    
+    if not summary:
+        return None
+
+    return {
+        'type': 'box',
+        'title': 'Distribution of Time to Surgery',
+        'y_label': 'Hours',
+        'label': 'Time to Surgery',
+        'color': '#e24a4a',
+        'box': {
+            'whislo': summary['whislo'],
+            'q1': summary['q1'],
+            'med': summary['median'],
+            'q3': summary['q3'],
+            'whishi': summary['whishi']
+        },
+        'fliers': summary['outliers'],
+        'annotations': [
+            f"Mean: {stats.get('mean', 0)} hrs",
+            f"Median: {stats.get('median', 0)} hrs",
+            f"Max: {stats.get('max', 0)} hrs"
+        ],
+        'note': "Note: Values < 0 hours and > 336 hours (2 weeks) are excluded.",
+    }
+
 def generate_time_to_surgery_chart(stats: dict):
     """
     Generate a Box Plot for Time to Surgery (Hours).
     """
-    data = stats.get('raw_data', [])
+    summary = stats.get('distribution')
     
-    if not data:
+    if not summary:
         return None
 
     # Create figure
     fig, ax = plt.subplots(figsize=(8, 6))
     
-    # Create boxplot
+    # Draw the boxplot from the pre-computed summary
     # vert=True (vertical), patch_artist=True (fill color)
-    bp = ax.boxplot(data, vert=True, patch_artist=True, labels=['Time to Surgery'])
+    bp = ax.bxp([bxp_stats(summary, 'Time to Surgery')], vert=True, patch_artist=True)
     
     # Customize colors
     for patch in bp['boxes']:
@@ -93,4 +141,16 @@ def generate_time_to_surgery_chart(stats: dict):
     img64 = base64.b64encode(buf.read()).decode('utf-8')
     plt.close(fig)
 
-    return f"data:image/png;base64,{img64}"
\ No newline at end of file
+    return f"data:image/png;base64,{img64}"
+
+
+register_analysis(
+    'time_to_surgery',
+    reducers={'time_to_surgery_hrs': values('time_to_surgery_hrs')},
+    finalize=summarise_time_to_surgery,
+    chart={
+        'key': 'time_to_surgery_chart',
+        'png': generate_time_to_surgery_chart,
+        'spec': generate_time_to_surgery_chart_spec
+    }
+)
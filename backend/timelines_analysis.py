@@ -4,26 +4,50 @@ matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import base64
 from io import BytesIO
+from aggregation import mean, register_analysis, run_analysis
+
+def summarise_timelines(aggregates: dict, total_patients: int, options=None):
+    """
+    Round the average Length of Stay (LoS) means to 1 decimal place
+    (standard rounding); columns not in the dataset report 0.0.
+    """
+    stats = {}
+    
+    # Means ignore NaNs
+    stats['avg_hospital_days'] = round(aggregates['los_hospital_days'], 1) if 'los_hospital_days' in aggregates else 0.0
+    stats['avg_acute_days'] = round(aggregates['los_acute_ward_days'], 1) if 'los_acute_ward_days' in aggregates else 0.0
+
+    return stats
 
 def compute_timelines(df: pd.DataFrame):
     """
     Compute average Length of Stay (LoS) for Hospital and Acute Ward.
     Rounds to 1 decimal place (standard rounding).
     """
-    stats = {}
-    
-    # Calculate means, ignoring NaNs automatically
-    if 'los_hospital_days' in df.columns:
-        stats['avg_hospital_days'] = round(df['los_hospital_days'].mean(), 1)
-    else:
-        stats['avg_hospital_days'] = 0.0
+    return run_analysis('timelines', df)
 
-    if 'los_acute_ward_days' in df.columns:
-        stats['avg_acute_days'] = round(df['los_acute_ward_days'].mean(), 1)
-    else:
-        stats['avg_acute_days'] = 0.0
+def generate_timelines_chart_spec(stats: dict):
+    """
+    Describe the length of stay bar chart for client-side rendering.
+    Returns a dict, or None if insufficient data.
+    """
+    labels = ['Total Hospital Stay', 'Acute Ward Stay']
+    values = [stats.get('avg_hospital_days', 0), stats.get('avg_acute_days', 0)]
+    
+    if sum(values) == 0:
+        return None
 
-    return stats
+    colors = ['#4a90e2', '#50c878']
+    return {
+        'type': 'bar',
+        'title': 'Average Length of Stay',
+        'y_label': 'Average Duration (Days)',
+        'value_suffix': ' days',
+        'bars': [
+            {'label': l, 'value': v, 'color': c}
+            for l, v, c in zip(labels, values, colors)
+        ]
+    }
 
 def generate_timelines_chart(stats: dict):
     """
@@ -66,4 +90,19 @@ def generate_timelines_chart(stats: dict):
     img64 = base64.b64encode(buf.read()).decode('utf-8')
     plt.close(fig)
 
-    return f"data:image/png;base64,{img64}"
\ No newline at end of file
+    return f"data:image/png;base64,{img64}"
+
+
+register_analysis(
+    'timelines',
+    reducers={
+        'los_hospital_days': mean('los_hospital_days'),
+        'los_acute_ward_days': mean('los_acute_ward_days')
+    },
+    finalize=summarise_timelines,
+    chart={
+        'key': 'timelines_chart',
+        'png': generate_timelines_chart,
+        'spec': generate_timelines_chart_spec
+    }
+)
@@ -66,12 +66,35 @@ function App() {
   const [cohortName, setCohortName] = useState('')
   const [showSaveDialog, setShowSaveDialog] = useState(false)
   const [expandedFilters, setExpandedFilters] = useState({})
+  // Live cohort size and per-option "if toggled" counts, refreshed as filters change
+  const [liveCount, setLiveCount] = useState(null)
+  const [optionCounts, setOptionCounts] = useState({})
 
   // Load saved cohorts on mount
   useEffect(() => {
     loadSavedCohorts()
   }, [])
 
+  // Debounced so quickly ticking several options sends one request
+  useEffect(() => {
+    let cancelled = false
+    const timer = setTimeout(async () => {
+      try {
+        const response = await axios.post("http://localhost:5050/api/cohort/counts", filters)
+        if (!cancelled) {
+          setLiveCount(response.data.count)
+          setOptionCounts(response.data.options || {})
+        }
+      } catch (err) {
+        console.error('Error loading live counts:', err)
+      }
+    }, 250)
+    return () => {
+      cancelled = true
+      clearTimeout(timer)
+    }
+  }, [filters])
+
   const loadSavedCohorts = async () => {
     try {
       const response = await axios.get("http://localhost:5050/api/cohorts")
@@ -113,6 +136,13 @@ function App() {
     })
   }
 
+  // Cohort size if this option were ticked/unticked
+  const renderOptionCount = (field, option) => {
+    const count = optionCounts[field]?.[option]
+    if (count === undefined) return null
+    return <span className="option-count">{count.toLocaleString()}</span>
+  }
+
   const CollapsibleFilter = ({ id, label, options, field, displayMap = {} }) => (
     <div className="filter-group">
       <label onClick={() => toggleFilterExpansion(id)} className="filter-label-collapse">
@@ -129,6 +159,7 @@ function App() {
                 onChange={() => handleCheckboxChange(field, option)}
               />
               <span>{displayMap[option] || option}</span>
+              {renderOptionCount(field, option)}
             </label>
           ))}
         </div>
@@ -238,6 +269,7 @@ function App() {
                       onChange={() => handleCheckboxChange('sex', option)}
                     />
                     <span>{option}</span>
+                    {renderOptionCount('sex', option)}
                   </label>
                 ))}
               </div>
@@ -258,6 +290,7 @@ function App() {
                       onChange={() => handleCheckboxChange('ptype', option)}
                     />
                     <span>{option}</span>
+                    {renderOptionCount('ptype', option)}
                   </label>
                 ))}
               </div>
@@ -278,6 +311,7 @@ function App() {
                       onChange={() => handleCheckboxChange('uresidence', option)}
                     />
                     <span>{option === 'Residential aged care facility' ? 'RACF' : option}</span>
+                    {renderOptionCount('uresidence', option)}
                   </label>
                 ))}
               </div>
@@ -667,6 +701,12 @@ function App() {
           </div>
         )}
 
+        {liveCount !== null && (
+          <div className="live-count">
+            {liveCount.toLocaleString()} patients match the current filters
+          </div>
+        )}
+
         {cohortSize !== null && !error && (
           <div className="cohort-result">
             <div className="cohort-count">
@@ -0,0 +1,383 @@
+// Draws the chart specs returned by /analyse?charts=spec as inline SVG.
+// Each spec has a `type` (stacked_bar, pie, hbar, bar, box, or grouped_bar
+// and grouped_box for cohort comparisons) plus the data, labels and colours
+// the backend would otherwise have drawn with matplotlib.
+
+const WIDTH = 640
+const HEIGHT = 400
+const MARGIN = { top: 50, right: 24, bottom: 56, left: 72 }
+
+const formatNumber = (value) => {
+  if (Number.isInteger(value)) return value.toLocaleString()
+  return value.toLocaleString(undefined, { maximumFractionDigits: 1 })
+}
+
+// Round axis maximum up to a "nice" value and return evenly spaced ticks
+const niceTicks = (maxValue, count = 5) => {
+  if (!maxValue || maxValue <= 0) return [0, 1]
+  const rawStep = maxValue / count
+  const magnitude = Math.pow(10, Math.floor(Math.log10(rawStep)))
+  const step = [1, 2, 2.5, 5, 10].map(m => m * magnitude).find(s => s >= rawStep)
+  const ticks = []
+  for (let t = 0; t <= maxValue + step * 0.001; t += step) ticks.push(t)
+  if (ticks[ticks.length - 1] < maxValue) ticks.push(ticks[ticks.length - 1] + step)
+  return ticks
+}
+
+function Frame({ spec, children }) {
+  return (
+    <svg
+      className="chart-spec"
+      viewBox={`0 0 ${WIDTH} ${HEIGHT}`}
+      role="img"
+      aria-label={spec.title}
+    >
+      <text x={WIDTH / 2} y={24} textAnchor="middle" fontSize="16" fontWeight="bold">
+        {spec.title}
+      </text>
+      {spec.subtitle && (
+        <text x={WIDTH / 2} y={42} textAnchor="middle" fontSize="12" fill="#666">
+          {spec.subtitle}
+        </text>
+      )}
+      {children}
+    </svg>
+  )
+}
+
+function ValueAxis({ ticks, scale, horizontal = false, label }) {
+  const plotBottom = HEIGHT - MARGIN.bottom
+  return (
+    <g fontSize="11" fill="#444">
+      {ticks.map(t => horizontal ? (
+        <g key={t}>
+          <line x1={scale(t)} x2={scale(t)} y1={MARGIN.top} y2={plotBottom} stroke="#e5e5e5" strokeDasharray="3 3" />
+          <text x={scale(t)} y={plotBottom + 14} textAnchor="middle">{formatNumber(t)}</text>
+        </g>
+      ) : (
+        <g key={t}>
+          <line x1={MARGIN.left} x2={WIDTH - MARGIN.right} y1={scale(t)} y2={scale(t)} stroke="#e5e5e5" strokeDasharray="3 3" />
+          <text x={MARGIN.left - 6} y={scale(t) + 4} textAnchor="end">{formatNumber(t)}</text>
+        </g>
+      ))}
+      {label && (horizontal ? (
+        <text x={(MARGIN.left + WIDTH - MARGIN.right) / 2} y={HEIGHT - 14} textAnchor="middle" fontSize="12">{label}</text>
+      ) : (
+        <text
+          transform={`translate(16 ${(MARGIN.top + plotBottom) / 2}) rotate(-90)`}
+          textAnchor="middle"
+          fontSize="12"
+        >
+          {label}
+        </text>
+      ))}
+    </g>
+  )
+}
+
+function StackedBarChart({ spec }) {
+  const plotBottom = HEIGHT - MARGIN.bottom
+  const totals = spec.categories.map((_, i) => spec.series.reduce((sum, s) => sum + s.values[i], 0))
+  const ticks = niceTicks(Math.max(...totals) * 1.1)
+  const top = ticks[ticks.length - 1]
+  const y = (v) => plotBottom - (v / top) * (plotBottom - MARGIN.top)
+  const band = (WIDTH - MARGIN.left - MARGIN.right) / spec.categories.length
+  const barWidth = band * 0.6
+
+  return (
+    <Frame spec={spec}>
+      <ValueAxis ticks={ticks} scale={y} label={spec.y_label} />
+      {spec.categories.map((category, i) => {
+        const x = MARGIN.left + band * i + (band - barWidth) / 2
+        let base = 0
+        return (
+          <g key={category}>
+            {spec.series.map(series => {
+              const value = series.values[i]
+              const y0 = y(base)
+              base += value
+              const y1 = y(base)
+              return (
+                <g key={series.name}>
+                  <rect x={x} y={y1} width={barWidth} height={y0 - y1} fill={series.color} opacity="0.85">
+                    <title>{`${series.name}: ${formatNumber(value)}`}</title>
+                  </rect>
+                  {value > 0 && y0 - y1 > 14 && (
+                    <text x={x + barWidth / 2} y={(y0 + y1) / 2 + 4} textAnchor="middle" fontSize="11" fontWeight="bold" fill={series.label_color || '#fff'}>
+                      {formatNumber(value)}
+                    </text>
+                  )}
+                </g>
+              )
+            })}
+            {spec.show_totals && (
+              <text x={x + barWidth / 2} y={y(totals[i]) - 6} textAnchor="middle" fontSize="11" fontWeight="bold">
+                {formatNumber(totals[i])}
+              </text>
+            )}
+            <text x={x + barWidth / 2} y={plotBottom + 16} textAnchor="middle" fontSize="12">{category}</text>
+          </g>
+        )
+      })}
+      {spec.x_label && (
+        <text x={(MARGIN.left + WIDTH - MARGIN.right) / 2} y={HEIGHT - 12} textAnchor="middle" fontSize="12">{spec.x_label}</text>
+      )}
+      <g fontSize="11">
+        {spec.series.map((series, i) => (
+          <g key={series.name} transform={`translate(${WIDTH - MARGIN.right - 90} ${MARGIN.top + i * 18})`}>
+            <rect width="12" height="12" fill={series.color} opacity="0.85" />
+            <text x="18" y="10">{series.name}</text>
+          </g>
+        ))}
+      </g>
+    </Frame>
+  )
+}
+
+function PieChart({ spec }) {
+  const total = spec.slices.reduce((sum, s) => sum + s.value, 0)
+  const cx = WIDTH * 0.36
+  const cy = (HEIGHT + MARGIN.top) / 2
+  const r = 130
+  let angle = -Math.PI / 2
+
+  return (
+    <Frame spec={spec}>
+      {spec.slices.map(slice => {
+        const sweep = (slice.value / total) * Math.PI * 2
+        const start = angle
+        angle += sweep
+        const mid = start + sweep / 2
+        const point = (a, radius) => [cx + radius * Math.cos(a), cy + radius * Math.sin(a)]
+        const [x0, y0] = point(start, r)
+        const [x1, y1] = point(angle, r)
+        const [lx, ly] = point(mid, r * 0.65)
+        const path = sweep >= Math.PI * 2 - 1e-9
+          ? `M ${cx - r} ${cy} a ${r} ${r} 0 1 0 ${2 * r} 0 a ${r} ${r} 0 1 0 ${-2 * r} 0`
+          : `M ${cx} ${cy} L ${x0} ${y0} A ${r} ${r} 0 ${sweep > Math.PI ? 1 : 0} 1 ${x1} ${y1} Z`
+        const percent = (slice.value / total) * 100
+        return (
+          <g key={slice.label}>
+            <path d={path} fill={slice.color} stroke="#fff" strokeWidth="1.5">
+              <title>{`${slice.label}: ${formatNumber(slice.value)}`}</title>
+            </path>
+            {percent >= 3 && (
+              <text x={lx} y={ly + 4} textAnchor="middle" fontSize="12" fontWeight="bold" fill="#fff">
+                {percent.toFixed(1)}%
+              </text>
+            )}
+          </g>
+        )
+      })}
+      <g fontSize="12" transform={`translate(${WIDTH * 0.64} ${cy - spec.slices.length * 11})`}>
+        {spec.legend_title && <text fontWeight="bold" y="-8">{spec.legend_title}</text>}
+        {spec.slices.map((slice, i) => (
+          <g key={slice.label} transform={`translate(0 ${i * 22})`}>
+            <rect width="12" height="12" fill={slice.color} />
+            <text x="18" y="10">{`${slice.label} (${formatNumber(slice.value)})`}</text>
+          </g>
+        ))}
+      </g>
+    </Frame>
+  )
+}
+
+function HorizontalBarChart({ spec }) {
+  const left = 200
+  const plotBottom = HEIGHT - MARGIN.bottom
+  const ticks = niceTicks(Math.max(...spec.bars.map(b => b.value)) * 1.1)
+  const top = ticks[ticks.length - 1]
+  const x = (v) => left + (v / top) * (WIDTH - MARGIN.right - left)
+  const band = (plotBottom - MARGIN.top) / spec.bars.length
+  const barHeight = band * 0.7
+
+  return (
+    <Frame spec={spec}>
+      <ValueAxis ticks={ticks} scale={x} horizontal label={spec.x_label} />
+      {spec.bars.map((bar, i) => {
+        const y = MARGIN.top + band * i + (band - barHeight) / 2
+        return (
+          <g key={bar.label}>
+            <rect x={left} y={y} width={x(bar.value) - left} height={barHeight} fill={bar.color} stroke="#333" strokeWidth="0.5">
+              <title>{`${bar.label}: ${formatNumber(bar.value)}`}</title>
+            </rect>
+            <text x={left - 6} y={y + barHeight / 2 + 4} textAnchor="end" fontSize="11">{bar.label}</text>
+            <text x={x(bar.value) + 4} y={y + barHeight / 2 + 4} fontSize="11">{formatNumber(bar.value)}</text>
+          </g>
+        )
+      })}
+    </Frame>
+  )
+}
+
+function BarChart({ spec }) {
+  const plotBottom = HEIGHT - MARGIN.bottom
+  const ticks = niceTicks(Math.max(...spec.bars.map(b => b.value)) * 1.15)
+  const top = ticks[ticks.length - 1]
+  const y = (v) => plotBottom - (v / top) * (plotBottom - MARGIN.top)
+  const band = (WIDTH - MARGIN.left - MARGIN.right) / spec.bars.length
+  const barWidth = band * 0.5
+  const suffix = spec.value_suffix || ''
+
+  return (
+    <Frame spec={spec}>
+      <ValueAxis ticks={ticks} scale={y} label={spec.y_label} />
+      {spec.bars.map((bar, i) => {
+        const x = MARGIN.left + band * i + (band - barWidth) / 2
+        return (
+          <g key={bar.label}>
+            <rect x={x} y={y(bar.value)} width={barWidth} height={plotBottom - y(bar.value)} fill={bar.color} stroke="#333" strokeWidth="0.5">
+              <title>{`${bar.label}: ${formatNumber(bar.value)}${suffix}`}</title>
+            </rect>
+            <text x={x + barWidth / 2} y={y(bar.value) - 6} textAnchor="middle" fontSize="12" fontWeight="bold">
+              {formatNumber(bar.value)}{suffix}
+            </text>
+            <text x={x + barWidth / 2} y={plotBottom + 16} textAnchor="middle" fontSize="12">{bar.label}</text>
+          </g>
+        )
+      })}
+    </Frame>
+  )
+}
+
+function BoxChart({ spec }) {
+  const plotBottom = HEIGHT - MARGIN.bottom
+  const { whislo, q1, med, q3, whishi } = spec.box
+  const values = [whislo, whishi, ...spec.fliers]
+  const low = Math.min(0, ...values)
+  const ticks = niceTicks(Math.max(...values) * 1.05)
+  const top = ticks[ticks.length - 1]
+  const y = (v) => plotBottom - ((v - low) / (top - low)) * (plotBottom - MARGIN.top)
+  const cx = MARGIN.left + (WIDTH * 0.55 - MARGIN.left) / 2
+  const halfWidth = 60
+
+  return (
+    <Frame spec={spec}>
+      <ValueAxis ticks={ticks.filter(t => t >= low)} scale={y} label={spec.y_label} />
+      <line x1={cx} x2={cx} y1={y(whislo)} y2={y(q1)} stroke="#333" />
+      <line x1={cx} x2={cx} y1={y(q3)} y2={y(whishi)} stroke="#333" />
+      <line x1={cx - halfWidth / 2} x2={cx + halfWidth / 2} y1={y(whislo)} y2={y(whislo)} stroke="#333" />
+      <line x1={cx - halfWidth / 2} x2={cx + halfWidth / 2} y1={y(whishi)} y2={y(whishi)} stroke="#333" />
+      <rect x={cx - halfWidth} y={y(q3)} width={halfWidth * 2} height={y(q1) - y(q3)} fill={spec.color} opacity="0.8" stroke="#333">
+        <title>{`Q1: ${formatNumber(q1)} · Median: ${formatNumber(med)} · Q3: ${formatNumber(q3)}`}</title>
+      </rect>
+      <line x1={cx - halfWidth} x2={cx + halfWidth} y1={y(med)} y2={y(med)} stroke="#ff6600" strokeWidth="2" />
+      {spec.fliers.map((v, i) => (
+        <circle key={i} cx={cx} cy={y(v)} r="3" fill="none" stroke="#e24a4a" opacity="0.5" />
+      ))}
+      <text x={cx} y={plotBottom + 16} textAnchor="middle" fontSize="12">{spec.label}</text>
+      <g fontSize="12" transform={`translate(${WIDTH * 0.6} ${MARGIN.top + 20})`}>
+        <rect x="-10" y="-16" width="200" height={spec.annotations.length * 20 + 12} rx="4" fill="#f5deb3" opacity="0.5" />
+        {spec.annotations.map((line, i) => (
+          <text key={line} y={i * 20}>{line}</text>
+        ))}
+      </g>
+      {spec.note && (
+        <text x={WIDTH / 2} y={HEIGHT - 8} textAnchor="middle" fontSize="10" fontStyle="italic" fill="#666">{spec.note}</text>
+      )}
+    </Frame>
+  )
+}
+
+function Legend({ series }) {
+  return (
+    <g fontSize="11">
+      {series.map((s, i) => (
+        <g key={s.name} transform={`translate(${WIDTH - MARGIN.right - 130} ${MARGIN.top + i * 18})`}>
+          <rect width="12" height="12" fill={s.color} opacity="0.85" />
+          <text x="18" y="10">{s.name}</text>
+        </g>
+      ))}
+    </g>
+  )
+}
+
+// One group of bars per category, one bar per cohort
+function GroupedBarChart({ spec }) {
+  const plotBottom = HEIGHT - MARGIN.bottom
+  const ticks = niceTicks(Math.max(...spec.series.flatMap(s => s.values)) * 1.15)
+  const top = ticks[ticks.length - 1]
+  const y = (v) => plotBottom - (v / top) * (plotBottom - MARGIN.top)
+  const band = (WIDTH - MARGIN.left - MARGIN.right) / spec.categories.length
+  const barWidth = (band * 0.8) / spec.series.length
+  const suffix = spec.value_suffix || ''
+
+  return (
+    <Frame spec={spec}>
+      <ValueAxis ticks={ticks} scale={y} label={spec.y_label} />
+      {spec.categories.map((category, i) => {
+        const x0 = MARGIN.left + band * i + band * 0.1
+        return (
+          <g key={category}>
+            {spec.series.map((series, j) => {
+              const value = series.values[i]
+              return (
+                <rect key={series.name} x={x0 + barWidth * j} y={y(value)} width={barWidth} height={plotBottom - y(value)} fill={series.color} opacity="0.85">
+                  <title>{`${series.name}: ${formatNumber(value)}${suffix}`}</title>
+                </rect>
+              )
+            })}
+            <text x={x0 + band * 0.4} y={plotBottom + 16} textAnchor="middle" fontSize="12">{category}</text>
+          </g>
+        )
+      })}
+      <Legend series={spec.series} />
+    </Frame>
+  )
+}
+
+// Side-by-side box plots, one per cohort
+function GroupedBoxChart({ spec }) {
+  const plotBottom = HEIGHT - MARGIN.bottom
+  const values = spec.boxes.flatMap(b => [b.box.whislo, b.box.whishi, ...b.fliers])
+  const low = Math.min(0, ...values)
+  const ticks = niceTicks(Math.max(...values) * 1.05)
+  const top = ticks[ticks.length - 1]
+  const y = (v) => plotBottom - ((v - low) / (top - low)) * (plotBottom - MARGIN.top)
+  const band = (WIDTH - MARGIN.left - MARGIN.right) / spec.boxes.length
+  const halfWidth = Math.min(40, band * 0.3)
+
+  return (
+    <Frame spec={spec}>
+      <ValueAxis ticks={ticks.filter(t => t >= low)} scale={y} label={spec.y_label} />
+      {spec.boxes.map((box, i) => {
+        const { whislo, q1, med, q3, whishi } = box.box
+        const cx = MARGIN.left + band * (i + 0.5)
+        return (
+          <g key={box.label}>
+            <line x1={cx} x2={cx} y1={y(whislo)} y2={y(q1)} stroke="#333" />
+            <line x1={cx} x2={cx} y1={y(q3)} y2={y(whishi)} stroke="#333" />
+            <line x1={cx - halfWidth / 2} x2={cx + halfWidth / 2} y1={y(whislo)} y2={y(whislo)} stroke="#333" />
+            <line x1={cx - halfWidth / 2} x2={cx + halfWidth / 2} y1={y(whishi)} y2={y(whishi)} stroke="#333" />
+            <rect x={cx - halfWidth} y={y(q3)} width={halfWidth * 2} height={y(q1) - y(q3)} fill={box.color} opacity="0.8" stroke="#333">
+              <title>{`${box.label} · Q1: ${formatNumber(q1)} · Median: ${formatNumber(med)} · Q3: ${formatNumber(q3)}`}</title>
+            </rect>
+            <line x1={cx - halfWidth} x2={cx + halfWidth} y1={y(med)} y2={y(med)} stroke="#ff6600" strokeWidth="2" />
+            {box.fliers.map((v, j) => (
+              <circle key={j} cx={cx} cy={y(v)} r="3" fill="none" stroke="#e24a4a" opacity="0.5" />
+            ))}
+            <text x={cx} y={plotBottom + 16} textAnchor="middle" fontSize="12">{box.label}</text>
+          </g>
+        )
+      })}
+    </Frame>
+  )
+}
+
+const RENDERERS = {
+  stacked_bar: StackedBarChart,
+  pie: PieChart,
+  hbar: HorizontalBarChart,
+  bar: BarChart,
+  box: BoxChart,
+  grouped_bar: GroupedBarChart,
+  grouped_box: GroupedBoxChart
+}
+
+function ChartSpec({ spec }) {
+  const Renderer = spec && RENDERERS[spec.type]
+  if (!Renderer) return null
+  return <Renderer spec={spec} />
+}
+
+export default ChartSpec
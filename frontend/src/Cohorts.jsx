@@ -1,25 +1,80 @@
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useRef } from 'react'
 import './Cohorts.css'
 import axios from "axios"
+import ChartSpec from './ChartSpec'
 
 // Configuration for charts - ADDED NEW CHART
+// key: field of the analysis response holding the chart
 const CHART_OPTIONS = [
   { id: 'all', label: 'Show All Charts' },
-  { id: 'mortality', label: 'Mortality Status Across Time Frames' },
-  { id: 'walking', label: 'Walking Ability After 120 Days' },
-  { id: 'fracture', label: 'Fracture Classification' },
-  { id: 'residence', label: 'Pre-Admission Residence Status' },
-  { id: 'transition', label: 'Residence Transitions: Admissions to Discharge' },
-  { id: 'timelines', label: 'Average Length of Stay' },
-  { id: 'surgery', label: 'Time to Surgery Distribution' },
-  { id: 'age', label: 'Patient Age Distribution' } // Added
+  { id: 'mortality', label: 'Mortality Status Across Time Frames', key: 'mortality_chart' },
+  { id: 'walking', label: 'Walking Ability After 120 Days', key: 'fwalk2_chart' },
+  { id: 'fracture', label: 'Fracture Classification', key: 'afracture_chart' },
+  { id: 'residence', label: 'Pre-Admission Residence Status', key: 'residence_chart' },
+  { id: 'transition', label: 'Residence Transitions: Admissions to Discharge', key: 'residence_transition_chart' },
+  { id: 'timelines', label: 'Average Length of Stay', key: 'timelines_chart' },
+  { id: 'surgery', label: 'Time to Surgery Distribution', key: 'time_to_surgery_chart' },
+  { id: 'age', label: 'Patient Age Distribution', key: 'age_chart' } // Added
 ]
 
+// How often a running analysis job is polled
+const JOB_POLL_MS = 300
+
+// Runs an analysis as a background job and polls it until it finishes.
+// onUpdate receives the partial results while the job runs: the statistics
+// first, then the charts as they are rendered.
+// Finished results are always read from the job URL: the server sends them
+// with an ETag, so the browser cache revalidates an analysis it has already
+// downloaded (304) instead of transferring it again. Responses are gzip or
+// brotli compressed by the server; the browser decodes them.
+const runAnalysisJob = async (cohortId, charts, onUpdate) => {
+  const jobUrl = jobId => `http://localhost:5050/api/analysis-jobs/${jobId}`
+  let { data: job } = await axios.post(`http://localhost:5050/api/cohorts/${cohortId}/analyse/jobs?charts=${charts}&results=0`)
+  while (job.status === 'queued' || job.status === 'running') {
+    if (job.results && onUpdate) onUpdate(job.results)
+    await new Promise(resolve => setTimeout(resolve, JOB_POLL_MS))
+    job = (await axios.get(jobUrl(job.job_id))).data
+  }
+  if (job.status === 'failed') {
+    throw new Error(job.error)
+  }
+  if (!job.results) {
+    // Already analysed: fetch (or revalidate) the cached results
+    job = (await axios.get(jobUrl(job.job_id))).data
+  }
+  return job.results
+}
+
+// Combined charts of a cohort comparison, in display order
+const COMPARISON_CHARTS = [
+  'mortality_comparison_chart',
+  'fwalk2_comparison_chart',
+  'afracture_comparison_chart',
+  'residence_comparison_chart',
+  'timelines_comparison_chart',
+  'time_to_surgery_comparison_chart',
+  'age_comparison_chart'
+]
+
+const formatMetric = (value, unit) => {
+  if (value === null || value === undefined) return '–'
+  const text = Number.isInteger(value) ? value.toLocaleString() : value
+  if (!unit) return text
+  return unit === '%' ? `${text}%` : `${text} ${unit}`
+}
+
 function Cohorts() {
   const [savedCohorts, setSavedCohorts] = useState([])
   const [loading, setLoading] = useState(true)
   const [selectedAnalysis, setSelectedAnalysis] = useState(null)
   const [activeChart, setActiveChart] = useState('all') 
+  const [exporting, setExporting] = useState(false)
+  // Cohorts ticked for comparison, and the comparison shown instead of a single analysis
+  const [compareIds, setCompareIds] = useState([])
+  const [comparison, setComparison] = useState(null)
+  const [comparing, setComparing] = useState(false)
+  // Cohort whose analysis is wanted; progress of an earlier one is ignored
+  const requestedCohort = useRef(null)
 
   useEffect(() => {
     loadSavedCohorts()
@@ -51,28 +106,54 @@ function Cohorts() {
     }
   }
 
-  const analyseCohort = async (cohortId, cohortName) => {
+  const toggleCompare = (cohortId) => {
+    setCompareIds(prev => prev.includes(cohortId) ? prev.filter(id => id !== cohortId) : [...prev, cohortId])
+  }
+
+  // All ticked cohorts are analysed together in one request
+  const compareCohorts = async () => {
+    requestedCohort.current = null
     try {
-      const response = await axios.post(`http://localhost:5050/api/cohorts/${cohortId}/analyse`)
-      console.log('Analysis results:', response.data)
-      console.log('Enhanced metrics:', response.data.enhanced_metrics)
-      
-      setActiveChart('all')
+      setComparing(true)
+      const { data } = await axios.post('http://localhost:5050/api/cohorts/compare?charts=spec', { cohort_ids: compareIds })
+      // A cohort opened meanwhile takes precedence
+      if (requestedCohort.current !== null) return
+      setSelectedAnalysis(null)
+      setComparison(data)
+    } catch (err) {
+      console.error('Error comparing cohorts:', err)
+      alert('Failed to compare cohorts')
+    } finally {
+      setComparing(false)
+    }
+  }
+
+  const analyseCohort = async (cohortId, cohortName) => {
+    requestedCohort.current = cohortId
+    setComparison(null)
+    setActiveChart('all')
 
-      // Store all analysis charts in state - ADDED ageImg
+    // Store all analysis chart specs in state
+    const showResults = (results, pending) => {
+      if (requestedCohort.current !== cohortId) return
       setSelectedAnalysis({ 
         id: cohortId, 
         name: cohortName, 
-        mortalityImg: response.data.mortality_chart,
-        fwalk2Img: response.data.fwalk2_chart, 
-        afractureImg: response.data.afracture_chart,
-        residenceImg: response.data.residence_chart,
-        residenceTransitionImg: response.data.residence_transition_chart,
-        timelinesImg: response.data.timelines_chart,
-        timeToSurgeryImg: response.data.time_to_surgery_chart,
-        ageImg: response.data.age_chart,
-        enhancedMetrics: response.data.enhanced_metrics || {}
+        charts: Object.fromEntries(
+          CHART_OPTIONS.filter(option => option.key).map(option => [option.key, results[option.key]])
+        ),
+        pngCharts: null,
+        enhancedMetrics: results.enhanced_metrics || {},
+        pending
       })
+    }
+
+    try {
+      // Charts come back as specs and are drawn in the browser (see ChartSpec)
+      const results = await runAnalysisJob(cohortId, 'spec', partial => showResults(partial, true))
+      console.log('Analysis results:', results)
+      console.log('Enhanced metrics:', results.enhanced_metrics)
+      showResults(results, false)
       
     } catch (err) {
       console.error('Error analysing cohort:', err)
@@ -80,6 +161,32 @@ function Cohorts() {
     }
   }
 
+  // PNG rendering is only requested when a chart is exported; the rendered
+  // set is kept for further exports of the same cohort
+  const exportChart = async (option) => {
+    try {
+      setExporting(true)
+      let pngCharts = selectedAnalysis.pngCharts
+      if (!pngCharts) {
+        pngCharts = await runAnalysisJob(selectedAnalysis.id, 'png')
+        setSelectedAnalysis(prev => prev?.id === selectedAnalysis.id ? { ...prev, pngCharts } : prev)
+      }
+      if (!pngCharts[option.key]) {
+        alert('This chart is not available for export')
+        return
+      }
+      const link = document.createElement('a')
+      link.href = pngCharts[option.key]
+      link.download = `${selectedAnalysis.name} - ${option.label}.png`
+      link.click()
+    } catch (err) {
+      console.error('Error exporting chart:', err)
+      alert('Failed to export chart')
+    } finally {
+      setExporting(false)
+    }
+  }
+
   const getActiveFiltersCount = (filters) => {
     let count = 0
     if (filters.minAge || filters.maxAge) count++
@@ -129,6 +236,14 @@ function Cohorts() {
                   className={`cohort-list-item ${selectedAnalysis?.id === cohort.id ? 'active' : ''}`}
                   onClick={() => analyseCohort(cohort.id, cohort.name)}
                 >
+                  <input
+                    type="checkbox"
+                    className="compare-checkbox"
+                    checked={compareIds.includes(cohort.id)}
+                    onClick={(e) => e.stopPropagation()}
+                    onChange={() => toggleCompare(cohort.id)}
+                    title="Select for comparison"
+                  />
                   <div className="cohort-list-name">{cohort.name}</div>
                   <button 
                     className="delete-btn-small"
@@ -144,13 +259,59 @@ function Cohorts() {
               ))
             )}
           </div>
+          {savedCohorts.length > 1 && (
+            <button
+              className="compare-btn"
+              onClick={compareCohorts}
+              disabled={compareIds.length < 2 || comparing}
+            >
+              {comparing ? 'Comparing...' : `Compare selected (${compareIds.length})`}
+            </button>
+          )}
         </aside>
         <div className="analysis-panel">
           <div className="analysis-panel-header">
             Cohort Outcomes and Information Dashboard
           </div>
-          {!selectedAnalysis ? (
-            <div className="analysis-empty">Select a cohort to analyse</div>
+          {comparison ? (
+            <div className="analysis-content">
+              <div className="analysis-meta">
+                <h3>Cohort Comparison</h3>
+                <table className="breakdown-table comparison-table">
+                  <thead>
+                    <tr>
+                      <th>Metric</th>
+                      {comparison.cohorts.map(cohort => (
+                        <th key={cohort.id}>
+                          <span className="comparison-swatch" style={{ backgroundColor: cohort.color }} />
+                          {cohort.name}
+                        </th>
+                      ))}
+                    </tr>
+                  </thead>
+                  <tbody>
+                    {comparison.metrics.map(metric => (
+                      <tr key={metric.key}>
+                        <td>{metric.label}</td>
+                        {metric.values.map((value, i) => (
+                          <td key={comparison.cohorts[i].id}>{formatMetric(value, metric.unit)}</td>
+                        ))}
+                      </tr>
+                    ))}
+                  </tbody>
+                </table>
+              </div>
+
+              <div className="charts-container">
+                {COMPARISON_CHARTS.filter(key => comparison.charts[key]).map(key => (
+                  <div className="analysis-chart" key={key}>
+                    <ChartSpec spec={comparison.charts[key]} />
+                  </div>
+                ))}
+              </div>
+            </div>
+          ) : !selectedAnalysis ? (
+            <div className="analysis-empty">Select a cohort to analyse, or tick several to compare</div>
           ) : (
             <div className="analysis-content">
               <div className="analysis-meta">
@@ -239,62 +400,23 @@ function Cohorts() {
                 </div>
               </div>
               
-              <div className="charts-container">
-                {/* 1. Mortality Chart */}
-                {shouldShow('mortality') && selectedAnalysis.mortalityImg && (
-                  <div className="analysis-chart">
-                    <img src={selectedAnalysis.mortalityImg} alt={`Mortality Analysis for ${selectedAnalysis.name}`} />
-                  </div>
-                )}
-
-                {/* 2. Walking Ability Chart */}
-                {shouldShow('walking') && selectedAnalysis.fwalk2Img && (
-                  <div className="analysis-chart">
-                    <img src={selectedAnalysis.fwalk2Img} alt={`Walking Ability Analysis for ${selectedAnalysis.name}`} />
-                  </div>
-                )}
-
-                {/* 3. Atypical Fracture Chart */}
-                {shouldShow('fracture') && selectedAnalysis.afractureImg && (
-                  <div className="analysis-chart">
-                    <img src={selectedAnalysis.afractureImg} alt={`Fracture Type Analysis for ${selectedAnalysis.name}`} />
-                  </div>
-                )}
-
-                {/* 4. Residence Chart */}
-                {shouldShow('residence') && selectedAnalysis.residenceImg && (
-                  <div className="analysis-chart">
-                    <img src={selectedAnalysis.residenceImg} alt={`Pre-Admission Residence Analysis for ${selectedAnalysis.name}`} />
-                  </div>
-                )}
-
-                {/* 5. Residence Transition Chart */}
-                {shouldShow('transition') && selectedAnalysis.residenceTransitionImg && (
-                  <div className="analysis-chart">
-                    <img src={selectedAnalysis.residenceTransitionImg} alt={`Residence Transition Analysis for ${selectedAnalysis.name}`} />
-                  </div>
-                )}
-                
-                {/* 6. Length of Stay Chart */}
-                {shouldShow('timelines') && selectedAnalysis.timelinesImg && (
-                  <div className="analysis-chart">
-                    <img src={selectedAnalysis.timelinesImg} alt={`Average Length of Stay for ${selectedAnalysis.name}`} />
-                  </div>
-                )}
-
-                {/* 7. Time to Surgery Chart */}
-                {shouldShow('surgery') && selectedAnalysis.timeToSurgeryImg && (
-                  <div className="analysis-chart">
-                    <img src={selectedAnalysis.timeToSurgeryImg} alt={`Time to Surgery Distribution for ${selectedAnalysis.name}`} />
-                  </div>
-                )}
+              {selectedAnalysis.pending && (
+                <div className="analysis-pending">Rendering charts...</div>
+              )}
 
-                {/* 8. Age Chart (NEW) */}
-                {shouldShow('age') && selectedAnalysis.ageImg && (
-                  <div className="analysis-chart">
-                    <img src={selectedAnalysis.ageImg} alt={`Age Distribution for ${selectedAnalysis.name}`} />
+              <div className="charts-container">
+                {CHART_OPTIONS.filter(option => option.key && shouldShow(option.id) && selectedAnalysis.charts[option.key]).map(option => (
+                  <div className="analysis-chart" key={option.id}>
+                    <ChartSpec spec={selectedAnalysis.charts[option.key]} />
+                    <button
+                      className="chart-export-btn"
+                      onClick={() => exportChart(option)}
+                      disabled={exporting}
+                    >
+                      {exporting ? 'Exporting...' : 'Export PNG'}
+                    </button>
                   </div>
-                )}
+                ))}
               </div>
             </div>
           )}